@@ -0,0 +1,31 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from ...db.mongodb import MongoDB
+from ...services.jobs import ingestion_queue
+
+router = APIRouter()
+
+@router.get("/health")
+async def health():
+    """
+    Liveness of the MongoDB connection and saturation of its connection pool.
+    Returns 503 when MongoDB cannot be reached.
+    """
+    pool = MongoDB.pool_monitor.stats()
+    body = {
+        "status": "ok",
+        "mongodb": {"connected": False, "pool": pool},
+        "ingestion": ingestion_queue.stats()
+    }
+    try:
+        body["mongodb"]["ping_ms"] = round(await MongoDB.ping(), 2)
+        body["mongodb"]["connected"] = True
+    except Exception as e:
+        body["status"] = "unavailable"
+        body["mongodb"]["error"] = str(e)
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+
+    # Nearly every connection is in use: further requests will queue for one
+    if pool["saturation"] >= 0.9:
+        body["status"] = "degraded"
+    return body
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, status
+from ...services.jobs import ingestion_queue
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status and per-stage progress of a background ingestion job
+    """
+    job = await ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    job.pop("lease_until", None)
+    return job
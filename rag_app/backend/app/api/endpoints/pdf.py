@@ -1,63 +1,159 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Response, status
+from typing import List, Optional, Tuple
 from ...db.mongodb import MongoDB
-import cloudinary.uploader
 from ...config import settings
 from ...schemas.models import PDFMetadata 
+from ...services.ingestion import delete_ingested_pdf, artifact_id
+from ...services.jobs import ingestion_queue
+from ...utils.executors import run_in_thread
+from ...utils.embedding_store import embedding_store
+from ...utils.pdf_cache import pdf_cache
+from ...utils.storage import storage
+from ...utils.answer_cache import answer_cache
+from ...utils.metrics import BYTES_UPLOADED, track_stage
+from ...utils.pagination import NEWEST_FIRST, SKIP_UNSUPPORTED, keyset_filter, next_cursor
+import hashlib
 import logging
+import os
 from datetime import datetime
 from bson import ObjectId
 
 router = APIRouter()
 
+# Every PDF starts with this header (within its first 1024 bytes)
+PDF_MAGIC = b"%PDF-"
+
+
+async def _spool_upload(file: UploadFile, path: str) -> Tuple[str, int]:
+    """Copy an upload to path in fixed-size chunks, hashing and size-checking it
+    on the way; returns (sha256, size). Only one chunk is held in memory."""
+    if file.size is not None and file.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"PDF exceeds the {settings.MAX_UPLOAD_BYTES} byte limit"
+        )
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            part = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            if not part:
+                break
+            if size == 0 and PDF_MAGIC not in part[:1024]:
+                # The header must appear in the first 1024 bytes; stop before reading the rest
+                raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
+            size += len(part)
+            if size > settings.MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"PDF exceeds the {settings.MAX_UPLOAD_BYTES} byte limit"
+                )
+            digest.update(part)
+            await run_in_thread(f.write, part)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="The uploaded file is empty.")
+    return digest.hexdigest(), size
+
+
 @router.post("/upload_pdf")
 async def upload_pdf(file: UploadFile = File(...)):
+    spool_path = pdf_cache.part_path()
     try:
         logging.info(f"Received file: {file.filename}")
 
         # Check if the file is a PDF
-        if not file.filename.endswith(".pdf"):
+        if not file.filename.lower().endswith(".pdf"):
             logging.error(f"Invalid file type: {file.filename} is not a PDF.")
             raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
 
-        # Step 1: Upload PDF file to Cloudinary
-        try:
-            logging.info("Uploading file to Cloudinary...")
-            contents = await file.read()  # Read the file contents
-            upload_result = cloudinary.uploader.upload(
-                contents,
-                resource_type="raw"
-            )
-            logging.info(f"File uploaded to Cloudinary: {upload_result}")
-        except Exception as upload_error:
-            logging.error(f"Cloudinary upload failed: {upload_error}")
-            raise HTTPException(status_code=500, detail="Error uploading file to Cloudinary.")
-
-        # Step 2: Prepare metadata
-        cloudinary_data = {
-            'filename': file.filename,
-            'cloudinary_url': upload_result['secure_url'],
-            'cloudinary_public_id': upload_result['public_id'],
-            'file_size': upload_result['bytes'],
-            'created_at': datetime.strptime(upload_result['created_at'], "%Y-%m-%dT%H:%M:%SZ"),
-            'format': upload_result.get('format', file.filename.split('.')[-1])
+        # Step 1: Spool the upload to disk, hashing it as it comes in
+        with track_stage("receive_upload"):
+            content_hash, size = await _spool_upload(file, spool_path)
+        BYTES_UPLOADED.inc(size)
+
+        # Step 2: Reuse the stored file and its artifacts if this content was uploaded before
+        pdf_oid = ObjectId()
+        blob = await MongoDB.acquire_blob(content_hash, str(pdf_oid))
+        if blob is None:
+            try:
+                logging.info(f"Uploading file to {storage.name} storage...")
+                with track_stage("storage_upload"):
+                    stored = await run_in_thread(storage.upload, spool_path)
+                logging.info(f"File stored as {stored['public_id']}")
+            except Exception as upload_error:
+                logging.error(f"Storage upload failed: {upload_error}")
+                raise HTTPException(status_code=500, detail="Error uploading file to storage.")
+
+            cloudinary_data = {
+                'filename': file.filename,
+                'cloudinary_url': stored['url'],
+                'cloudinary_public_id': stored['public_id'],
+                'file_size': stored['bytes'],
+                'created_at': stored['created_at'],
+                'format': stored['format']
+            }
+            if not await MongoDB.create_blob(content_hash, str(pdf_oid), str(pdf_oid), cloudinary_data):
+                # The same file was uploaded concurrently; share that copy instead
+                blob = await MongoDB.acquire_blob(content_hash, str(pdf_oid))
+                if blob is not None:
+                    await run_in_thread(storage.destroy, cloudinary_data['cloudinary_public_id'])
+                else:
+                    # Its last reference is being deleted right now: keep this copy unshared
+                    content_hash = None
+
+        if blob is not None:
+            cloudinary_data = {
+                'filename': file.filename,
+                'cloudinary_url': blob['cloudinary_url'],
+                'cloudinary_public_id': blob['cloudinary_public_id'],
+                'file_size': blob['file_size'],
+                'created_at': datetime.utcnow(),
+                'format': blob['format']
+            }
+        extra = {
+            "_id": pdf_oid,
+            "artifact_id": blob['artifact_id'] if blob is not None else str(pdf_oid),
+            "content_hash": content_hash
         }
 
         # Step 3: Store metadata in MongoDB
         try:
             logging.info("Saving metadata to MongoDB...")
-            pdf_id = await MongoDB.save_pdf_metadata(file.filename, cloudinary_data)
+            with track_stage("save_metadata"):
+                pdf_id = await MongoDB.save_pdf_metadata(file.filename, cloudinary_data, extra)
             logging.info(f"PDF metadata saved with ID: {pdf_id}")
         except Exception as db_error:
             logging.error(f"Error saving metadata to MongoDB: {db_error}")
+            if content_hash is not None:
+                await MongoDB.release_blob(content_hash, str(pdf_oid))
             raise HTTPException(status_code=500, detail=str(db_error))
 
-        # Step 4: Prepare and return response
+        # Step 4: Move the spooled copy into the local cache so the ingestion job never re-downloads it
+        try:
+            if pdf_cache.get_path(cloudinary_data['cloudinary_public_id']) is None:
+                await run_in_thread(pdf_cache.put_file, cloudinary_data['cloudinary_public_id'], spool_path)
+        except Exception as cache_error:
+            logging.error(f"Failed to cache PDF {pdf_id} locally: {cache_error}")
+
+        # Step 5: Extract, chunk and embed in the background unless the artifacts
+        # already exist or are being built; poll the job for progress
+        artifact = extra["artifact_id"]
+        job_id = None
+        if not await run_in_thread(embedding_store.exists, artifact):
+            active_job = await ingestion_queue.find_active(artifact)
+            job_id = active_job["id"] if active_job is not None else await ingestion_queue.submit(artifact)
+            logging.info(f"Ingestion job {job_id} covers PDF {pdf_id}")
+
+        # Step 6: Prepare and return response
         return {
             "status": "success",
             "message": f"PDF '{file.filename}' uploaded successfully.",
             "data": {
                 "pdf_id": pdf_id,
+                "deduplicated": blob is not None,
+                "job_id": job_id,
+                "job_status_url": f"/api/v1/jobs/{job_id}" if job_id is not None else None,
                 "pdf_metadata": {
                     "id": pdf_id,
                     "filename": file.filename,
@@ -75,23 +171,60 @@ async def upload_pdf(file: UploadFile = File(...)):
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
 
 
 
+def _check_limit(name: str, value: int, maximum: int):
+    if value < 1 or value > maximum:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} must be between 1 and {maximum}"
+        )
+
+
+def _cursor_filter(cursor: Optional[str], skip: Optional[int] = None) -> dict:
+    if skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=SKIP_UNSUPPORTED
+        )
+    try:
+        return keyset_filter(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/pdfs", response_model=List[PDFMetadata])
-async def list_pdfs(skip: int = 0, limit: int = 10):
+async def list_pdfs(
+    response: Response,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    skip: Optional[int] = None
+):
     """
-    Retrieve list of uploaded PDFs with pagination
+    Retrieve list of uploaded PDFs, newest first. Pass the X-Next-Cursor
+    header of a page as `cursor` to get the next one.
     """
-    
+    _check_limit("limit", limit, 100)
+    keyset = _cursor_filter(cursor, skip)
+
     try:
-        # Retrieve PDFs from MongoDB with pagination and sort by created_at
-        pdfs = await MongoDB.db.pdfs.find() \
-            .sort("created_at", -1) \
-            .skip(skip) \
+        # Keyset pagination on (created_at, _id) stays an index seek however deep you page
+        pdfs = await MongoDB.db.pdfs.find(keyset) \
+            .sort(NEWEST_FIRST) \
             .limit(limit) \
-            .to_list(length=None)
-        
+            .to_list(length=limit)
+
+        cursor_after = next_cursor(pdfs, limit)
+        if cursor_after:
+            response.headers["X-Next-Cursor"] = cursor_after
+
         # Prepare and return response
         return [
             {**pdf, 'id': str(pdf.pop('_id'))}
@@ -99,7 +232,7 @@ async def list_pdfs(skip: int = 0, limit: int = 10):
         ]
         
     except Exception as e:
-        print(f"Error retrieving PDFs: {str(e)}", exc_info=True)
+        logging.error(f"Error retrieving PDFs: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error retrieving PDF list"
@@ -109,7 +242,9 @@ async def list_pdfs(skip: int = 0, limit: int = 10):
 @router.delete("/pdfs/{pdf_id}")
 async def delete_pdf(pdf_id: str):
     """
-    Delete PDF and associated queries from both Cloudinary and MongoDB.
+    Delete PDF and associated queries from both storage and MongoDB.
+    The stored file and derived artifacts are shared by uploads of the same
+    content and are only removed with the last PDF that references them.
     """
     try:
         # Step 1: Validate ObjectId format
@@ -119,38 +254,44 @@ async def delete_pdf(pdf_id: str):
                 detail="Invalid PDF ID format"
             )
 
-        # Step 2: Get PDF metadata from MongoDB
-        pdf = await MongoDB.db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+        # Step 2: Claim the PDF document by deleting it first, so a concurrent or
+        # retried delete gets a 404 instead of releasing its references again
+        pdf = await MongoDB.db.pdfs.find_one_and_delete({"_id": ObjectId(pdf_id)})
         if not pdf:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="PDF not found"
             )
             
-        # Step 3: Delete from Cloudinary
-        cloudinary_result = cloudinary.uploader.destroy(pdf['cloudinary_public_id'])
-        if cloudinary_result.get('result') == 'not found':
-            print(f"PDF already deleted from Cloudinary")
-        elif cloudinary_result.get('result') != 'ok':
-            print(f"Failed to delete from Cloudinary: {cloudinary_result}")
-            raise Exception("Failed to delete from Cloudinary")
+        # Step 3: Drop this PDF's reference to the stored file; delete the file from
+        # storage only if it was the last one
+        last_reference = True
+        if pdf.get('content_hash'):
+            last_reference = await MongoDB.release_blob(pdf['content_hash'], pdf_id) == 0
+        if last_reference:
+            if not await run_in_thread(storage.destroy, pdf['cloudinary_public_id']):
+                print(f"PDF already deleted from storage")
 
         # Step 4: Delete associated queries from MongoDB
         query_result = await MongoDB.db.queries.delete_many({
             "pdf_id": pdf_id
         })
         
-        # Step 5: Delete the PDF document itself from MongoDB
-        pdf_result = await MongoDB.db.pdfs.delete_one({
-            "_id": ObjectId(pdf_id)
-        })
-        if pdf_result.deleted_count == 0:
-            raise Exception("Failed to delete PDF from MongoDB")
-        
+        # Step 5: With the last reference gone, stop any ingestion still running, then drop
+        # extracted pages, stored chunks, embeddings and the cached file
+        if last_reference:
+            artifact = artifact_id(pdf)
+            await ingestion_queue.cancel_for_pdf(artifact)
+            await run_in_thread(delete_ingested_pdf, artifact)
+            await run_in_thread(pdf_cache.invalidate, pdf['cloudinary_public_id'])
+            await MongoDB.delete_pdf_pages(artifact)
+        answer_cache.invalidate_pdf(pdf_id)
+
         return {
             "status": "success",
             "message": "PDF and associated queries deleted successfully",
             "pdf_id": pdf_id,
+            "shared_artifacts_deleted": last_reference,
             "deleted_queries_count": query_result.deleted_count
         }
         
@@ -166,31 +307,51 @@ async def delete_pdf(pdf_id: str):
         )
 
 @router.get("/pdfs_with_queries", response_model=List[dict])
-async def list_pdfs_with_queries(skip: int = 0, limit: int = 10):
+async def list_pdfs_with_queries(
+    response: Response,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    queries_limit: int = 20,
+    skip: Optional[int] = None
+):
     """
-    Retrieve a list of PDFs along with their query histories, with pagination.
+    Retrieve a page of PDFs, newest first, each with its most recent queries
+    (at most queries_limit). Pass the X-Next-Cursor header as `cursor` for the
+    next page.
     """
+    _check_limit("limit", limit, 100)
+    _check_limit("queries_limit", queries_limit, 100)
+    keyset = _cursor_filter(cursor, skip)
 
     try:
-        # Retrieve PDFs from MongoDB with pagination and sort by created_at
-        pdfs = await MongoDB.db.pdfs.find() \
-            .sort("created_at", -1) \
-            .skip(skip) \
-            .limit(limit) \
-            .to_list(length=None)
-        
-        # For each PDF, fetch its query history
-        pdfs_with_queries = []
-        for pdf in pdfs:
-            pdf_id = str(pdf["_id"])
-            # Retrieve queries associated with the current PDF
-            queries = await MongoDB.db.queries.find(
-                {"pdf_id": pdf_id}
-            ).sort("created_at", -1).to_list(length=None)
-
-            # Format the PDF and its associated queries
-            pdf_data = {
-                "id": pdf_id,
+        # One aggregation instead of a queries.find per PDF; the $lookup
+        # sub-pipeline uses the (pdf_id, created_at) index and stops at queries_limit
+        pipeline = [
+            {"$match": keyset},
+            {"$sort": dict(NEWEST_FIRST)},
+            {"$limit": limit},
+            {"$project": {"filename": 1, "created_at": 1}},
+            {"$lookup": {
+                "from": "queries",
+                "let": {"pdf_id": {"$toString": "$_id"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$pdf_id", "$$pdf_id"]}}},
+                    {"$sort": {"created_at": -1}},
+                    {"$limit": queries_limit},
+                    {"$project": {"query": 1, "response": 1, "created_at": 1}}
+                ],
+                "as": "queries"
+            }}
+        ]
+        pdfs = await MongoDB.db.pdfs.aggregate(pipeline).to_list(length=limit)
+
+        cursor_after = next_cursor(pdfs, limit)
+        if cursor_after:
+            response.headers["X-Next-Cursor"] = cursor_after
+
+        return [
+            {
+                "id": str(pdf["_id"]),
                 "title": pdf.get("filename"),
                 "created_at": pdf.get("created_at"),
                 "queries": [
@@ -200,12 +361,11 @@ async def list_pdfs_with_queries(skip: int = 0, limit: int = 10):
                         "response": query["response"],
                         "created_at": query["created_at"]
                     }
-                    for query in queries
+                    for query in pdf["queries"]
                 ]
             }
-            pdfs_with_queries.append(pdf_data)
-
-        return pdfs_with_queries
+            for pdf in pdfs
+        ]
 
     except HTTPException as http_error:
         print("HTTP Exception occurred:", http_error.detail)
@@ -216,4 +376,4 @@ async def list_pdfs_with_queries(skip: int = 0, limit: int = 10):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error retrieving PDFs with query history"
-        )
\ No newline at end of file
+        )
@@ -1,123 +1,348 @@
-import requests
-from fastapi import APIRouter, HTTPException, status
-from ...schemas.models import QueryRequest, QueryResponse
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from ...schemas.models import (
+    QueryRequest, QueryResponse, MultiQueryRequest, MultiQueryResponse,
+    BatchQueryRequest, BatchQueryResponse
+)
+from ...config import settings
 from ...db.mongodb import MongoDB
 from ...utils.pdf_processor import pdf_processor
+from ...utils.executors import run_in_thread
+from ...services.vector_search import VectorSearch
+from ...services.query_service import (
+    get_pdf_or_404, retrieve_sources_batch, build_context, save_queries, artifacts_of, pdfs_of
+)
+from ...services.rag_service import rag_service
+from ...utils.answer_cache import answer_cache
+from ...utils.pagination import NEWEST_FIRST, SKIP_UNSUPPORTED, keyset_filter, next_cursor
 import cloudinary.api
 from datetime import datetime
 from bson import ObjectId
 from cloudinary.exceptions import NotFound
-from typing import List
+from typing import Dict, List, Optional
+import numpy as np
 
 router = APIRouter()
+
+
 @router.post("/query", response_model=QueryResponse)
 async def query_pdf(request: QueryRequest):
     try:
-        # Convert pdf_id to ObjectId if necessary
+        return await rag_service.get_response(request.pdf_id, request.query)
+
+    except HTTPException as http_error:
+        print("HTTP Exception occurred:", http_error.detail)
+        raise http_error
+    
+    except Exception as e:
+        print("Unexpected error occurred:", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing query: {str(e)}"
+        )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/query/stream")
+async def query_pdf_stream(request: QueryRequest):
+    """
+    Same as /query, but the answer is streamed as Server-Sent Events:
+    a `sources` event, one `token` event per model increment, then `done`
+    (or `error`). The full answer is saved to the history once the stream ends.
+    """
+    # Validation and retrieval errors are still reported as regular HTTP errors
+    try:
+        prepared = await rag_service.prepare(request.pdf_id, request.query)
+    except HTTPException as http_error:
+        print("HTTP Exception occurred:", http_error.detail)
+        raise http_error
+    except Exception as e:
+        print("Unexpected error occurred:", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing query: {str(e)}"
+        )
+
+    async def event_stream():
+        yield _sse_event("sources", {"sources": prepared.sources})
         try:
-            pdf_id = ObjectId(request.pdf_id)
+            async for text in rag_service.stream_response(prepared):
+                yield _sse_event("token", {"text": text})
+            yield _sse_event("done", {**prepared.query_doc, "cached": prepared.cached is not None})
         except Exception as e:
-            print(f"Invalid pdf_id format: {request.pdf_id}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid PDF ID format"
-            )
+            print("Error while streaming response:", str(e))
+            yield _sse_event("error", {"detail": str(e)})
 
-        # Validate PDF exists with ID
-        pdf = await MongoDB.db.pdfs.find_one({"_id": pdf_id})
-        if not pdf:
-            print(f"PDF with ID {request.pdf_id} not found in MongoDB.")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="PDF not found"
-            )
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        # Download PDF from Cloudinary using requests
-        try:
-            pdf_content_response = requests.get(
-                pdf['cloudinary_url'], 
-                stream=True
-            )
-            if pdf_content_response.status_code != 200:
-                print(f"Failed to download PDF from Cloudinary. Status Code: {pdf_content_response.status_code}")
+
+@router.post("/query/multi", response_model=MultiQueryResponse)
+async def query_multiple_pdfs(request: MultiQueryRequest):
+    """
+    Answer a question from the most relevant chunks across all stored PDFs,
+    or across the subset given in pdf_ids.
+    """
+    try:
+        if request.pdf_ids is not None:
+            invalid_ids = [pdf_id for pdf_id in request.pdf_ids if not ObjectId.is_valid(pdf_id)]
+            if invalid_ids:
                 raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Cloudinary resource not found"
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid PDF ID format: {', '.join(invalid_ids)}"
                 )
-            pdf_content = pdf_content_response.content
-        except Exception as download_error:
-            print(f"Error downloading PDF: {download_error}")
+
+        if request.top_k < 1 or request.top_k > 50:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error downloading PDF from Cloudinary"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="top_k must be between 1 and 50"
             )
 
-        # Extracting text from PDF
-        pdf_text = await pdf_processor.extract_text_from_pdf(pdf_content)
+        # Vectors are stored once per distinct file, under its artifact id
+        pdf_by_artifact = await artifacts_of(request.pdf_ids) if request.pdf_ids is not None else None
 
-        # Create chunks from extracted text
-        chunks = pdf_processor.create_chunks(pdf_text)
-        print(f"Total chunks created: {len(chunks)}")
-
-        # Find relevant chunks
-        relevant_chunks = await pdf_processor.find_relevant_chunks(
-            request.query,
-            chunks
+        # Search the shared index instead of scanning every PDF's chunks
+        query_embedding = await pdf_processor.get_query_embedding(request.query)
+        sources = await run_in_thread(
+            VectorSearch.search,
+            query_embedding,
+            top_k=pdf_processor.candidate_count(request.top_k),
+            pdf_ids=list(pdf_by_artifact) if pdf_by_artifact is not None else None
         )
+        if pdf_by_artifact is None:
+            pdf_by_artifact = await pdfs_of(list({source["pdf_id"] for source in sources}))
+        # Report the PDF, not the artifact; skip vectors whose PDFs are all gone
+        sources = [
+            {**source, "pdf_id": pdf_by_artifact[source["pdf_id"]]}
+            for source in sources if source["pdf_id"] in pdf_by_artifact
+        ]
+        sources = (await pdf_processor.rerank_sources([request.query], [sources], request.top_k))[0]
 
-        # Generate response
         response_text = await pdf_processor.generate_response(
             request.query,
-            relevant_chunks
+            build_context(sources, request.query)
         )
 
-        # Save query and response to MongoDB
-        query_doc = {
-            "pdf_id": request.pdf_id,
+        return {
             "query": request.query,
             "response": response_text,
+            "sources": sources,
             "created_at": datetime.utcnow()
         }
-        result = await MongoDB.db.queries.insert_one(query_doc)
+
+    except HTTPException as http_error:
+        print("HTTP Exception occurred:", http_error.detail)
+        raise http_error
+
+    except Exception as e:
+        print("Unexpected error occurred:", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing multi-document query: {str(e)}"
+        )
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_pdf_batch(request: BatchQueryRequest):
+    """
+    Answer many (pdf_id, query) pairs in one request. Questions are embedded in
+    one batched call, each PDF's chunks are loaded once and scored against all
+    of its questions together, answers are generated with bounded concurrency
+    and the history is written with a single insert_many. Failures are reported
+    per item instead of failing the whole batch.
+    """
+    if not request.items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="items must not be empty"
+        )
+    if len(request.items) > settings.BATCH_QUERY_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_QUERY_MAX_ITEMS} items are allowed per batch"
+        )
+    if request.top_k < 1 or request.top_k > 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="top_k must be between 1 and 50"
+        )
+
+    try:
+        results = [
+            {"index": i, "pdf_id": item.pdf_id, "query": item.query}
+            for i, item in enumerate(request.items)
+        ]
+
+        def fail(i: int, status_code: int, detail: str):
+            results[i].update({"error": detail, "status_code": status_code})
+
+        # Step 1: Group items by PDF and fetch all PDFs in one round trip
+        groups: Dict[str, List[int]] = {}
+        for i, item in enumerate(request.items):
+            if ObjectId.is_valid(item.pdf_id):
+                groups.setdefault(item.pdf_id, []).append(i)
+            else:
+                fail(i, status.HTTP_400_BAD_REQUEST, "Invalid PDF ID format")
+        pdfs = await MongoDB.db.pdfs.find(
+            {"_id": {"$in": [ObjectId(pdf_id) for pdf_id in groups]}}
+        ).to_list(length=None)
+        pdfs_by_id = {str(pdf["_id"]): pdf for pdf in pdfs}
+        for pdf_id in list(groups):
+            if pdf_id not in pdfs_by_id:
+                for i in groups.pop(pdf_id):
+                    fail(i, status.HTTP_404_NOT_FOUND, "PDF not found")
+
+        # Step 2: Exact answer-cache hits need no embedding at all
+        pending = []
+        for indices in groups.values():
+            for i in indices:
+                cached = answer_cache.get_exact(results[i]["pdf_id"], results[i]["query"])
+                if cached is not None:
+                    results[i].update({"response": cached.response, "sources": cached.sources, "cached": True})
+                else:
+                    pending.append(i)
+
+        # Step 3: Embed every remaining question in one batched encoder call
+        query_embeddings = {}
+        if pending:
+            embeddings = await pdf_processor.get_query_embeddings([results[i]["query"] for i in pending])
+            query_embeddings = dict(zip(pending, embeddings))
+        to_retrieve: Dict[str, List[int]] = {}
+        for i in pending:
+            cached = answer_cache.get_similar(results[i]["pdf_id"], results[i]["query"], query_embeddings[i])
+            if cached is not None:
+                results[i].update({"response": cached.response, "sources": cached.sources, "cached": True})
+            else:
+                to_retrieve.setdefault(results[i]["pdf_id"], []).append(i)
+
+        # Step 4: Score each PDF's questions against its chunks in one matrix product
+        async def retrieve(pdf_id: str, indices: List[int]):
+            try:
+                sources = await retrieve_sources_batch(
+                    pdfs_by_id[pdf_id],
+                    np.stack([query_embeddings[i] for i in indices]),
+                    request.top_k,
+                    [results[i]["query"] for i in indices]
+                )
+                for i, item_sources in zip(indices, sources):
+                    results[i]["sources"] = item_sources
+            except HTTPException as http_error:
+                for i in indices:
+                    fail(i, http_error.status_code, http_error.detail)
+            except Exception as e:
+                print(f"Error retrieving chunks for PDF {pdf_id}: {e}")
+                for i in indices:
+                    fail(i, status.HTTP_500_INTERNAL_SERVER_ERROR, f"Error retrieving chunks: {str(e)}")
+
+        await asyncio.gather(*(retrieve(pdf_id, indices) for pdf_id, indices in to_retrieve.items()))
+
+        # Step 5: Generate answers with bounded concurrency
+        semaphore = asyncio.Semaphore(settings.BATCH_GENERATION_CONCURRENCY)
+
+        async def generate(i: int):
+            result = results[i]
+            async with semaphore:
+                try:
+                    response_text = await pdf_processor.generate_response(
+                        result["query"],
+                        build_context(result["sources"], result["query"])
+                    )
+                except Exception as e:
+                    print(f"Error generating answer for batch item {i}: {e}")
+                    fail(i, status.HTTP_502_BAD_GATEWAY, str(e))
+                    return
+            result.update({"response": response_text, "cached": False})
+            answer_cache.put(result["pdf_id"], result["query"], response_text, result["sources"], query_embeddings[i])
+
+        await asyncio.gather(*(
+            generate(i) for indices in to_retrieve.values() for i in indices
+            if "error" not in results[i]
+        ))
+
+        # Step 6: Save every answered query with a single insert_many
+        answered = [result for result in results if "response" in result and "error" not in result]
+        query_docs = await save_queries([
+            (result["pdf_id"], result["query"], result["response"]) for result in answered
+        ])
+        for result, query_doc in zip(answered, query_docs):
+            result.update({"id": query_doc["id"], "created_at": query_doc["created_at"]})
 
         return {
-            "id": str(result.inserted_id),
-            "pdf_id": request.pdf_id,
-            "query": request.query,
-            "response": response_text,
-            "created_at": query_doc["created_at"]
+            "results": results,
+            "succeeded": len(answered),
+            "failed": len(results) - len(answered)
         }
 
     except HTTPException as http_error:
         print("HTTP Exception occurred:", http_error.detail)
         raise http_error
-    
+
     except Exception as e:
         print("Unexpected error occurred:", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing query: {str(e)}"
+            detail=f"Error processing batch query: {str(e)}"
         )
 
 
+@router.get("/cache/stats")
+async def get_answer_cache_stats():
+    """
+    Hit/miss counters and size of this worker's answer cache
+    """
+    return answer_cache.stats()
+
+
 @router.get("/history/{pdf_id}", response_model=List[QueryResponse])
-async def get_query_history(pdf_id: str, skip: int = 0, limit: int = 10):
+async def get_query_history(
+    pdf_id: str,
+    response: Response,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    skip: Optional[int] = None
+):
+    """
+    Query history of a PDF, newest first. Pass the X-Next-Cursor header of a
+    page as `cursor` to get the next one.
+    """
+    if limit < 1 or limit > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be between 1 and 100"
+        )
+    if skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=SKIP_UNSUPPORTED
+        )
+    try:
+        keyset = keyset_filter(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
     try:
         # Validate PDF exists
-        pdf = await MongoDB.db.pdfs.find_one({"_id": ObjectId(pdf_id)})
-        if not pdf:
-            print("PDF not found.")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="PDF not found"
-            )
+        await get_pdf_or_404(pdf_id)
 
-        # Get query history from MongoDB and sort by created_at in descending order
+        # Keyset page served by the (pdf_id, created_at, _id) index
         queries = await MongoDB.db.queries.find(
-            {"pdf_id": pdf_id}
-        ).sort(
-            "created_at", -1
-        ).skip(skip).limit(limit).to_list(length=None)
+            {"pdf_id": pdf_id, **keyset}
+        ).sort(NEWEST_FIRST).limit(limit).to_list(length=limit)
+
+        cursor_after = next_cursor(queries, limit)
+        if cursor_after:
+            response.headers["X-Next-Cursor"] = cursor_after
 
         # Construct the response
         response_data = [
@@ -141,4 +366,4 @@ async def get_query_history(pdf_id: str, skip: int = 0, limit: int = 10):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving query history: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -7,6 +7,15 @@ class Settings(BaseSettings):
     # MongoDB Settings
     MONGODB_URL: str
     DB_NAME: str = "pdf_query_system"
+    MONGODB_MAX_POOL_SIZE: int = 100
+    # Connections kept open while idle, so bursts do not pay for new handshakes
+    MONGODB_MIN_POOL_SIZE: int = 10
+    MONGODB_MAX_IDLE_TIME_MS: int = 300000
+    MONGODB_MAX_CONNECTING: int = 4
+    MONGODB_CONNECT_TIMEOUT_MS: int = 5000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    # How long a request waits for a free pooled connection before failing
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 10000
     
     # Cloudinary Settings
     CLOUDINARY_CLOUD_NAME: str
@@ -19,6 +28,130 @@ class Settings(BaseSettings):
     # OpenAI API Key (not required)
     OPENAI_API_KEY: str
 
+    # LLM Settings ("gemini", "openai" or "stub", a deterministic offline provider).
+    # An empty model name uses the provider's default (gemini-pro / gpt-4o-mini).
+    LLM_PROVIDER: str = "gemini"
+    LLM_MODEL_NAME: str = ""
+    LLM_MAX_CONCURRENCY: int = 8
+    # Request rate kept under the provider quota; 0 disables the limiter
+    LLM_REQUESTS_PER_MINUTE: float = 60.0
+    LLM_BURST: int = 10
+    # Per attempt; for streams, the longest wait for the next piece
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 20.0
+    LLM_STUB_LATENCY_SECONDS: float = 0.0
+
+    # Model Settings
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    # URL of a shared embedding server (app.embedding_server); empty loads the model in-process
+    EMBEDDING_SERVICE_URL: str = ""
+    WARM_UP_MODELS: bool = False
+    # "torch" (sentence-transformers) or "onnx": ONNX Runtime on the int8 model
+    # exported to ONNX_MODEL_DIR (python -m app.utils.onnx_embedder)
+    EMBEDDING_BACKEND: str = "torch"
+    ONNX_MODEL_DIR: str = "data/onnx/all-MiniLM-L6-v2"
+    # 0 uses one thread per physical core
+    ONNX_INTRA_OP_THREADS: int = 0
+    # Cap on padded tokens per ONNX batch; texts are batched by length
+    EMBEDDING_MAX_BATCH_TOKENS: int = 8192
+
+    # Ingestion Settings
+    EMBEDDING_STORE_DIR: str = "data/embeddings"
+    EMBEDDING_BATCH_SIZE: int = 32
+    # Compact copy of stored embeddings scanned first by searches: "none",
+    # "float16", "int8" or "binary". The best EMBEDDING_RESCORE_CANDIDATES rows
+    # of that pass are rescored exactly against the float32 embeddings.
+    EMBEDDING_QUANTIZATION: str = "int8"
+    EMBEDDING_RESCORE_CANDIDATES: int = 200
+    PAGES_PER_EXTRACTION_TASK: int = 16
+
+    # Background Ingestion Settings ("mongo" job store, or "memory" for tests)
+    JOB_STORE_BACKEND: str = "mongo"
+    INGESTION_WORKERS: int = 2
+    INGESTION_MAX_ATTEMPTS: int = 3
+    INGESTION_RETRY_BACKOFF_SECONDS: float = 5.0
+    # A running job's heartbeat renews its lease every third of this; expired leases are resumed
+    INGESTION_LEASE_SECONDS: float = 300.0
+    # Chunks embedded (and reported) per step
+    INGESTION_EMBED_SLICE: int = 256
+
+    # Chunking Settings ("fixed", "recursive" or "semantic"). all-MiniLM-L6-v2
+    # truncates input at 256 tokens including [CLS]/[SEP], so chunks stay below that.
+    CHUNK_STRATEGY: str = "recursive"
+    CHUNK_MAX_TOKENS: int = 240
+    CHUNK_OVERLAP_TOKENS: int = 32
+    SEMANTIC_CHUNK_THRESHOLD: float = 0.6
+
+    # Vector Index Settings ("flat" for exact search, "ivf" for approximate)
+    VECTOR_INDEX_TYPE: str = "flat"
+    VECTOR_INDEX_DIR: str = "data/vector_index"
+    IVF_N_PROBE: int = 8
+    # PDFs whose chunk texts and page ranges cross-document searches keep in memory
+    VECTOR_SEARCH_TEXT_CACHE_PDFS: int = 256
+
+    # Retrieval Settings ("dense" or "hybrid" BM25 + dense with reciprocal rank fusion)
+    RETRIEVAL_MODE: str = "hybrid"
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    RRF_K: int = 60
+    # Depth of each ranking fed into the fusion
+    HYBRID_CANDIDATES: int = 50
+    # PDFs with at least this many chunks only score lexical candidates densely
+    HYBRID_PREFILTER_MIN_CHUNKS: int = 20000
+    HYBRID_PREFILTER_CANDIDATES: int = 1000
+
+    # Reranking Settings. The first stage over-fetches RERANK_CANDIDATES chunks
+    # and a cross-encoder rescores them in one batch. If that takes longer than
+    # RERANK_BUDGET_SECONDS (waiting for the model included) the first-stage
+    # order is kept.
+    RERANK_ENABLED: bool = False
+    RERANKER_MODEL_NAME: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20
+    RERANK_BUDGET_SECONDS: float = 0.5
+    RERANK_MAX_LENGTH: int = 512
+
+    # Prompt Context Settings. Retrieved chunks are merged and deduplicated, then
+    # trimmed to the sentences most relevant to the query if still over budget
+    # (embedding-model tokens, a close proxy for Gemini's; 0 disables trimming)
+    CONTEXT_MAX_TOKENS: int = 600
+
+    # Concurrency Settings
+    THREAD_POOL_WORKERS: int = 8
+    PROCESS_POOL_WORKERS: int = 2
+    HTTP_TIMEOUT_SECONDS: float = 30.0
+    HTTP_MAX_CONNECTIONS: int = 20
+
+    # Local PDF Cache Settings
+    PDF_CACHE_DIR: str = "data/pdf_cache"
+    PDF_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Upload Settings. Uploads are read, hashed and spooled to disk in
+    # UPLOAD_CHUNK_SIZE pieces, then stored in "cloudinary" or, for offline use,
+    # "local" storage (files under LOCAL_STORAGE_DIR)
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_BYTES: int = 200 * 1024 ** 2
+    STORAGE_BACKEND: str = "cloudinary"
+    LOCAL_STORAGE_DIR: str = "data/storage"
+    # Part size of Cloudinary's chunked upload (at least 5 MB)
+    STORAGE_CHUNK_SIZE: int = 20 * 1024 ** 2
+
+    # Answer Cache Settings
+    ANSWER_CACHE_MAX_ENTRIES: int = 2048
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+
+    # Queries with a request_id that one websocket connection may run at once
+    WEBSOCKET_MAX_CONCURRENT_QUERIES: int = 4
+    # Queries one connection may have running or waiting, with or without a request_id
+    WEBSOCKET_MAX_PENDING_QUERIES: int = 32
+
+    # Batch Query Settings
+    BATCH_QUERY_MAX_ITEMS: int = 1000
+    BATCH_GENERATION_CONCURRENCY: int = 8
+
     class Config:
         env_file = ".env"
 
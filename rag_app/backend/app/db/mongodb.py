@@ -1,43 +1,163 @@
 import logging
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.monitoring import ConnectionPoolListener
 from ..config import settings
-import cloudinary
-import cloudinary.uploader
+from bson import ObjectId
+
+
+class PoolMonitor(ConnectionPoolListener):
+    """Counts connection pool events so /health can report saturation.
+    Callbacks run on driver threads, hence the lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.created_total = 0
+        self.closed_total = 0
+        self.checkout_failures = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open_connections=1, created_total=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open_connections=-1, closed_total=1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": settings.MONGODB_MAX_POOL_SIZE,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "saturation": round(self.checked_out / settings.MONGODB_MAX_POOL_SIZE, 4),
+                "created_total": self.created_total,
+                "closed_total": self.closed_total,
+                "checkout_failures": self.checkout_failures
+            }
+
+
+def artifact_filter(artifact: str) -> dict:
+    """Query matching every PDF document that uses the given artifacts"""
+    return {"$or": [{"_id": ObjectId(artifact)}, {"artifact_id": artifact}]}
+
+
+# Every index the application relies on. create_indexes is a no-op for indexes
+# that already exist with the same spec, so this runs safely on every startup.
+INDEXES = {
+    "pdfs": [
+        IndexModel([("created_at", -1), ("_id", -1)]),
+        IndexModel([("artifact_id", 1)], sparse=True),
+    ],
+    "queries": [
+        IndexModel([("pdf_id", 1), ("created_at", -1), ("_id", -1)]),
+        IndexModel([("created_at", 1)]),
+    ],
+    "pdf_pages": [
+        IndexModel([("pdf_id", 1), ("page", 1)], unique=True),
+    ],
+    "ingestion_jobs": [
+        IndexModel([("pdf_id", 1), ("status", 1)]),
+        IndexModel([("status", 1), ("created_at", 1)]),
+    ],
+}
+
 
 class MongoDB:
     client = None
     db = None
+    pool_monitor = PoolMonitor()
 
-
-    
     @classmethod
     async def connect_db(cls):
         try:
-            # Step 1: Connect to MongoDB
-            print("Step 1: Connecting to MongoDB...")
-            cls.client = AsyncIOMotorClient(settings.MONGODB_URL)
+            print("Connecting to MongoDB...")
+            cls.client = AsyncIOMotorClient(
+                settings.MONGODB_URL,
+                maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+                maxConnecting=settings.MONGODB_MAX_CONNECTING,
+                connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[cls.pool_monitor]
+            )
             cls.db = cls.client[settings.DB_NAME]
-            await cls.db.pdfs.create_index("created_at")
-            await cls.db.queries.create_index("created_at")
+            # Fail fast on a bad URL and open the first connection before serving traffic
+            await cls.client.admin.command("ping")
             print("MongoDB connected successfully!")
 
-            # Step 2: Connect to Cloudinary
-            print("Step 2: Connecting to Cloudinary...")
-            cloudinary.config(
-                cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-                api_key=settings.CLOUDINARY_API_KEY,
-                api_secret=settings.CLOUDINARY_API_SECRET
-            )
-            print("Cloudinary connected successfully!")
-
         except Exception as e:
-            print(f"Error connecting to MongoDB or Cloudinary: {str(e)}")
-            logging.error(f"Error connecting to MongoDB or Cloudinary: {str(e)}")
-            raise Exception("Database or Cloudinary connection failed")
+            print(f"Error connecting to MongoDB: {str(e)}")
+            logging.error(f"Error connecting to MongoDB: {str(e)}")
+            raise Exception("Database connection failed")
 
+    @classmethod
+    async def ensure_indexes(cls):
+        """Create any missing indexes from INDEXES"""
+        for collection, indexes in INDEXES.items():
+            await cls.db[collection].create_indexes(indexes)
 
     @classmethod
-    async def save_pdf_metadata(cls, filename: str, cloudinary_data: dict):
+    async def close_db(cls):
+        if cls.client is not None:
+            cls.client.close()
+            cls.client = None
+            cls.db = None
+            print("MongoDB connection closed")
+
+    @classmethod
+    async def ping(cls) -> float:
+        """Round-trip time of a ping to the server, in milliseconds"""
+        started = time.perf_counter()
+        await cls.client.admin.command("ping")
+        return (time.perf_counter() - started) * 1000
+
+
+    @classmethod
+    async def save_pdf_metadata(cls, filename: str, cloudinary_data: dict, extra: Optional[dict] = None):
+        """Insert a pdfs document; extra holds additional fields such as _id,
+        content_hash and artifact_id"""
         try:
             # Debugging log
             logger = logging.getLogger(__name__)
@@ -50,7 +170,8 @@ class MongoDB:
                 "cloudinary_public_id": cloudinary_data['cloudinary_public_id'],
                 "file_size": cloudinary_data['file_size'],  # This matches the incoming data
                 "created_at": cloudinary_data['created_at'],
-                "format": cloudinary_data['format']
+                "format": cloudinary_data['format'],
+                **(extra or {})
             }
             
             # Log the document to be inserted
@@ -67,3 +188,108 @@ class MongoDB:
         except Exception as e:
             logger.error(f"Error saving PDF metadata: {str(e)}")
             raise Exception(f"Error saving PDF metadata to MongoDB: {str(e)}")
+
+
+    # pdf_blobs holds one document per distinct uploaded file, keyed by its
+    # SHA-256: where it is stored, whose artifacts it uses and which pdfs
+    # documents reference it (refs, with ref_count kept alongside). A blob
+    # whose count reached 0 is being deleted and is never handed out again.
+
+    @classmethod
+    async def acquire_blob(cls, content_hash: str, pdf_id: str) -> Optional[dict]:
+        """Add pdf_id as a reference to the stored file with this hash, if there is one"""
+        return await cls.db.pdf_blobs.find_one_and_update(
+            {"_id": content_hash, "ref_count": {"$gt": 0}},
+            {"$addToSet": {"refs": pdf_id}, "$inc": {"ref_count": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    async def create_blob(cls, content_hash: str, pdf_id: str, artifact_id: str, cloudinary_data: dict) -> bool:
+        """Record a newly stored file with one reference; False if another upload
+        of the same content got there first"""
+        try:
+            await cls.db.pdf_blobs.insert_one({
+                "_id": content_hash,
+                "artifact_id": artifact_id,
+                "cloudinary_url": cloudinary_data["cloudinary_url"],
+                "cloudinary_public_id": cloudinary_data["cloudinary_public_id"],
+                "file_size": cloudinary_data["file_size"],
+                "format": cloudinary_data["format"],
+                "refs": [pdf_id],
+                "ref_count": 1,
+                "created_at": datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @classmethod
+    async def release_blob(cls, content_hash: str, pdf_id: str) -> int:
+        """Drop pdf_id's reference, returning how many remain; the blob document
+        goes away with the last one. Releasing the same pdf_id again changes
+        nothing, so a retried delete cannot take another PDF's reference."""
+        blob = await cls.db.pdf_blobs.find_one_and_update(
+            {"_id": content_hash, "refs": pdf_id},
+            {"$pull": {"refs": pdf_id}, "$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None:
+            # Already released: report what is left without touching it
+            blob = await cls.db.pdf_blobs.find_one({"_id": content_hash})
+            if blob is None:
+                return 0
+        if blob["ref_count"] <= 0:
+            await cls.db.pdf_blobs.delete_one({"_id": content_hash, "ref_count": {"$lte": 0}})
+            return 0
+        return blob["ref_count"]
+
+    @classmethod
+    async def save_pdf_pages(cls, pdf_id: str, pages: List[Tuple[int, str]]):
+        """Store extracted (page_number, text) pairs; safe to call once per batch"""
+        if not pages:
+            return
+        try:
+            await cls.db.pdf_pages.delete_many({
+                "pdf_id": pdf_id,
+                "page": {"$in": [page_no for page_no, _ in pages]}
+            })
+            await cls.db.pdf_pages.insert_many(
+                [{"pdf_id": pdf_id, "page": page_no, "text": text} for page_no, text in pages],
+                ordered=False
+            )
+        except Exception as e:
+            logging.error(f"Error saving pages for PDF {pdf_id}: {str(e)}")
+            raise Exception(f"Error saving PDF pages to MongoDB: {str(e)}")
+
+    # pdf_artifacts holds per-artifact state shared by every PDF that uses the
+    # artifact, so it outlives the PDF document that created it.
+
+    @classmethod
+    async def mark_pages_extracted(cls, artifact: str, page_count: int):
+        await cls.db.pdf_artifacts.update_one(
+            {"_id": artifact},
+            {"$set": {"page_count": page_count, "pages_extracted": True}},
+            upsert=True
+        )
+        await cls.db.pdfs.update_many(artifact_filter(artifact), {"$set": {"page_count": page_count}})
+
+    @classmethod
+    async def pages_extracted(cls, artifact: str) -> bool:
+        """Whether every page of the artifact's PDF has been stored"""
+        return await cls.db.pdf_artifacts.find_one({"_id": artifact, "pages_extracted": True}) is not None
+
+    @classmethod
+    async def get_pdf_pages(cls, pdf_id: str) -> List[Tuple[int, str]]:
+        """Stored (page_number, text) pairs in page order"""
+        pages = await cls.db.pdf_pages.find(
+            {"pdf_id": pdf_id},
+            {"_id": 0, "page": 1, "text": 1}
+        ).sort("page", 1).to_list(length=None)
+        return [(page["page"], page["text"]) for page in pages]
+
+    @classmethod
+    async def delete_pdf_pages(cls, pdf_id: str) -> int:
+        await cls.db.pdf_artifacts.delete_one({"_id": pdf_id})
+        result = await cls.db.pdf_pages.delete_many({"pdf_id": pdf_id})
+        return result.deleted_count
@@ -0,0 +1,73 @@
+# app/embedding_server.py
+"""Shared embedding worker.
+
+Loads the embedding model (sentence-transformers, or the exported ONNX model
+with EMBEDDING_BACKEND=onnx) once and serves embeddings over HTTP so
+that API workers don't each hold their own copy. Run it as a single process
+next to the API and point the API at it:
+
+    uvicorn app.embedding_server:app --host 127.0.0.1 --port 8001 --workers 1
+    EMBEDDING_SERVICE_URL=http://127.0.0.1:8001 uvicorn app.main:app --workers 4
+
+It intentionally does not import app.config, so it needs no database or
+Cloudinary credentials.
+"""
+import asyncio
+import base64
+import os
+from typing import List
+import numpy as np
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+app = FastAPI(title="Embedding Server")
+model = None
+# One encode at a time: torch and ONNX Runtime already parallelize inside a batch
+encode_lock = asyncio.Lock()
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    batch_size: int = 32
+    normalize: bool = True
+
+
+@app.on_event("startup")
+async def load_model():
+    global model
+    if BACKEND == "onnx":
+        from .utils.onnx_embedder import OnnxEmbedder
+        model = await asyncio.to_thread(
+            OnnxEmbedder,
+            os.getenv("ONNX_MODEL_DIR", f"data/onnx/{MODEL_NAME}"),
+            int(os.getenv("ONNX_INTRA_OP_THREADS", "0")),
+            int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "8192"))
+        )
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = await asyncio.to_thread(SentenceTransformer, MODEL_NAME)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "model": MODEL_NAME, "backend": BACKEND, "loaded": model is not None}
+
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    async with encode_lock:
+        embeddings = await asyncio.to_thread(
+            model.encode,
+            request.texts,
+            batch_size=request.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=request.normalize
+        )
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return {
+        "shape": list(embeddings.shape),
+        "embeddings": base64.b64encode(embeddings.tobytes()).decode("ascii")
+    }
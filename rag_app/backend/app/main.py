@@ -1,15 +1,22 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import Dict
+import asyncio
+import json
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
 from .db.mongodb import MongoDB
+from .services.vector_search import VectorSearch
+from .services.jobs import ingestion_queue, create_job_store
+from .utils.executors import Executors
+from .utils.pdf_processor import pdf_processor
+from .utils.metrics import MetricsMiddleware, WEBSOCKET_MESSAGES, collect_timings, timings_ms, track_stage
+from .services.rag_service import rag_service
 import cloudinary
 from .config import settings
-from .api.endpoints import pdf, query  # Add query import
-# app/main.py or in an appropriate route file
-from fastapi import FastAPI, UploadFile, File
-from fastapi.middleware.cors import CORSMiddleware
-
-### need to work 
+from .schemas.models import WebSocketCancel, WebSocketMessage, WebSocketQuery
+from .api.endpoints import pdf, query, jobs, health, metrics
 
 
 app = FastAPI(title="PDF Query System")
@@ -21,76 +28,191 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
+# Request latency histograms and Server-Timing headers
+app.add_middleware(MetricsMiddleware)
 
 
 # Include routers
 app.include_router(pdf.router, prefix="/api/v1", tags=["pdf"])
-app.include_router(query.router, prefix="/api/v1", tags=["query"])  # Add query router
-
+app.include_router(query.router, prefix="/api/v1", tags=["query"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["jobs"])
+app.include_router(health.router, prefix="/api/v1", tags=["health"])
+# Scraped at the conventional path, outside the API prefix
+app.include_router(metrics.router, tags=["metrics"])
 
 
-#@app.post("/upload")
-#async def upload_file(files: list[UploadFile]):
-#    for file in files:
-#        # Handle each file (e.g., save, process, etc.)
-#        contents = await file.read()  # Example: reading file contents
-#        print(f"Uploaded file: {file.filename} with size {len(contents)} bytes")
-#
-#    return {"message": "Files uploaded successfully"}
-
 # Register routes
 @app.get("/")
 async def root():
     return {"message": "Welcome to the PDF Query System API!"}
 
-# Include routers
-app.include_router(pdf.router, prefix="/api/v1", tags=["pdf"])
-app.include_router(query.router, prefix="/api/v1", tags=["query"])  # Add query router
-
 @app.on_event("startup")
 async def startup_db_client():
     await MongoDB.connect_db()
-    
+    await MongoDB.ensure_indexes()
+
     # Configure Cloudinary
     cloudinary.config(
         cloud_name=settings.CLOUDINARY_CLOUD_NAME,
         api_key=settings.CLOUDINARY_API_KEY,
         api_secret=settings.CLOUDINARY_API_SECRET
     )
-    
-    # Create MongoDB indexes for queries collection
-    await MongoDB.db.queries.create_index("pdf_id")
-    await MongoDB.db.queries.create_index("created_at")
+
+    # Load the cross-document vector index
+    VectorSearch.load()
+
+    # Start background ingestion workers; unfinished jobs are picked up again
+    await ingestion_queue.start(create_job_store(settings.JOB_STORE_BACKEND), settings.INGESTION_WORKERS)
+
+    # Optionally load models now instead of on the first query
+    if settings.WARM_UP_MODELS:
+        await pdf_processor.warm_up()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await ingestion_queue.stop()
+    VectorSearch.save()
+    await Executors.shutdown()
+    await MongoDB.close_db()
     print("Shutting down PDF Query System API")
 
 # WebSocket management
-connected_clients = set()
+class WebSocketSession:
+    """One websocket connection, multiplexing queries.
+
+    Queries that carry a client-chosen request_id run concurrently (up to
+    WEBSOCKET_MAX_CONCURRENT_QUERIES per connection) and every frame they
+    produce echoes the request_id; {"type": "cancel", "request_id": ...}
+    stops one. Queries without a request_id run one at a time, in order.
+    At most WEBSOCKET_MAX_PENDING_QUERIES queries of either kind may be
+    running or waiting; further ones are refused with an error frame.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self._send_lock = asyncio.Lock()
+        self._in_order = asyncio.Lock()
+        self._slots = asyncio.Semaphore(settings.WEBSOCKET_MAX_CONCURRENT_QUERIES)
+        self._tasks: Dict[object, asyncio.Task] = {}
+
+    async def send(self, frame: dict, request_id=None):
+        if request_id is not None:
+            frame = {**frame, "request_id": request_id}
+        # Frames of concurrent queries must not interleave mid-message
+        async with self._send_lock:
+            await self.websocket.send_json(frame)
+
+    async def start_query(self, message: WebSocketQuery):
+        request_id = message.request_id
+        if request_id is not None and request_id in self._tasks:
+            await self.send({"type": "error", "detail": "A query with this request_id is already running"}, request_id)
+            return
+        if len(self._tasks) >= settings.WEBSOCKET_MAX_PENDING_QUERIES:
+            await self.send({"type": "error", "detail": "Too many queries in progress on this connection"}, request_id)
+            return
+        task = asyncio.create_task(self._run(message, request_id))
+        key = request_id if request_id is not None else task
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _run(self, message: WebSocketQuery, request_id):
+        try:
+            if request_id is None:
+                async with self._in_order:
+                    await stream_answer_over_websocket(self, message, request_id)
+            else:
+                async with self._slots:
+                    await stream_answer_over_websocket(self, message, request_id)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"Websocket query failed: {e}")
+
+    def cancel(self, request_id):
+        task = self._tasks.get(request_id)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def stream_answer_over_websocket(session: WebSocketSession, message: WebSocketQuery, request_id=None):
+    """Answer one query message with incremental frames:
+    sources -> token... -> answer (or error). The answer frame carries the
+    per-stage timings that HTTP responses report in Server-Timing."""
+    with collect_timings() as timings, track_stage("websocket_query"):
+        await _answer_over_websocket(session, message, request_id, timings)
+
+
+async def _answer_over_websocket(session: WebSocketSession, message: WebSocketQuery, request_id, timings: list):
+    try:
+        prepared = await rag_service.prepare(message.pdf_id, message.query)
+        await session.send({"type": "sources", "sources": jsonable_encoder(prepared.sources)}, request_id)
+
+        parts = []
+        async for text in rag_service.stream_response(prepared):
+            parts.append(text)
+            await session.send({"type": "token", "text": text}, request_id)
+
+        await session.send({
+            "type": "answer",
+            "id": prepared.query_doc["id"],
+            "answer": "".join(parts),
+            "cached": prepared.cached is not None,
+            "timings_ms": timings_ms(timings),
+            "visualizations": []
+        }, request_id)
+    except WebSocketDisconnect:
+        raise
+    except HTTPException as http_error:
+        await session.send({"type": "error", "detail": http_error.detail}, request_id)
+    except Exception as e:
+        print(f"Error answering websocket query: {e}")
+        await session.send({"type": "error", "detail": str(e)}, request_id)
+
 
+def _invalid_message_detail(error: ValueError):
+    if isinstance(error, ValidationError):
+        return jsonable_encoder(error.errors(include_url=False, include_context=False, include_input=False))
+    return f"Message is not valid JSON: {error}"
+
+
+def _echoable_request_id(data):
+    """request_id of a message that failed validation, if it is a valid one"""
+    request_id = data.get("request_id") if isinstance(data, dict) else None
+    return request_id if isinstance(request_id, (str, int)) and not isinstance(request_id, bool) else None
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    rag_service = RAGService()
-    
+    session = WebSocketSession(websocket)
+
     try:
         while True:
-            data = await websocket.receive_json()
-            
-            if data.get("type") == "query":
-                response = await rag_service.process_query(
-                    query=data["query"],
-                    pdf_id=data.get("pdf_id")
-                )
-                
-                await websocket.send_json({
-                    "answer": response["answer"],
-                    "visualizations": response["visualizations"]
-                })
-                
+            text, data = await websocket.receive_text(), None
+            try:
+                data = json.loads(text)
+                message = WebSocketMessage.validate_python(data)
+            except ValueError as e:  # including pydantic's ValidationError
+                # A bad message fails on its own; the connection and its other queries carry on
+                WEBSOCKET_MESSAGES.inc(type="invalid")
+                await session.send({"type": "error", "detail": _invalid_message_detail(e)}, _echoable_request_id(data))
+                continue
+            WEBSOCKET_MESSAGES.inc(type=message.type)
+
+            if isinstance(message, WebSocketQuery):
+                await session.start_query(message)
+            elif isinstance(message, WebSocketCancel):
+                session.cancel(message.request_id)
+
     except WebSocketDisconnect:
         print("Client disconnected")
+    finally:
+        await session.close()
@@ -15,5 +15,4 @@ class Document(BaseModel):
     id: str
     filename: str
     content: str
-    embedding: List[float]
     created_at: str
\ No newline at end of file
@@ -1,6 +1,6 @@
 # app/schemas/models.py
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, StrictInt, StrictStr, TypeAdapter
+from typing import Annotated, Literal, Optional, List, Union
 from datetime import datetime
 
 # Pydantic models for request and response payloads
@@ -12,6 +12,16 @@ class PDFMetadata(BaseModel):
     file_size: int
     created_at: datetime
     format: str
+    page_count: Optional[int] = None
+
+class ChunkSource(BaseModel):
+    pdf_id: str
+    chunk_index: int
+    score: float
+    rerank_score: Optional[float] = None  # cross-encoder score, when reranked
+    text: str
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
 
 class QueryRequest(BaseModel):
     pdf_id: str
@@ -22,4 +32,53 @@ class QueryResponse(BaseModel):
     pdf_id: str
     query: str
     response: str
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+    sources: Optional[List[ChunkSource]] = None
+    cached: Optional[bool] = None
+
+class MultiQueryRequest(BaseModel):
+    query: str
+    pdf_ids: Optional[List[str]] = None  # None searches every stored PDF
+    top_k: int = 5
+
+class MultiQueryResponse(BaseModel):
+    query: str
+    response: str
+    sources: List[ChunkSource]
+    created_at: datetime
+
+class BatchQueryRequest(BaseModel):
+    items: List[QueryRequest]
+    top_k: int = 3
+
+class BatchQueryResult(BaseModel):
+    index: int  # Position of the item in the request
+    pdf_id: str
+    query: str
+    id: Optional[str] = None
+    response: Optional[str] = None
+    sources: Optional[List[ChunkSource]] = None
+    cached: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    succeeded: int
+    failed: int
+
+# Websocket messages; request_id must be hashable, it keys the connection's running queries
+class WebSocketQuery(BaseModel):
+    type: Literal["query"]
+    pdf_id: str
+    query: str
+    request_id: Optional[Union[StrictStr, StrictInt]] = None
+
+class WebSocketCancel(BaseModel):
+    type: Literal["cancel"]
+    request_id: Union[StrictStr, StrictInt]
+
+WebSocketMessage = TypeAdapter(
+    Annotated[Union[WebSocketQuery, WebSocketCancel], Field(discriminator="type")]
+)
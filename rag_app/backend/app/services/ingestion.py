@@ -0,0 +1,157 @@
+# app/services/ingestion.py
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+import asyncio
+import logging
+import threading
+import httpx
+import numpy as np
+from fastapi import HTTPException, status
+from ..config import settings
+from ..db.mongodb import MongoDB
+from ..utils.pdf_processor import pdf_processor
+from ..utils.embedding_store import embedding_store
+from ..utils.bm25 import BM25Index
+from ..utils.executors import run_in_thread
+from ..utils.pdf_cache import pdf_cache
+from ..utils.metrics import CHUNKS_INGESTED, CHUNKS_PER_DOCUMENT, track_stage
+from .vector_search import VectorSearch
+
+# Called with (stage, fraction_done, details) as ingestion advances
+ProgressCallback = Callable[[str, float, dict], Awaitable[None]]
+
+STAGES = ("extract", "chunk", "embed", "index")
+
+
+# Persisting an ingestion and deleting its artifacts exclude each other: a
+# delete either removes files that were already saved or makes a save that has
+# not started yet see its cancellation flag and skip
+_persist_lock = threading.Lock()
+
+
+async def _no_progress(stage: str, progress: float, details: dict):
+    pass
+
+
+def artifact_id(pdf: dict) -> str:
+    """Key of a PDF's derived artifacts (pages, chunks, embeddings, vectors,
+    ingestion jobs). Uploads of identical content share the first upload's;
+    PDFs stored before deduplication use their own id."""
+    return pdf.get("artifact_id") or str(pdf["_id"])
+
+
+async def get_pdf_path(pdf: dict) -> str:
+    """Local path of a PDF, streamed from Cloudinary into the cache on a miss"""
+    try:
+        return await pdf_cache.fetch(pdf['cloudinary_public_id'], pdf['cloudinary_url'])
+    except httpx.HTTPStatusError as status_error:
+        print(f"Failed to download PDF from Cloudinary. Status Code: {status_error.response.status_code}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cloudinary resource not found"
+        )
+    except Exception as download_error:
+        print(f"Error downloading PDF: {download_error}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error downloading PDF from Cloudinary"
+        )
+
+
+async def load_or_extract_pages(
+    pdf_id: str,
+    pdf_source: Union[bytes, str],
+    progress: ProgressCallback = _no_progress
+) -> List[Tuple[int, str]]:
+    """Per-page text of a PDF, extracted at most once and persisted in MongoDB.
+    An interrupted extraction resumes after the pages it already saved."""
+    pages = await MongoDB.get_pdf_pages(pdf_id)
+    if await MongoDB.pages_extracted(pdf_id):
+        return pages
+
+    # Batches are saved in page order, so a previous run leaves a prefix 1..n
+    if [page_no for page_no, _ in pages] != list(range(1, len(pages) + 1)):
+        await MongoDB.delete_pdf_pages(pdf_id)
+        pages = []
+
+    page_count = await pdf_processor.count_pages(pdf_source)
+    await progress("extract", len(pages) / page_count if page_count else 0.0, {"pages_total": page_count})
+
+    # Persist each batch as it streams out of the process pool
+    async for batch in pdf_processor.iter_page_batches(pdf_source, page_count, start_page=len(pages)):
+        await MongoDB.save_pdf_pages(pdf_id, batch)
+        pages.extend(batch)
+        await progress("extract", len(pages) / page_count, {
+            "pages_done": len(pages),
+            "pages_total": page_count
+        })
+    await MongoDB.mark_pages_extracted(pdf_id, len(pages))
+    return pages
+
+
+def _persist(
+    pdf_id: str,
+    chunks: List[str],
+    embeddings: np.ndarray,
+    chunk_pages: List[Tuple[int, int]],
+    lexical_index: BM25Index,
+    cancelled: Optional[threading.Event]
+) -> bool:
+    """Save a finished ingestion unless it was cancelled; False if skipped"""
+    with _persist_lock:
+        if cancelled is not None and cancelled.is_set():
+            return False
+        embedding_store.save(pdf_id, chunks, embeddings, chunk_pages, lexical_index)
+        VectorSearch.add(pdf_id, embeddings)
+        return True
+
+
+async def ingest_pdf(
+    pdf_id: str,
+    pdf_source: Union[bytes, str],
+    progress: Optional[ProgressCallback] = None,
+    cancelled: Optional[threading.Event] = None
+) -> Tuple[List[str], np.ndarray]:
+    """Extract, chunk and embed a PDF (bytes or file path) once and persist the result
+    under its pdf_id. Setting `cancelled` stops the result from being persisted, even
+    by thread pool work that outlives the cancelled coroutine."""
+    progress = progress or _no_progress
+    try:
+        pages = await load_or_extract_pages(pdf_id, pdf_source, progress)
+        await progress("extract", 1.0, {"pages_total": len(pages)})
+
+        # Tokenizing (and embedding sentences for the semantic strategy) is CPU work
+        chunks, chunk_pages = await run_in_thread(pdf_processor.create_page_chunks, pages)
+        await progress("chunk", 1.0, {"chunks_total": len(chunks)})
+
+        # Embed in slices so progress can be reported on large documents
+        slices = []
+        step = settings.INGESTION_EMBED_SLICE
+        for start in range(0, len(chunks), step):
+            slices.append(await pdf_processor.embed_chunks(chunks[start:start + step]))
+            done = min(start + step, len(chunks))
+            await progress("embed", done / len(chunks), {"chunks_done": done, "chunks_total": len(chunks)})
+        embeddings = np.concatenate(slices) if slices else await pdf_processor.embed_chunks([])
+        await progress("embed", 1.0, {"chunks_total": len(chunks)})
+
+        with track_stage("index"):
+            lexical_index = await run_in_thread(BM25Index.build, chunks, settings.BM25_K1, settings.BM25_B)
+            if not await run_in_thread(
+                _persist, pdf_id, chunks, embeddings, chunk_pages, lexical_index, cancelled
+            ):
+                raise asyncio.CancelledError()
+        await progress("index", 1.0, {"vectors": len(embeddings)})
+        CHUNKS_INGESTED.inc(len(chunks))
+        CHUNKS_PER_DOCUMENT.observe(len(chunks))
+
+        logging.info(f"Ingested PDF {pdf_id}: {len(pages)} pages, {len(chunks)} chunks")
+        return chunks, embeddings
+    except Exception as e:
+        logging.error(f"Error ingesting PDF {pdf_id}: {str(e)}")
+        raise Exception(f"Error ingesting PDF: {str(e)}")
+
+
+def delete_ingested_pdf(pdf_id: str) -> bool:
+    """Drop the stored chunks and vectors of a PDF, after any save in progress"""
+    with _persist_lock:
+        VectorSearch.delete(pdf_id)
+        return embedding_store.delete(pdf_id)
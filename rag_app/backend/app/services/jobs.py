@@ -0,0 +1,451 @@
+# app/services/jobs.py
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import copy
+import logging
+import threading
+import uuid
+from bson import ObjectId
+from pymongo import ReturnDocument
+from ..config import settings
+from ..db.mongodb import MongoDB, artifact_filter
+from ..utils.executors import run_in_thread
+from ..utils.pdf_cache import pdf_cache
+from .ingestion import STAGES, ingest_pdf, get_pdf_path, delete_ingested_pdf
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNFINISHED = (QUEUED, RUNNING)
+
+
+def new_job(pdf_id: str) -> dict:
+    now = datetime.utcnow()
+    return {
+        "pdf_id": pdf_id,
+        "status": QUEUED,
+        "stage": None,
+        "stages": {stage: {"status": "pending", "progress": 0.0} for stage in STAGES},
+        "attempts": 0,
+        "error": None,
+        # A failed attempt is retried no earlier than this
+        "retry_at": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+class JobStore:
+    """Persistence for ingestion job state"""
+
+    async def create(self, job: dict) -> str:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def update(self, job_id: str, fields: dict):
+        raise NotImplementedError
+
+    async def claim(self, job_id: str, lease_seconds: float, max_attempts: int) -> Optional[dict]:
+        """Atomically mark a queued (or abandoned running) job as running by this
+        process for lease_seconds, under a new lease_owner token; None if another
+        worker owns it or it finished. A claimable job that already used
+        max_attempts is marked failed instead, so a job whose worker keeps dying
+        (e.g. out of memory) is not retried forever."""
+        raise NotImplementedError
+
+    async def update_owned(self, job_id: str, owner: str, fields: dict) -> bool:
+        """Update a running job only while `owner` still holds its lease; False if
+        the job was cancelled, finished or claimed again after the lease expired"""
+        raise NotImplementedError
+
+    async def list_resumable(self) -> List[dict]:
+        """Queued jobs due to run (retries after their backoff) and running jobs
+        whose lease expired (their worker died)"""
+        raise NotImplementedError
+
+    async def find_active(self, pdf_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+
+class MongoJobStore(JobStore):
+    """Jobs live in the ingestion_jobs collection next to pdfs"""
+
+    @property
+    def collection(self):
+        return MongoDB.db.ingestion_jobs
+
+    @staticmethod
+    def _format(job: Optional[dict]) -> Optional[dict]:
+        if job is None:
+            return None
+        job["id"] = str(job.pop("_id"))
+        return job
+
+    async def create(self, job: dict) -> str:
+        result = await self.collection.insert_one(dict(job))
+        return str(result.inserted_id)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return self._format(await self.collection.find_one({"_id": ObjectId(job_id)}))
+
+    async def update(self, job_id: str, fields: dict):
+        await self.collection.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}}
+        )
+
+    @staticmethod
+    def _claimable(now: datetime) -> dict:
+        return {"$or": [
+            {"status": QUEUED, "retry_at": None},
+            {"status": QUEUED, "retry_at": {"$lte": now}},
+            {"status": RUNNING, "lease_until": {"$lt": now}}
+        ]}
+
+    async def claim(self, job_id: str, lease_seconds: float, max_attempts: int) -> Optional[dict]:
+        now = datetime.utcnow()
+        exhausted = await self.collection.find_one_and_update(
+            {"$and": [
+                {"_id": ObjectId(job_id), "attempts": {"$gte": max_attempts}},
+                self._claimable(now)
+            ]},
+            {"$set": {
+                "status": FAILED,
+                "error": f"Gave up after {max_attempts} attempts",
+                "updated_at": now
+            }}
+        )
+        if exhausted is not None:
+            logging.error(f"Ingestion job {job_id} failed: no attempts left after its worker was lost")
+            return None
+        job = await self.collection.find_one_and_update(
+            {"_id": ObjectId(job_id), **self._claimable(now)},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "lease_owner": uuid.uuid4().hex,
+                    "lease_until": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        return self._format(job)
+
+    async def update_owned(self, job_id: str, owner: str, fields: dict) -> bool:
+        result = await self.collection.update_one(
+            {"_id": ObjectId(job_id), "status": RUNNING, "lease_owner": owner},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    async def list_resumable(self) -> List[dict]:
+        jobs = await self.collection.find(
+            self._claimable(datetime.utcnow()),
+            {"_id": 1, "pdf_id": 1}
+        ).sort("created_at", 1).to_list(length=None)
+        return [self._format(job) for job in jobs]
+
+    async def find_active(self, pdf_id: str) -> Optional[dict]:
+        return self._format(await self.collection.find_one({
+            "pdf_id": pdf_id,
+            "status": {"$in": list(UNFINISHED)}
+        }))
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local job store for tests and single-process development"""
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+
+    async def create(self, job: dict) -> str:
+        job_id = str(ObjectId())
+        self._jobs[job_id] = {**copy.deepcopy(job), "id": job_id}
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        return copy.deepcopy(job) if job else None
+
+    async def update(self, job_id: str, fields: dict):
+        job = self._jobs[job_id]
+        for key, value in fields.items():
+            # Support the dotted paths used for per-stage updates
+            target = job
+            *parents, leaf = key.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = copy.deepcopy(value)
+        job["updated_at"] = datetime.utcnow()
+
+    @staticmethod
+    def _claimable(job: dict, now: datetime) -> bool:
+        if job["status"] == QUEUED:
+            return job.get("retry_at") is None or job["retry_at"] <= now
+        return job["status"] == RUNNING and job.get("lease_until", now) < now
+
+    async def claim(self, job_id: str, lease_seconds: float, max_attempts: int) -> Optional[dict]:
+        now = datetime.utcnow()
+        job = self._jobs.get(job_id)
+        if job is None or not self._claimable(job, now):
+            return None
+        if job.get("attempts", 0) >= max_attempts:
+            logging.error(f"Ingestion job {job_id} failed: no attempts left after its worker was lost")
+            job.update({"status": FAILED, "error": f"Gave up after {max_attempts} attempts", "updated_at": now})
+            return None
+        job["status"] = RUNNING
+        job["lease_owner"] = uuid.uuid4().hex
+        job["lease_until"] = now + timedelta(seconds=lease_seconds)
+        job["attempts"] = job.get("attempts", 0) + 1
+        job["updated_at"] = now
+        return copy.deepcopy(job)
+
+    async def update_owned(self, job_id: str, owner: str, fields: dict) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != RUNNING or job.get("lease_owner") != owner:
+            return False
+        await self.update(job_id, fields)
+        return True
+
+    async def list_resumable(self) -> List[dict]:
+        now = datetime.utcnow()
+        jobs = [job for job in self._jobs.values() if self._claimable(job, now)]
+        return copy.deepcopy(sorted(jobs, key=lambda job: job["created_at"]))
+
+    async def find_active(self, pdf_id: str) -> Optional[dict]:
+        for job in self._jobs.values():
+            if job["pdf_id"] == pdf_id and job["status"] in UNFINISHED:
+                return copy.deepcopy(job)
+        return None
+
+
+def create_job_store(backend: str) -> JobStore:
+    if backend == "mongo":
+        return MongoJobStore()
+    if backend == "memory":
+        return InMemoryJobStore()
+    raise ValueError(f"Unknown job store backend '{backend}', expected 'mongo' or 'memory'")
+
+
+class IngestionQueue:
+    """Runs extract -> chunk -> embed -> index for uploaded PDFs on a bounded
+    pool of worker tasks, recording per-stage progress in the job store.
+
+    A worker claims a job with a lease that a heartbeat renews while the job
+    runs, however long a single stage takes, so with several API processes
+    each job runs in exactly one of them. Every claim gets a new owner token
+    and the job's updates are conditional on it: a worker whose lease expired
+    and was taken over stops and records nothing. A
+    periodic sweep re-queues jobs whose lease expired (crash, redeploy);
+    extraction then resumes from the pages already saved. Failed attempts are
+    retried with exponential backoff up to INGESTION_MAX_ATTEMPTS; the retry
+    time is stored with the job, so neither the sweep nor another process
+    picks it up early.
+    """
+
+    def __init__(self):
+        self.store: Optional[JobStore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Set to stop a running job from persisting anything, e.g. from a pool thread
+        self._cancel_flags: Dict[str, threading.Event] = {}
+        self._retry_tasks: set = set()
+
+    async def start(self, store: JobStore, workers: int):
+        self.store = store
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        tasks = [*self._tasks, *self._running.values(), *self._retry_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retry_tasks = set()
+        # Interrupted jobs stay "running" until their lease expires, then get resumed
+
+    async def submit(self, pdf_id: str) -> str:
+        job_id = await self.store.create(new_job(pdf_id))
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.store.get(job_id)
+
+    async def find_active(self, pdf_id: str) -> Optional[dict]:
+        if self.store is None:
+            return None
+        return await self.store.find_active(pdf_id)
+
+    def stats(self) -> dict:
+        return {
+            "workers": sum(1 for task in self._tasks if not task.done()),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._running)
+        }
+
+    def _cancel_running(self, job_id: str) -> Optional[asyncio.Task]:
+        flag = self._cancel_flags.get(job_id)
+        if flag is not None:
+            flag.set()
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return task
+
+    async def cancel_for_pdf(self, pdf_id: str):
+        """Stop ingestion of a PDF that is being deleted. Work already running on
+        a pool thread cannot be interrupted, but it persists nothing once the job
+        is cancelled; a job running in another process notices the cancelled
+        status on its next heartbeat."""
+        while True:
+            job = await self.store.find_active(pdf_id)
+            if job is None:
+                break
+            await self.store.update(job["id"], {"status": CANCELLED})
+            task = self._cancel_running(job["id"])
+            if task is not None:
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _sweep(self):
+        while True:
+            try:
+                for job in await self.store.list_resumable():
+                    if job["id"] not in self._running:
+                        self._queue.put_nowait(job["id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error scanning for resumable ingestion jobs: {e}")
+            await asyncio.sleep(settings.INGESTION_LEASE_SECONDS / 2)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await self.store.claim(
+                    job_id, settings.INGESTION_LEASE_SECONDS, settings.INGESTION_MAX_ATTEMPTS
+                )
+                if job is None:
+                    continue
+                if job["attempts"] > 1:
+                    print(f"Resuming ingestion job {job_id} for PDF {job['pdf_id']} (attempt {job['attempts']})")
+                task = asyncio.create_task(self._run(job))
+                self._running[job_id] = task
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        raise
+                finally:
+                    self._running.pop(job_id, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ingestion worker error on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        pdf_id = job["pdf_id"]
+        attempts = job["attempts"]
+        owner = job["lease_owner"]
+        cancelled = self._cancel_flags[job_id] = threading.Event()
+
+        async def update(fields: dict):
+            if not await self.store.update_owned(job_id, owner, fields):
+                self._lost(job_id)
+
+        async def report(stage: str, progress: float, details: dict):
+            await update({
+                "stage": stage,
+                f"stages.{stage}": {
+                    "status": "completed" if progress >= 1.0 else "running",
+                    "progress": round(progress, 4),
+                    **details
+                }
+            })
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, owner))
+        try:
+            await update({"error": None})
+            # Jobs run per artifact id: any PDF sharing the artifacts can supply the file
+            pdf = await MongoDB.db.pdfs.find_one(artifact_filter(pdf_id))
+            if pdf is None:
+                await update({"status": CANCELLED, "error": "PDF was deleted"})
+                return
+
+            # Filled at upload time; re-downloaded if it was evicted meanwhile
+            pdf_source = pdf_cache.get_path(pdf["cloudinary_public_id"]) or await get_pdf_path(pdf)
+            await ingest_pdf(pdf_id, pdf_source, progress=report, cancelled=cancelled)
+
+            # The PDF may have been deleted while we were embedding it
+            if await MongoDB.db.pdfs.count_documents(artifact_filter(pdf_id), limit=1) == 0:
+                await run_in_thread(delete_ingested_pdf, pdf_id)
+                await update({"status": CANCELLED, "error": "PDF was deleted"})
+                return
+
+            await update({"status": COMPLETED, "stage": None})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            if attempts < settings.INGESTION_MAX_ATTEMPTS:
+                delay = settings.INGESTION_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+                logging.warning(f"Ingestion job {job_id} failed (attempt {attempts}), retrying in {delay}s: {error}")
+                await update({
+                    "status": QUEUED,
+                    "error": error,
+                    "retry_at": datetime.utcnow() + timedelta(seconds=delay)
+                })
+                retry = asyncio.create_task(self._requeue_later(job_id, delay))
+                self._retry_tasks.add(retry)
+                retry.add_done_callback(self._retry_tasks.discard)
+            else:
+                logging.error(f"Ingestion job {job_id} failed after {attempts} attempts: {error}")
+                await update({"status": FAILED, "error": error})
+        finally:
+            heartbeat.cancel()
+            self._cancel_flags.pop(job_id, None)
+
+    def _lost(self, job_id: str):
+        """Stop a job this worker no longer owns: cancelled (possibly from another
+        process) or taken over by another worker after its lease expired"""
+        logging.warning(f"Ingestion job {job_id} is no longer owned by this worker, stopping it")
+        self._cancel_running(job_id)
+
+    async def _heartbeat(self, job_id: str, owner: str):
+        """Renew a running job's lease, also through stages that report no progress
+        (whole-document chunking, the BM25 build), while this worker still owns it"""
+        while True:
+            await asyncio.sleep(settings.INGESTION_LEASE_SECONDS / 3)
+            try:
+                renewed = await self.store.update_owned(job_id, owner, {
+                    "lease_until": datetime.utcnow() + timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
+                })
+            except Exception as e:
+                logging.warning(f"Could not renew the lease of ingestion job {job_id}: {e}")
+                continue
+            if not renewed:
+                self._lost(job_id)
+                return
+
+    async def _requeue_later(self, job_id: str, delay: float):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job_id)
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,227 @@
+# app/services/query_service.py
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from fastapi import HTTPException, status
+from ..config import settings
+from ..db.mongodb import MongoDB
+from ..utils.pdf_processor import pdf_processor, Embeddings
+from ..utils.embedding_store import embedding_store
+from ..utils.executors import run_in_thread
+from ..utils.answer_cache import answer_cache, CachedAnswer
+from ..utils.bm25 import BM25Index
+from ..utils.metrics import CHUNKS_RETRIEVED, CONTEXT_TOKENS, timed
+from .ingestion import ingest_pdf, get_pdf_path, artifact_id
+from .jobs import ingestion_queue
+
+
+async def get_pdf_or_404(pdf_id: str) -> dict:
+    """PDF metadata for pdf_id, raising 400/404 HTTP errors for bad or unknown ids"""
+    if not ObjectId.is_valid(pdf_id):
+        print(f"Invalid pdf_id format: {pdf_id}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid PDF ID format"
+        )
+
+    pdf = await MongoDB.db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+    if not pdf:
+        print(f"PDF with ID {pdf_id} not found in MongoDB.")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="PDF not found"
+        )
+    return pdf
+
+
+@timed("cache_lookup")
+async def find_cached_answer(pdf_id: str, query: str) -> Tuple[Optional[CachedAnswer], Optional[np.ndarray]]:
+    """Cached answer for an identical or near-identical query, plus the query
+    embedding computed along the way (None on an exact hit) for reuse in retrieval"""
+    cached = answer_cache.get_exact(pdf_id, query)
+    if cached is not None:
+        return cached, None
+    query_embedding = await pdf_processor.get_query_embedding(query)
+    return answer_cache.get_similar(pdf_id, query, query_embedding), query_embedding
+
+
+@timed("load_chunks")
+async def load_pdf_chunks(pdf: dict) -> Tuple[List[str], Embeddings, Optional[np.ndarray]]:
+    """Chunks, memory-mapped embeddings (quantized when configured) and page
+    ranges stored for a PDF, ingesting it first if needed"""
+    pdf_id = str(pdf["_id"])
+    artifact = artifact_id(pdf)
+
+    # Load chunks and embeddings stored at upload time (shared by duplicate uploads)
+    if not await run_in_thread(embedding_store.exists, artifact):
+        job = await ingestion_queue.find_active(artifact)
+        if job is not None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"PDF is still being processed (job {job['id']}, stage {job.get('stage') or 'queued'})"
+            )
+        # PDF was uploaded before background ingestion existed: download and ingest it once
+        print(f"No stored embeddings for PDF {pdf_id}, ingesting now")
+        pdf_path = await get_pdf_path(pdf)
+        await ingest_pdf(artifact, pdf_path)
+    chunks = await run_in_thread(embedding_store.load_chunks, artifact)
+    chunk_embeddings = await run_in_thread(embedding_store.load_vectors, artifact)
+    chunk_pages = await run_in_thread(embedding_store.load_pages, artifact)
+    print(f"Total chunks loaded: {len(chunks)}")
+    return chunks, chunk_embeddings, chunk_pages
+
+
+def _load_or_build_lexical(pdf_id: str, chunks: List[str]) -> BM25Index:
+    lexical_index = embedding_store.load_lexical(pdf_id)
+    if lexical_index is None:
+        # Ingested before lexical indexing existed: build the index once and keep it
+        lexical_index = BM25Index.build(chunks, settings.BM25_K1, settings.BM25_B)
+        embedding_store.save_lexical(pdf_id, lexical_index)
+    return lexical_index
+
+
+async def load_lexical_index(pdf: dict, chunks: List[str]) -> Optional[BM25Index]:
+    """BM25 index of a PDF's chunks in hybrid retrieval mode, else None"""
+    if settings.RETRIEVAL_MODE != "hybrid" or not chunks:
+        return None
+    return await run_in_thread(_load_or_build_lexical, artifact_id(pdf), chunks)
+
+
+def _make_sources(
+    pdf_id: str,
+    ranked: List[Tuple[int, float]],
+    chunks: List[str],
+    chunk_pages: Optional[np.ndarray]
+) -> List[Dict]:
+    return [
+        {
+            "pdf_id": pdf_id,
+            "chunk_index": i,
+            "score": score,
+            "text": chunks[i],
+            "page_start": int(chunk_pages[i][0]) if chunk_pages is not None else None,
+            "page_end": int(chunk_pages[i][1]) if chunk_pages is not None else None
+        }
+        for i, score in ranked
+    ]
+
+
+async def artifacts_of(pdf_ids: List[str]) -> Dict[str, str]:
+    """artifact id -> pdf_id for the given PDFs; duplicates map to the first listed"""
+    docs = await MongoDB.db.pdfs.find(
+        {"_id": {"$in": [ObjectId(pdf_id) for pdf_id in pdf_ids]}},
+        {"artifact_id": 1}
+    ).to_list(length=None)
+    artifact_by_pdf = {str(doc["_id"]): artifact_id(doc) for doc in docs}
+    mapping: Dict[str, str] = {}
+    for pdf_id in pdf_ids:
+        if pdf_id in artifact_by_pdf:
+            mapping.setdefault(artifact_by_pdf[pdf_id], pdf_id)
+    return mapping
+
+
+async def pdfs_of(artifacts: List[str]) -> Dict[str, str]:
+    """artifact id -> a PDF that uses it, preferring the one that created it"""
+    docs = await MongoDB.db.pdfs.find(
+        {"$or": [
+            {"_id": {"$in": [ObjectId(artifact) for artifact in artifacts]}},
+            {"artifact_id": {"$in": artifacts}}
+        ]},
+        {"artifact_id": 1}
+    ).to_list(length=None)
+    mapping: Dict[str, str] = {}
+    for doc in docs:
+        pdf_id, artifact = str(doc["_id"]), artifact_id(doc)
+        if pdf_id == artifact or artifact not in mapping:
+            mapping[artifact] = pdf_id
+    return mapping
+
+
+@timed("retrieve")
+async def retrieve_sources(
+    pdf: dict,
+    query: str,
+    top_k: int = 3,
+    query_embedding: Optional[np.ndarray] = None
+) -> List[Dict]:
+    """Top-k chunks of one PDF for the query, with scores and page ranges.
+    With reranking on, more candidates are fetched and the cross-encoder picks the top-k."""
+    chunks, chunk_embeddings, chunk_pages = await load_pdf_chunks(pdf)
+    lexical_index = await load_lexical_index(pdf, chunks)
+    ranked = await pdf_processor.rank_chunks(
+        query, chunk_embeddings, pdf_processor.candidate_count(top_k), query_embedding, lexical_index
+    )
+    candidates = _make_sources(str(pdf["_id"]), ranked, chunks, chunk_pages)
+    return (await pdf_processor.rerank_sources([query], [candidates], top_k))[0]
+
+
+@timed("retrieve")
+async def retrieve_sources_batch(
+    pdf: dict,
+    query_embeddings: np.ndarray,
+    top_k: int = 3,
+    queries: Optional[List[str]] = None
+) -> List[List[Dict]]:
+    """Top-k chunks of one PDF for each row of query_embeddings, loading the
+    PDF's chunks once and scoring every query in one matrix product. Pass the
+    query texts to fuse in BM25 rankings in hybrid mode and to rerank every
+    query's candidates in one cross-encoder batch when reranking is on."""
+    chunks, chunk_embeddings, chunk_pages = await load_pdf_chunks(pdf)
+    lexical_index = await load_lexical_index(pdf, chunks) if queries is not None else None
+    fetch_k = pdf_processor.candidate_count(top_k) if queries is not None else top_k
+    ranked = await run_in_thread(
+        pdf_processor.rank_chunks_batch, chunk_embeddings, query_embeddings, fetch_k, queries, lexical_index
+    )
+    pdf_id = str(pdf["_id"])
+    candidates = [_make_sources(pdf_id, row, chunks, chunk_pages) for row in ranked]
+    if queries is None:
+        return candidates
+    return await pdf_processor.rerank_sources(queries, candidates, top_k)
+
+
+@timed("pack_context")
+def build_context(sources: List[Dict], query: str) -> List[str]:
+    """Context passages for the prompt, packed into the token budget and
+    labelled with the pages they came from"""
+    CHUNKS_RETRIEVED.inc(len(sources))
+    packed = pdf_processor.context_builder.build(query, sources)
+    CONTEXT_TOKENS.observe(packed.tokens_before, stage="retrieved")
+    CONTEXT_TOKENS.observe(packed.tokens_after, stage="packed")
+    return [
+        pdf_processor.label_chunk(passage.text, passage.page_start, passage.page_end)
+        for passage in packed.passages
+    ]
+
+
+@timed("save_query")
+async def save_query(pdf_id: str, query: str, response_text: str) -> Dict:
+    """Record a query and its answer in the history, returning the stored document"""
+    query_doc = {
+        "pdf_id": pdf_id,
+        "query": query,
+        "response": response_text,
+        "created_at": datetime.utcnow()
+    }
+    result = await MongoDB.db.queries.insert_one(query_doc)
+    query_doc["id"] = str(result.inserted_id)
+    query_doc.pop("_id", None)
+    return query_doc
+
+
+@timed("save_query")
+async def save_queries(answers: List[Tuple[str, str, str]]) -> List[Dict]:
+    """Record many (pdf_id, query, response) answers with a single insert_many,
+    returning the stored documents in the same order"""
+    if not answers:
+        return []
+    now = datetime.utcnow()
+    query_docs = [
+        {"pdf_id": pdf_id, "query": query, "response": response_text, "created_at": now}
+        for pdf_id, query, response_text in answers
+    ]
+    result = await MongoDB.db.queries.insert_many(query_docs)
+    for query_doc, inserted_id in zip(query_docs, result.inserted_ids):
+        query_doc.pop("_id", None)
+        query_doc["id"] = str(inserted_id)
+    return query_docs
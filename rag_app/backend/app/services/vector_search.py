@@ -0,0 +1,171 @@
+# app/services/vector_search.py
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+import numpy as np
+from ..config import settings
+from ..utils.embedding_store import embedding_store
+from ..utils.vector_index import VectorIndex, create_index
+
+
+class VectorSearch:
+    """Application-wide cross-document index.
+
+    The per-PDF embedding store stays the source of truth; the index is a derived
+    structure that is memory-mapped from disk at startup, kept up to date on
+    upload/delete and written back on shutdown. Every worker process holds its
+    own copy, so searches first pick up entries other workers added, replaced or
+    deleted in the store.
+    """
+
+    index: Optional[VectorIndex] = None
+    # Searches run on the thread pool while uploads/deletes mutate the index
+    _lock = threading.RLock()
+    # Store version the index was last reconciled with, and the version of each indexed entry
+    _store_version: Optional[str] = None
+    _entry_versions: Dict[str, str] = {}
+    # LRU of (entry version, chunk texts, page ranges) of PDFs that searches returned
+    _texts: "OrderedDict[str, Tuple[Optional[str], List[str], Optional[np.ndarray]]]" = OrderedDict()
+
+    @classmethod
+    def _new_index(cls) -> VectorIndex:
+        params = {"n_probe": settings.IVF_N_PROBE} if settings.VECTOR_INDEX_TYPE == "ivf" else {}
+        return create_index(settings.VECTOR_INDEX_TYPE, **params)
+
+    @classmethod
+    def load(cls):
+        try:
+            index = None
+            if os.path.exists(settings.VECTOR_INDEX_DIR):
+                index = VectorIndex.load(settings.VECTOR_INDEX_DIR, mmap=True)
+                if index.kind != settings.VECTOR_INDEX_TYPE:
+                    print(f"Vector index type changed to {settings.VECTOR_INDEX_TYPE}, rebuilding")
+                    index = None
+            with cls._lock:
+                cls.index = index or cls._new_index()
+                # Entries replaced since the index was saved no longer match their version
+                saved_versions = cls.index.metadata.get("entry_versions", {})
+                cls._entry_versions = {pdf_id: saved_versions.get(pdf_id, "") for pdf_id in cls.index.pdf_ids()}
+                cls._store_version = None
+
+            if cls.refresh():
+                cls.save()
+            print(f"Vector index loaded: {len(cls.index)} chunks from {len(cls._entry_versions)} PDFs")
+        except Exception as e:
+            logging.error(f"Error loading vector index: {str(e)}")
+            with cls._lock:
+                cls.index = cls._new_index()
+                cls._entry_versions = {}
+                cls._store_version = None
+                cls._texts.clear()
+
+    @classmethod
+    def refresh(cls) -> bool:
+        """Reconcile the index with the embedding store, which other workers (or a
+        crash) may have changed; a single small read when nothing did. True if the
+        index changed"""
+        if cls.index is None or embedding_store.version() == cls._store_version:
+            return False
+
+        changed = False
+        with cls._lock:
+            # Read before listing: a change made while listing is picked up next time
+            version = embedding_store.version()
+            stored = embedding_store.entry_versions()
+            for pdf_id in set(cls._entry_versions) - set(stored):
+                cls.index.delete(pdf_id)
+                del cls._entry_versions[pdf_id]
+                cls._texts.pop(pdf_id, None)
+                changed = True
+            for pdf_id, entry_version in stored.items():
+                if entry_version == cls._entry_versions.get(pdf_id):
+                    continue
+                loaded = embedding_store.load(pdf_id)
+                if loaded is None:
+                    continue
+                cls.index.add(pdf_id, loaded[1])
+                cls._entry_versions[pdf_id] = entry_version
+                changed = True
+            cls._store_version = version
+        return changed
+
+    @classmethod
+    def save(cls):
+        if cls.index is None:
+            return
+        try:
+            with cls._lock:
+                cls.refresh()
+                cls.index.save(settings.VECTOR_INDEX_DIR, {"entry_versions": cls._entry_versions})
+        except Exception as e:
+            logging.error(f"Error saving vector index: {str(e)}")
+
+    @classmethod
+    def add(cls, pdf_id: str, embeddings: np.ndarray):
+        """Index a PDF that was just saved to the embedding store"""
+        if cls.index is not None:
+            with cls._lock:
+                cls.index.add(pdf_id, embeddings)
+                version = embedding_store.entry_version(pdf_id)
+                if version is not None:
+                    cls._entry_versions[pdf_id] = version
+
+    @classmethod
+    def delete(cls, pdf_id: str):
+        if cls.index is not None:
+            with cls._lock:
+                cls.index.delete(pdf_id)
+                cls._entry_versions.pop(pdf_id, None)
+                cls._texts.pop(pdf_id, None)
+
+    @classmethod
+    def _chunk_texts(cls, pdf_id: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        """Chunk texts and page ranges of a PDF, read from the store once per
+        entry version"""
+        with cls._lock:
+            version = cls._entry_versions.get(pdf_id)
+            cached = cls._texts.get(pdf_id)
+            if cached is not None and cached[0] == version:
+                cls._texts.move_to_end(pdf_id)
+                return cached[1], cached[2]
+
+        # Read outside the lock; a replacement stored meanwhile gets a newer version
+        chunks = embedding_store.load_chunks(pdf_id) or []
+        pages = embedding_store.load_pages(pdf_id)
+        with cls._lock:
+            cls._texts[pdf_id] = (version, chunks, pages)
+            cls._texts.move_to_end(pdf_id)
+            while len(cls._texts) > settings.VECTOR_SEARCH_TEXT_CACHE_PDFS:
+                cls._texts.popitem(last=False)
+        return chunks, pages
+
+    @classmethod
+    def search(
+        cls,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        pdf_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Top-k chunks across PDFs with their text, best first"""
+        if cls.index is None:
+            return []
+
+        cls.refresh()
+        with cls._lock:
+            hits = cls.index.search(query_embedding, top_k=top_k, pdf_ids=pdf_ids)
+        results = []
+        for pdf_id, chunk_index, score in hits:
+            chunks, pages = cls._chunk_texts(pdf_id)
+            if chunk_index >= len(chunks):
+                continue
+            results.append({
+                "pdf_id": pdf_id,
+                "chunk_index": chunk_index,
+                "score": score,
+                "text": chunks[chunk_index],
+                "page_start": int(pages[chunk_index][0]) if pages is not None else None,
+                "page_end": int(pages[chunk_index][1]) if pages is not None else None
+            })
+        return results
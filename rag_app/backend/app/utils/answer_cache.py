@@ -0,0 +1,178 @@
+# app/utils/answer_cache.py
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+import re
+import time
+import numpy as np
+from ..config import settings
+from .metrics import CACHE_LOOKUPS
+
+_WORD = re.compile(r"[\w./-]+")
+
+
+@dataclass
+class CachedAnswer:
+    pdf_id: str
+    query: str
+    response: str
+    sources: List[dict]
+    embedding: Optional[np.ndarray]
+    identifiers: FrozenSet[str] = frozenset()
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    """In-process LRU cache of generated answers per PDF.
+
+    Lookups first try an exact match on the normalized query text, then a
+    near-duplicate match: the most similar cached query by embedding cosine that
+    clears similarity_threshold and mentions exactly the same identifiers
+    (numbers, codes, acronyms), which embeddings barely tell apart: "revenue in
+    2019" and "revenue in 2020" must not share an answer. Entries expire after
+    ttl_seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        self._keys_by_pdf: Dict[str, Set[Tuple[str, str]]] = {}
+        self._matrix_by_pdf: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Case-, whitespace- and trailing-punctuation-insensitive form of a query"""
+        return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+    @staticmethod
+    def identifiers(query: str) -> FrozenSet[str]:
+        """Tokens with a digit or underscore, or an uppercase letter after the first
+        character (section 4.2, Q3, ISO-9001, GDPR, user_id), lowercased"""
+        tokens = (token.strip("./-") for token in _WORD.findall(query))
+        return frozenset(
+            token.lower() for token in tokens
+            if any(c.isdigit() or c == "_" for c in token) or any(c.isupper() for c in token[1:])
+        )
+
+    def _expired(self, entry: CachedAnswer) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: Tuple[str, str]):
+        self._entries.pop(key, None)
+        keys = self._keys_by_pdf.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_pdf[key[0]]
+        self._matrix_by_pdf.pop(key[0], None)
+
+    def get_exact(self, pdf_id: str, query: str) -> Optional[CachedAnswer]:
+        key = (pdf_id, self.normalize(query))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        self.exact_hits += 1
+        CACHE_LOOKUPS.inc(cache="answer", result="exact_hit")
+        return entry
+
+    def get_similar(self, pdf_id: str, query: str, query_embedding: np.ndarray) -> Optional[CachedAnswer]:
+        """Best cached answer for a near-duplicate query; counts a miss when none qualifies"""
+        if pdf_id not in self._keys_by_pdf:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="answer", result="miss")
+            return None
+
+        if pdf_id not in self._matrix_by_pdf:
+            keys = [
+                key for key in self._keys_by_pdf[pdf_id]
+                if self._entries[key].embedding is not None
+            ]
+            matrix = (
+                np.stack([self._entries[key].embedding for key in keys])
+                if keys else np.empty((0, len(query_embedding)), dtype=np.float32)
+            )
+            self._matrix_by_pdf[pdf_id] = (keys, matrix)
+
+        keys, matrix = self._matrix_by_pdf[pdf_id]
+        scores = matrix @ query_embedding
+        identifiers = self.identifiers(query)
+        # Best first among the candidates above the threshold; an expired or
+        # mismatched one passes the lookup on to the next
+        candidates = np.flatnonzero(scores >= self.similarity_threshold)
+        for best in candidates[np.argsort(-scores[candidates], kind="stable")]:
+            key = keys[best]
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                continue
+            if entry.identifiers != identifiers:
+                continue
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            CACHE_LOOKUPS.inc(cache="answer", result="semantic_hit")
+            return entry
+
+        self.misses += 1
+        CACHE_LOOKUPS.inc(cache="answer", result="miss")
+        return None
+
+    def put(
+        self,
+        pdf_id: str,
+        query: str,
+        response: str,
+        sources: List[dict],
+        query_embedding: Optional[np.ndarray] = None
+    ):
+        key = (pdf_id, self.normalize(query))
+        self._remove(key)
+        self._entries[key] = CachedAnswer(
+            pdf_id, query, response, sources, query_embedding, self.identifiers(query)
+        )
+        self._keys_by_pdf.setdefault(pdf_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_pdf(self, pdf_id: str) -> int:
+        """Drop every cached answer for a PDF"""
+        keys = list(self._keys_by_pdf.get(pdf_id, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
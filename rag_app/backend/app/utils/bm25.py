@@ -0,0 +1,141 @@
+# app/utils/bm25.py
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import re
+import numpy as np
+
+# Keeps identifiers such as "XJ-2000", "E_404" or "v2.3.1" together as one token
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_SEPARATORS_RE = re.compile(r"[-_./:]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this "
+    "to was were what when where which who will with how does do did about".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of text. Compound identifiers are indexed whole and
+    also by their parts, so "XJ-2000" matches queries for "xj-2000" and "2000"."""
+    tokens = [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+    compounds = [token for token in tokens if not token.isalnum()]
+    for token in compounds:
+        tokens.extend(part for part in _SEPARATORS_RE.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one PDF, stored as a compressed sparse
+    (CSR-style) inverted index: a sorted vocabulary, per-term posting offsets,
+    and flat arrays of chunk ids and term frequencies. Term lookup is a binary
+    search on the vocabulary, so loading needs no per-term Python objects."""
+
+    def __init__(
+        self,
+        vocabulary: np.ndarray,
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(doc_lengths)
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs and doc_lengths.any() else 1.0
+        # Per-chunk part of the BM25 denominator, computed once
+        self._length_norm = (k1 * (1 - b + b * doc_lengths / avg_length)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        term_numbers: Dict[str, int] = {}
+        term_column, doc_column, freq_column = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            term_column.extend(term_numbers.setdefault(term, len(term_numbers)) for term in counts)
+            doc_column.extend([doc_id] * len(counts))
+            freq_column.extend(counts.values())
+
+        # Renumber terms in sorted order, then group postings by term
+        vocabulary = np.asarray(list(term_numbers), dtype=str) if term_numbers else np.empty(0, dtype="<U1")
+        order = np.argsort(vocabulary, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        terms = rank[np.asarray(term_column, dtype=np.int64)]
+        postings = np.argsort(terms, kind="stable")  # keeps chunk ids ascending within a term
+
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=offsets[1:])
+        doc_ids = np.asarray(doc_column, dtype=np.int32)[postings]
+        term_freqs = np.minimum(
+            np.asarray(freq_column, dtype=np.int64)[postings], np.iinfo(np.uint16).max
+        ).astype(np.uint16)
+        return cls(vocabulary[order], offsets, doc_ids, term_freqs, doc_lengths, k1, b)
+
+    def _term_rows(self, query: str) -> np.ndarray:
+        terms = np.asarray(sorted(set(tokenize(query))), dtype=str)
+        if len(terms) == 0 or len(self.vocabulary) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.vocabulary, terms)
+        in_range = rows < len(self.vocabulary)
+        rows, terms = rows[in_range], terms[in_range]
+        return rows[self.vocabulary[rows] == terms]
+
+    def search(self, query: str, top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(chunk_ids, scores) of chunks sharing a term with the query, best first"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for row in self._term_rows(query):
+            start, end = self.offsets[row], self.offsets[row + 1]
+            ids = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            scores[ids] += self.idf[row] * freqs * (self.k1 + 1) / (freqs + self._length_norm[ids])
+
+        hits = np.flatnonzero(scores)
+        if top_k is not None and top_k < len(hits):
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return hits, scores[hits]
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                vocabulary=self.vocabulary,
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                params=np.asarray([self.k1, self.b], dtype=np.float64)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = (float(x) for x in data["params"])
+            return cls(
+                data["vocabulary"], data["offsets"], data["doc_ids"],
+                data["term_freqs"], data["doc_lengths"], k1, b
+            )
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse best-first rankings of chunk ids: score(d) = sum 1 / (k + rank(d)),
+    with ranks starting at 1. Returns (chunk_id, fused_score), best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
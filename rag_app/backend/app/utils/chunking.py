@@ -0,0 +1,210 @@
+# app/utils/chunking.py
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+import re
+import numpy as np
+
+# Counts tokens for a batch of texts (without special tokens)
+TokenCounter = Callable[[List[str]], List[int]]
+# Embeds a batch of texts as normalized float32 rows
+Embedder = Callable[[List[str]], np.ndarray]
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Whitespace-normalized sentences of text, using the chunker's boundaries"""
+    sentences = (
+        " ".join(sentence.split())
+        for paragraph in _PARAGRAPH_SPLIT.split(text)
+        for sentence in _SENTENCE_SPLIT.split(paragraph)
+    )
+    return [sentence for sentence in sentences if sentence]
+
+
+@dataclass
+class Chunk:
+    text: str
+    page_start: int
+    page_end: int
+    token_count: int
+
+
+@dataclass
+class _Piece:
+    text: str
+    page: int
+    tokens: int
+    paragraph_end: bool = False
+
+
+class Chunker:
+    """Splits per-page PDF text into chunks that fit the embedding model.
+
+    Strategies:
+      - "fixed": sliding window of max_tokens over words, with overlap_tokens of overlap
+      - "recursive": paragraphs, then sentences, then words, merged greedily up to
+        max_tokens while preferring paragraph and sentence boundaries
+      - "semantic": consecutive sentences grouped until the embedding similarity
+        between neighbours drops below semantic_threshold or the budget is reached
+    """
+
+    STRATEGIES = ("fixed", "recursive", "semantic")
+
+    def __init__(
+        self,
+        count_tokens: TokenCounter,
+        strategy: str = "recursive",
+        max_tokens: int = 240,
+        overlap_tokens: int = 32,
+        semantic_threshold: float = 0.6,
+        embed: Optional[Embedder] = None
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {self.STRATEGIES}")
+        if strategy == "semantic" and embed is None:
+            raise ValueError("The semantic chunking strategy needs an embedding function")
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.count_tokens = count_tokens
+        self.strategy = strategy
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.semantic_threshold = semantic_threshold
+        self.embed = embed
+
+    def chunk(self, pages: Sequence[Tuple[int, str]]) -> List[Chunk]:
+        """Chunk (page_number, text) pairs in page order"""
+        if self.strategy == "fixed":
+            return self._fixed(self._words(pages))
+        if self.strategy == "recursive":
+            return self._recursive(pages)
+        return self._semantic(pages)
+
+    # ------------------------------------------------------------ splitting
+
+    def _words(self, pages: Sequence[Tuple[int, str]]) -> List[_Piece]:
+        words = [(word, page_no) for page_no, text in pages for word in text.split()]
+        counts = self.count_tokens([word for word, _ in words]) if words else []
+        return [_Piece(word, page_no, max(1, count)) for (word, page_no), count in zip(words, counts)]
+
+    def _sentences(self, pages: Sequence[Tuple[int, str]]) -> List[_Piece]:
+        """Sentences tagged with their page; paragraph ends are marked"""
+        raw = []
+        for page_no, text in pages:
+            for paragraph in _PARAGRAPH_SPLIT.split(text):
+                sentences = [
+                    " ".join(sentence.split())
+                    for sentence in _SENTENCE_SPLIT.split(paragraph)
+                ]
+                sentences = [sentence for sentence in sentences if sentence]
+                for i, sentence in enumerate(sentences):
+                    raw.append((sentence, page_no, i == len(sentences) - 1))
+
+        counts = self.count_tokens([sentence for sentence, _, _ in raw]) if raw else []
+        pieces = []
+        for (sentence, page_no, paragraph_end), count in zip(raw, counts):
+            if count <= self.max_tokens:
+                pieces.append(_Piece(sentence, page_no, max(1, count), paragraph_end))
+                continue
+            # A sentence longer than the budget falls back to word windows without overlap
+            for chunk in self._fixed(self._words([(page_no, sentence)]), overlap=0):
+                pieces.append(_Piece(chunk.text, page_no, chunk.token_count))
+            pieces[-1].paragraph_end = paragraph_end
+        return pieces
+
+    # ----------------------------------------------------------- strategies
+
+    def _fixed(self, words: List[_Piece], overlap: Optional[int] = None) -> List[Chunk]:
+        overlap = self.overlap_tokens if overlap is None else overlap
+        chunks = []
+        start = 0
+        while start < len(words):
+            end = start
+            tokens = 0
+            while end < len(words) and (tokens + words[end].tokens <= self.max_tokens or end == start):
+                tokens += words[end].tokens
+                end += 1
+            chunks.append(self._make_chunk(words[start:end], " "))
+            if end >= len(words):
+                break
+
+            # Step back so the next window starts with ~overlap tokens of this one
+            next_start = end
+            carried = 0
+            while next_start > start + 1 and carried + words[next_start - 1].tokens <= overlap:
+                next_start -= 1
+                carried += words[next_start].tokens
+            start = next_start
+        return chunks
+
+    def _recursive(self, pages: Sequence[Tuple[int, str]]) -> List[Chunk]:
+        pieces = self._sentences(pages)
+        chunks = []
+        current: List[_Piece] = []
+        tokens = 0
+        for piece in pieces:
+            if current and tokens + piece.tokens > self.max_tokens:
+                chunks.append(self._make_chunk(current))
+                current, tokens = self._overlap_tail(current)
+                # Drop the carried context if the next piece still wouldn't fit
+                if tokens + piece.tokens > self.max_tokens:
+                    current, tokens = [], 0
+            current.append(piece)
+            tokens += piece.tokens
+        if current:
+            chunks.append(self._make_chunk(current))
+        return chunks
+
+    def _semantic(self, pages: Sequence[Tuple[int, str]]) -> List[Chunk]:
+        pieces = self._sentences(pages)
+        if not pieces:
+            return []
+        embeddings = np.asarray(self.embed([piece.text for piece in pieces]), dtype=np.float32)
+        neighbour_similarity = np.einsum("ij,ij->i", embeddings[1:], embeddings[:-1])
+
+        chunks = []
+        current = [pieces[0]]
+        tokens = pieces[0].tokens
+        for i, piece in enumerate(pieces[1:]):
+            topic_shift = neighbour_similarity[i] < self.semantic_threshold
+            if topic_shift or tokens + piece.tokens > self.max_tokens:
+                chunks.append(self._make_chunk(current))
+                current, tokens = [], 0
+            current.append(piece)
+            tokens += piece.tokens
+        chunks.append(self._make_chunk(current))
+        return chunks
+
+    # -------------------------------------------------------------- helpers
+
+    def _overlap_tail(self, pieces: List[_Piece]) -> Tuple[List[_Piece], int]:
+        """Trailing pieces totalling at most overlap_tokens, carried into the next chunk"""
+        tail: List[_Piece] = []
+        tokens = 0
+        for piece in reversed(pieces[1:]):
+            if tokens + piece.tokens > self.overlap_tokens:
+                break
+            tail.insert(0, piece)
+            tokens += piece.tokens
+        return tail, tokens
+
+    @staticmethod
+    def _make_chunk(pieces: List[_Piece], separator: Optional[str] = None) -> Chunk:
+        if separator is not None:
+            text = separator.join(piece.text for piece in pieces)
+        else:
+            # Keep paragraph breaks visible to the model and the prompt
+            parts = []
+            for i, piece in enumerate(pieces):
+                parts.append(piece.text)
+                if i < len(pieces) - 1:
+                    parts.append("\n\n" if piece.paragraph_end else " ")
+            text = "".join(parts)
+        return Chunk(
+            text=text,
+            page_start=pieces[0].page,
+            page_end=pieces[-1].page,
+            token_count=sum(piece.tokens for piece in pieces)
+        )
@@ -0,0 +1,167 @@
+# app/utils/context_builder.py
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+from .bm25 import BM25Index
+from .chunking import TokenCounter, split_sentences
+
+_WORD = re.compile(r"\S+")
+
+
+@dataclass
+class Passage:
+    text: str
+    page_start: Optional[int]
+    page_end: Optional[int]
+    rank: int  # best retrieval rank among the chunks merged into it
+
+
+@dataclass
+class PackedContext:
+    passages: List[Passage]
+    tokens_before: int
+    tokens_after: int
+
+
+def _overlap_words(previous: str, following: str) -> int:
+    """Number of leading words of `following` that repeat the tail of `previous`"""
+    tail, head = previous.split(), following.split()
+    for length in range(min(len(tail), len(head)), 0, -1):
+        if tail[-length:] == head[:length]:
+            return length
+    return 0
+
+
+def _drop_words(text: str, count: int) -> str:
+    """text without its first `count` words, keeping the rest's whitespace"""
+    if count == 0:
+        return text
+    for i, match in enumerate(_WORD.finditer(text), start=1):
+        if i == count:
+            return text[match.end():].strip()
+    return ""
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into the prompt context under a token budget.
+
+    1. Chunks of the same PDF with consecutive chunk indexes are merged, and
+       the overlap the chunker repeats between neighbours is dropped.
+    2. Sentences already present in a more relevant passage are dropped.
+    3. If the rest is still over max_tokens, the sentences most relevant to
+       the query (BM25 over the candidate sentences, ties going to better
+       ranked passages) are kept in document order, with gaps marked "...".
+
+    max_tokens <= 0 disables step 3.
+    """
+
+    def __init__(self, count_tokens: TokenCounter, max_tokens: int = 600):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+
+    def build(self, query: str, sources: Sequence[Dict]) -> PackedContext:
+        """Passages for the prompt from ranked sources (dicts with text, pdf_id,
+        chunk_index, page_start, page_end), most relevant passage first"""
+        if not sources:
+            return PackedContext([], 0, 0)
+
+        passages = self._merge(sources)
+
+        # Candidate sentences in passage order; exact repeats keep the first copy
+        seen = set()
+        sentences: List[Tuple[int, int, str]] = []  # (passage, position, text)
+        for passage_no, passage in enumerate(passages):
+            for position, sentence in enumerate(split_sentences(passage.text)):
+                key = sentence.lower()
+                if key not in seen:
+                    seen.add(key)
+                    sentences.append((passage_no, position, sentence))
+        if not sentences:
+            return PackedContext([], 0, 0)
+
+        counts = self.count_tokens([source["text"] for source in sources] + [s for _, _, s in sentences])
+        tokens_before = sum(counts[:len(sources)])
+        sentence_tokens = counts[len(sources):]
+
+        keep = self._select(query, sentences, sentence_tokens)
+
+        # Kept sentences per passage; a gap left by the budget (not by dedup) is marked
+        kept: Dict[int, List[str]] = {}
+        previous: Dict[int, int] = {}
+        for i, ((passage_no, _, text), selected) in enumerate(zip(sentences, keep)):
+            if not selected:
+                continue
+            parts = kept.setdefault(passage_no, [])
+            parts.append(f"... {text}" if parts and previous[passage_no] != i - 1 else text)
+            previous[passage_no] = i
+        packed = [
+            Passage(" ".join(kept[passage_no]), passage.page_start, passage.page_end, passage.rank)
+            for passage_no, passage in enumerate(passages) if passage_no in kept
+        ]
+
+        tokens_after = sum(count for count, selected in zip(sentence_tokens, keep) if selected)
+        return PackedContext(packed, tokens_before, tokens_after)
+
+    @staticmethod
+    def _merge(sources: Sequence[Dict]) -> List[Passage]:
+        """Merge runs of adjacent chunks of the same PDF, ordered by best rank"""
+        by_pdf: Dict[object, List[Tuple[int, int, Dict]]] = {}
+        loose: List[Passage] = []
+        for rank, source in enumerate(sources):
+            if source.get("chunk_index") is None:
+                loose.append(Passage(source["text"], source.get("page_start"), source.get("page_end"), rank))
+            else:
+                by_pdf.setdefault(source.get("pdf_id"), []).append((source["chunk_index"], rank, source))
+
+        passages = loose
+        for entries in by_pdf.values():
+            entries.sort(key=lambda entry: entry[0])
+            current: Optional[Passage] = None
+            last_index = None
+            for chunk_index, rank, source in entries:
+                if current is not None and chunk_index == last_index:
+                    current.rank = min(current.rank, rank)  # same chunk retrieved twice
+                    continue
+                if current is not None and chunk_index == last_index + 1:
+                    rest = _drop_words(source["text"], _overlap_words(current.text, source["text"]))
+                    if rest:
+                        current.text = f"{current.text} {rest}"
+                    current.rank = min(current.rank, rank)
+                    if source.get("page_end") is not None:
+                        current.page_end = max(current.page_end or 0, source["page_end"])
+                else:
+                    current = Passage(source["text"], source.get("page_start"), source.get("page_end"), rank)
+                    passages.append(current)
+                last_index = chunk_index
+
+        passages.sort(key=lambda passage: passage.rank)
+        return passages
+
+    def _select(
+        self,
+        query: str,
+        sentences: List[Tuple[int, int, str]],
+        sentence_tokens: List[int]
+    ) -> List[bool]:
+        """Which sentences fit the budget, most relevant first"""
+        if self.max_tokens <= 0 or sum(sentence_tokens) <= self.max_tokens:
+            return [True] * len(sentences)
+
+        relevance = [0.0] * len(sentences)
+        ids, scores = BM25Index.build([text for _, _, text in sentences]).search(query)
+        for i, score in zip(ids.tolist(), scores.tolist()):
+            relevance[i] = score
+
+        order = sorted(
+            range(len(sentences)),
+            key=lambda i: (-relevance[i], sentences[i][0], sentences[i][1])
+        )
+        keep = [False] * len(sentences)
+        budget = self.max_tokens
+        for i in order:
+            if sentence_tokens[i] <= budget:
+                keep[i] = True
+                budget -= sentence_tokens[i]
+        if not any(keep):
+            keep[order[0]] = True  # never send an empty context
+        return keep
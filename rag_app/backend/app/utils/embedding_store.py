@@ -0,0 +1,234 @@
+# app/utils/embedding_store.py
+from typing import Dict, List, Optional, Tuple, Union
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from ..config import settings
+from .bm25 import BM25Index
+from .quantization import QuantizedVectors, get_codec
+
+
+class EmbeddingStore:
+    """Disk-backed store of chunk texts and their float32 embedding matrix, keyed by pdf_id.
+
+    With a quantization codec the embeddings are also kept as compact codes
+    (codes.npy plus the codec's parameters), which searches scan before
+    rescoring their best candidates against the float32 matrix.
+    """
+
+    CHUNKS_FILE = "chunks.json"
+    EMBEDDINGS_FILE = "embeddings.npy"
+    PAGES_FILE = "pages.npy"
+    LEXICAL_FILE = "bm25.npz"
+    CODES_FILE = "codes.npy"
+    CODEC_FILE = "codec.npz"
+    # Random token in the root and in each entry, renewed on every change
+    VERSION_FILE = "version"
+
+    def __init__(self, root_dir: str, quantization: str = "none", rescore_candidates: int = 200):
+        self.root_dir = root_dir
+        self.quantization = quantization
+        self.rescore_candidates = rescore_candidates
+        if quantization != "none":
+            get_codec(quantization)  # fail at startup on a typo
+        os.makedirs(self.root_dir, exist_ok=True)
+        if self._read_version(self.root_dir) is None:
+            self._write_version(self.root_dir)
+
+    def _path(self, pdf_id: str) -> str:
+        return os.path.join(self.root_dir, pdf_id)
+
+    def exists(self, pdf_id: str) -> bool:
+        return os.path.exists(os.path.join(self._path(pdf_id), self.EMBEDDINGS_FILE))
+
+    def save(
+        self,
+        pdf_id: str,
+        chunks: List[str],
+        embeddings: np.ndarray,
+        chunk_pages: Optional[List[Tuple[int, int]]] = None,
+        lexical_index: Optional[BM25Index] = None
+    ) -> None:
+        """Persist chunks, embeddings, the page range of each chunk and the
+        chunks' BM25 index, replacing any previous entry atomically"""
+        if len(chunks) != len(embeddings):
+            raise ValueError(
+                f"Chunk count ({len(chunks)}) does not match embedding count ({len(embeddings)})"
+            )
+
+        target_dir = self._path(pdf_id)
+        tmp_dir = f"{target_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        with open(os.path.join(tmp_dir, self.CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        np.save(
+            os.path.join(tmp_dir, self.EMBEDDINGS_FILE),
+            np.ascontiguousarray(embeddings, dtype=np.float32)
+        )
+        if chunk_pages is not None:
+            np.save(
+                os.path.join(tmp_dir, self.PAGES_FILE),
+                np.asarray(chunk_pages, dtype=np.int32).reshape(len(chunks), 2)
+            )
+        if lexical_index is not None:
+            lexical_index.save(os.path.join(tmp_dir, self.LEXICAL_FILE))
+        if self.quantization != "none":
+            self._write_codes(tmp_dir, embeddings)
+        self._write_version(tmp_dir)
+
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.replace(tmp_dir, target_dir)
+        self._write_version(self.root_dir)
+
+    def load(self, pdf_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        """Return (chunks, embeddings) for a PDF, or None if it was never ingested"""
+        if not self.exists(pdf_id):
+            return None
+
+        path = self._path(pdf_id)
+        with open(os.path.join(path, self.CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = json.load(f)
+        embeddings = np.load(os.path.join(path, self.EMBEDDINGS_FILE))
+        return chunks, embeddings
+
+    def _write_codes(self, path: str, embeddings: np.ndarray) -> None:
+        codec = get_codec(self.quantization)
+        codes, params = codec.encode(embeddings)
+        codes_path = os.path.join(path, self.CODES_FILE)
+        codec_path = os.path.join(path, self.CODEC_FILE)
+        # Unique temporary names: concurrent first loads may encode the same entry
+        suffix = uuid.uuid4().hex
+        np.save(f"{codes_path}.{suffix}.npy", codes)
+        with open(f"{codec_path}.{suffix}", "wb") as f:
+            np.savez(f, codec=np.asarray(codec.name), **params)
+        # Codes first: a codec file always describes the codes next to it
+        os.replace(f"{codes_path}.{suffix}.npy", codes_path)
+        os.replace(f"{codec_path}.{suffix}", codec_path)
+
+    def _load_codes(self, path: str) -> Optional[Tuple[np.ndarray, dict]]:
+        """Codes and parameters in the configured codec, or None if missing or
+        written with another codec"""
+        codec_path = os.path.join(path, self.CODEC_FILE)
+        if not os.path.exists(codec_path):
+            return None
+        with np.load(codec_path, allow_pickle=False) as data:
+            if str(data["codec"]) != self.quantization:
+                return None
+            params = {key: data[key] for key in data.files if key != "codec"}
+        return np.load(os.path.join(path, self.CODES_FILE), mmap_mode="r"), params
+
+    def load_vectors(self, pdf_id: str) -> Optional[Union[np.ndarray, QuantizedVectors]]:
+        """Memory-mapped embeddings of a PDF for search: the float32 matrix, or
+        QuantizedVectors when a quantization codec is configured. Codes missing
+        for the configured codec (older entries, or a codec change) are
+        written on first load."""
+        if not self.exists(pdf_id):
+            return None
+
+        path = self._path(pdf_id)
+        vectors = np.load(os.path.join(path, self.EMBEDDINGS_FILE), mmap_mode="r")
+        if self.quantization == "none":
+            return vectors
+
+        stored = self._load_codes(path)
+        if stored is None:
+            self._write_codes(path, vectors)
+            stored = self._load_codes(path)
+        codes, params = stored
+        return QuantizedVectors(
+            get_codec(self.quantization), codes, params, vectors, self.rescore_candidates
+        )
+
+    def load_chunks(self, pdf_id: str) -> Optional[List[str]]:
+        """Return only the chunk texts of a PDF, without reading its embeddings"""
+        path = os.path.join(self._path(pdf_id), self.CHUNKS_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_pages(self, pdf_id: str) -> Optional[np.ndarray]:
+        """(first_page, last_page) per chunk, or None if pages were not recorded"""
+        path = os.path.join(self._path(pdf_id), self.PAGES_FILE)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def load_lexical(self, pdf_id: str) -> Optional[BM25Index]:
+        """BM25 index of a PDF's chunks, or None if it was ingested before lexical indexing"""
+        path = os.path.join(self._path(pdf_id), self.LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        return BM25Index.load(path)
+
+    def save_lexical(self, pdf_id: str, lexical_index: BM25Index) -> None:
+        """Add a BM25 index to an existing entry"""
+        path = os.path.join(self._path(pdf_id), self.LEXICAL_FILE)
+        tmp_path = f"{path}.tmp"
+        lexical_index.save(tmp_path)
+        os.replace(tmp_path, path)
+
+    def list_ids(self) -> List[str]:
+        """All pdf_ids with stored embeddings"""
+        return [
+            name for name in os.listdir(self.root_dir)
+            if not name.endswith(".tmp") and self.exists(name)
+        ]
+
+    def _write_version(self, directory: str) -> None:
+        path = os.path.join(directory, self.VERSION_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, path)
+
+    def _read_version(self, directory: str) -> Optional[str]:
+        try:
+            with open(os.path.join(directory, self.VERSION_FILE)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def version(self) -> str:
+        """Changes whenever any process adds, replaces or deletes an entry.
+        A token rather than a timestamp: file times are too coarse to tell
+        apart two saves made in quick succession."""
+        return self._read_version(self.root_dir) or ""
+
+    def entry_version(self, pdf_id: str) -> Optional[str]:
+        """Changes when the entry is replaced; None if nothing is stored"""
+        path = self._path(pdf_id)
+        version = self._read_version(path)
+        if version is None and self.exists(pdf_id):
+            # Saved before entries had a version token
+            return f"mtime-{os.stat(os.path.join(path, self.EMBEDDINGS_FILE)).st_mtime_ns}"
+        return version
+
+    def entry_versions(self) -> Dict[str, str]:
+        """entry_version() of every stored pdf_id"""
+        versions = {}
+        for pdf_id in self.list_ids():
+            version = self.entry_version(pdf_id)
+            if version is not None:  # deleted since listing
+                versions[pdf_id] = version
+        return versions
+
+    def delete(self, pdf_id: str) -> bool:
+        """Drop stored vectors for a PDF; returns False if nothing was stored"""
+        path = self._path(pdf_id)
+        if not os.path.exists(path):
+            return False
+        shutil.rmtree(path)
+        self._write_version(self.root_dir)
+        return True
+
+
+embedding_store = EmbeddingStore(
+    settings.EMBEDDING_STORE_DIR,
+    settings.EMBEDDING_QUANTIZATION,
+    settings.EMBEDDING_RESCORE_CANDIDATES
+)
@@ -0,0 +1,84 @@
+# app/utils/executors.py
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import httpx
+from ..config import settings
+
+
+class Executors:
+    """Bounded pools for work that must not run on the event loop.
+
+    - thread pool: blocking I/O clients (Cloudinary, disk) and model inference
+      that releases the GIL (SentenceTransformer/torch)
+    - process pool: pure-Python CPU work that holds the GIL (PyPDF2 parsing)
+    - http client: one pooled httpx.AsyncClient shared by all requests
+    """
+
+    thread_pool: Optional[ThreadPoolExecutor] = None
+    process_pool: Optional[ProcessPoolExecutor] = None
+    http_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def get_thread_pool(cls) -> ThreadPoolExecutor:
+        if cls.thread_pool is None:
+            cls.thread_pool = ThreadPoolExecutor(
+                max_workers=settings.THREAD_POOL_WORKERS,
+                thread_name_prefix="rag-worker"
+            )
+        return cls.thread_pool
+
+    @classmethod
+    def get_process_pool(cls) -> ProcessPoolExecutor:
+        if cls.process_pool is None:
+            # spawn: children must not inherit the parent's model threads and sockets
+            cls.process_pool = ProcessPoolExecutor(
+                max_workers=settings.PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return cls.process_pool
+
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        if cls.http_client is None or cls.http_client.is_closed:
+            cls.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS
+                ),
+                follow_redirects=True
+            )
+        return cls.http_client
+
+    @classmethod
+    async def shutdown(cls):
+        if cls.http_client is not None:
+            await cls.http_client.aclose()
+            cls.http_client = None
+        if cls.thread_pool is not None:
+            cls.thread_pool.shutdown(wait=False, cancel_futures=True)
+            cls.thread_pool = None
+        if cls.process_pool is not None:
+            cls.process_pool.shutdown(wait=False, cancel_futures=True)
+            cls.process_pool = None
+
+
+async def run_in_thread(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on the bounded thread pool, in a copy of the caller's
+    context so that @timed stages inside it reach the request's timings"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        Executors.get_thread_pool(),
+        contextvars.copy_context().run,
+        functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_in_process(func: Callable, *args) -> Any:
+    """Run a picklable CPU-bound function on the bounded process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(Executors.get_process_pool(), func, *args)
@@ -0,0 +1,376 @@
+# app/utils/llm_client.py
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+import asyncio
+import hashlib
+import logging
+import random
+import time
+import httpx
+from ..config import settings
+from .executors import run_in_thread
+from .metrics import LLM_REQUESTS, record_llm_usage, track_stage
+
+# Statuses worth retrying: timeouts, rate limits and transient server errors
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass
+class LLMResponse:
+    """A completion, or one piece of a streamed completion. Token counts are
+    0 when the provider did not report them (or not in this piece)."""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class LLMError(Exception):
+    pass
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # google.api_core errors carry .code, openai errors .status_code, httpx errors .response
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from a Retry-After header"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMProvider:
+    """One LLM backend. generate returns the whole completion; stream yields
+    text pieces and may end with an empty-text piece carrying token counts."""
+
+    name = ""
+
+    async def load(self) -> None:
+        """Import and configure the client ahead of the first call"""
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, model_name: str = "gemini-pro", api_key: str = "", model=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = model
+
+    def _create_model(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(self.model_name)
+
+    async def load(self) -> None:
+        # Importing the SDK is slow; keep it off the event loop
+        if self._model is None:
+            self._model = await run_in_thread(self._create_model)
+
+    @staticmethod
+    def _usage(response) -> LLMResponse:
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            "",
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0
+        )
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        await self.load()
+        response = await self._model.generate_content_async(prompt)
+        usage = self._usage(response)
+        return LLMResponse(response.text, usage.prompt_tokens, usage.completion_tokens)
+
+    async def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        await self.load()
+        response = await self._model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield LLMResponse(chunk.text)
+        yield self._usage(response)
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, model_name: str = "gpt-4o-mini", api_key: str = ""):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._client = None
+
+    async def load(self) -> None:
+        if self._client is None:
+            from openai import AsyncOpenAI
+            # Retries and timeouts are handled by LLMClient, not the SDK
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        await self.load()
+        response = await self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0
+        )
+        usage = response.usage
+        return LLMResponse(
+            response.choices[0].message.content or "",
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0
+        )
+
+    async def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        await self.load()
+        response = await self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield LLMResponse(chunk.choices[0].delta.content)
+            if chunk.usage is not None:
+                yield LLMResponse("", chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+
+
+class StubProvider(LLMProvider):
+    """Deterministic offline provider for tests and local runs: the answer
+    depends only on the prompt, after an optional fixed latency."""
+
+    name = "stub"
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+
+    @staticmethod
+    def answer(prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        question = next(
+            (line[len("Question:"):].strip() for line in prompt.splitlines() if line.startswith("Question:")),
+            ""
+        )
+        return f"Stub answer {digest} to: {question}" if question else f"Stub answer {digest}."
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        text = self.answer(prompt)
+        return LLMResponse(text, len(prompt.split()), len(text.split()))
+
+    async def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        response = await self.generate(prompt)
+        for i, word in enumerate(response.text.split(" ")):
+            yield LLMResponse(word if i == 0 else " " + word)
+        yield LLMResponse("", response.prompt_tokens, response.completion_tokens)
+
+
+class TokenBucket:
+    """Request rate limiter: `rate` requests per second with bursts of up to
+    `capacity`. pause() empties the bucket for a while, so one 429 slows every
+    caller down instead of each of them discovering the limit separately."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = max(self._updated, now)
+
+
+class LLMClient:
+    """Calls a provider with the safeguards a shared quota needs:
+
+    - identical prompts already in flight share one call (coalescing)
+    - a token bucket caps the request rate and a semaphore caps concurrency
+    - each attempt has a timeout; timeouts, 429s and 5xx are retried with
+      full-jitter exponential backoff, honouring Retry-After on 429
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 0.0,
+        burst: int = 1,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0
+    ):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def warm_up(self):
+        await self.provider.load()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _on_error(self, error: BaseException, attempt: int) -> None:
+        """Sleep before the next attempt, or raise if the error is final"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            LLM_REQUESTS.inc(provider=self.provider.name, outcome="failed")
+            raise LLMError(f"{self.provider.name} call failed after {attempt + 1} attempt(s): {error!r}") from error
+
+        delay = self._backoff(attempt)
+        if _status_code(error) == 429:
+            LLM_REQUESTS.inc(provider=self.provider.name, outcome="rate_limited")
+            delay = max(delay, retry_after(error) or 0.0)
+            self.bucket.pause(delay)
+        elif isinstance(error, asyncio.TimeoutError):
+            LLM_REQUESTS.inc(provider=self.provider.name, outcome="timeout")
+        else:
+            LLM_REQUESTS.inc(provider=self.provider.name, outcome="retried")
+        logging.warning(f"LLM call failed ({error!r}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _generate(self, prompt: str) -> LLMResponse:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with track_stage("llm_wait"):
+                    await self.bucket.acquire()
+                    await self._semaphore.acquire()
+                try:
+                    response = await asyncio.wait_for(self.provider.generate(prompt), self.timeout)
+                finally:
+                    self._semaphore.release()
+                LLM_REQUESTS.inc(provider=self.provider.name, outcome="ok")
+                record_llm_usage(response.prompt_tokens, response.completion_tokens)
+                return response
+            except Exception as e:
+                await self._on_error(e, attempt)
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        """Complete a prompt, sharing the call with identical prompts in flight"""
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(prompt))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            LLM_REQUESTS.inc(provider=self.provider.name, outcome="coalesced")
+        # A caller that gives up (e.g. client disconnect) must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every caller went away
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream a completion's text. Attempts are retried only until the first
+        piece arrives; after that an error is raised to the caller."""
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                with track_stage("llm_wait"):
+                    await self.bucket.acquire()
+                    await self._semaphore.acquire()
+                try:
+                    pieces = self.provider.stream(prompt).__aiter__()
+                    while True:
+                        try:
+                            # The timeout bounds the wait for each piece, not the whole answer
+                            piece = await asyncio.wait_for(pieces.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if piece.prompt_tokens or piece.completion_tokens:
+                            record_llm_usage(piece.prompt_tokens, piece.completion_tokens)
+                        if piece.text:
+                            started = True
+                            yield piece.text
+                finally:
+                    self._semaphore.release()
+                    await pieces.aclose()
+                LLM_REQUESTS.inc(provider=self.provider.name, outcome="ok")
+                return
+            except Exception as e:
+                if started:
+                    LLM_REQUESTS.inc(provider=self.provider.name, outcome="failed")
+                    raise LLMError(f"{self.provider.name} stream failed: {e!r}") from e
+                await self._on_error(e, attempt)
+
+
+def create_provider(name: str) -> LLMProvider:
+    model_name = settings.LLM_MODEL_NAME
+    if name == "gemini":
+        return GeminiProvider(model_name or "gemini-pro", settings.GEMINI_API_KEY)
+    if name == "openai":
+        return OpenAIProvider(model_name or "gpt-4o-mini", settings.OPENAI_API_KEY)
+    if name == "stub":
+        return StubProvider(settings.LLM_STUB_LATENCY_SECONDS)
+    raise ValueError(f"Unknown LLM provider '{name}', expected 'gemini', 'openai' or 'stub'")
+
+
+def create_llm_client(provider: Optional[LLMProvider] = None) -> LLMClient:
+    """LLMClient configured from settings, for the configured provider by default"""
+    return LLMClient(
+        provider or create_provider(settings.LLM_PROVIDER),
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+        burst=settings.LLM_BURST,
+        timeout=settings.LLM_TIMEOUT_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        backoff_base=settings.LLM_BACKOFF_BASE_SECONDS,
+        backoff_max=settings.LLM_BACKOFF_MAX_SECONDS
+    )
@@ -0,0 +1,288 @@
+# app/utils/metrics.py
+# Dependency-free Prometheus-style metrics. Each worker process keeps its own
+# registry; scrape every worker (or run one) to see the whole picture.
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import functools
+import inspect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+))
+STAGE_SECONDS = registry.register(Histogram(
+    "rag_stage_duration_seconds", "Latency of RAG pipeline stages", ("stage",)
+))
+STAGE_ERRORS = registry.register(Counter(
+    "rag_stage_errors_total", "RAG pipeline stages that raised", ("stage",)
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result")
+))
+CHUNKS_INGESTED = registry.register(Counter(
+    "rag_chunks_ingested_total", "Chunks produced by PDF ingestion"
+))
+CHUNKS_PER_DOCUMENT = registry.register(Histogram(
+    "rag_chunks_per_document", "Chunks per ingested PDF",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+))
+CHUNKS_RETRIEVED = registry.register(Counter(
+    "rag_chunks_retrieved_total", "Chunks passed to the LLM as context"
+))
+BYTES_DOWNLOADED = registry.register(Counter(
+    "rag_download_bytes_total", "Bytes of PDF downloaded from Cloudinary"
+))
+BYTES_UPLOADED = registry.register(Counter(
+    "rag_upload_bytes_total", "Bytes of PDF received by /upload_pdf"
+))
+LLM_TOKENS = registry.register(Counter(
+    "rag_llm_tokens_total", "LLM tokens reported by the provider", ("type",)
+))
+LLM_REQUESTS = registry.register(Counter(
+    "rag_llm_requests_total", "LLM calls by provider and outcome", ("provider", "outcome")
+))
+CONTEXT_TOKENS = registry.register(Histogram(
+    "rag_context_tokens", "Prompt context tokens before and after packing", ("stage",),
+    buckets=(50, 100, 250, 500, 750, 1000, 1500, 2500, 5000, 10000)
+))
+RERANKS = registry.register(Counter(
+    "rag_rerank_total", "Cross-encoder reranking calls by outcome", ("outcome",)
+))
+WEBSOCKET_MESSAGES = registry.register(Counter(
+    "rag_websocket_messages_total", "Websocket messages handled", ("type",)
+))
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def _record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def track_stage(name: str) -> Iterator[None]:
+    """Time a block as pipeline stage `name`"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        _record_stage(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator form of track_stage for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int) -> None:
+    """Count the prompt/completion tokens a provider reported"""
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, type="completion")
+
+
+@contextmanager
+def collect_timings() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the (stage, seconds) timings recorded inside the block"""
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def timings_ms(timings: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Milliseconds per stage; repeated stages (e.g. extraction batches) are summed"""
+    merged: Dict[str, float] = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds * 1000
+    return {name: round(ms, 1) for name, ms in merged.items()}
+
+
+def _server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    parts = [f"{name};dur={ms}" for name, ms in timings_ms(timings).items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and adding a Server-Timing
+    header with the stages that ran before the response started."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+
+        with collect_timings() as timings:
+            async def send_wrapper(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((
+                        b"server-timing",
+                        _server_timing(timings, time.perf_counter() - started).encode("latin-1")
+                    ))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # The router stores the matched route in the scope; use its template, not the raw path
+                route = getattr(scope.get("route"), "path", None) \
+                    or getattr(scope.get("endpoint"), "__name__", None) \
+                    or "unmatched"
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started,
+                    method=scope["method"],
+                    route=route,
+                    status=str(status_code)
+                )
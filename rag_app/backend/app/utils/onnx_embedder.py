@@ -0,0 +1,176 @@
+# app/utils/onnx_embedder.py
+"""Sentence embeddings on ONNX Runtime, without PyTorch.
+
+The model directory is produced once by exporting the sentence-transformers
+model (this needs torch and sentence-transformers, the serving nodes don't):
+
+    python -m app.utils.onnx_embedder --model all-MiniLM-L6-v2 --output data/onnx/all-MiniLM-L6-v2
+
+It holds model.onnx (weights dynamically quantized to int8 unless
+--no-quantize), the tokenizer files and embedder.json with the pooling
+settings. benchmarks.embedding_parity checks the result against the
+original model.
+
+Like app.embedding_server, this module does not import app.config.
+"""
+from typing import Dict, Iterator, List, Sequence, Union
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+
+CONFIG_FILE = "embedder.json"
+MODEL_FILE = "model.onnx"
+
+
+class OnnxEmbedder:
+    """Mean-pooled transformer embeddings computed with ONNX Runtime.
+
+    encode() follows SentenceTransformer.encode, so PDFProcessor uses either
+    backend the same way. Texts are tokenized once, sorted by length and cut
+    into batches that hold at most batch_size texts and max_batch_tokens
+    padded tokens; each batch is padded only to its longest text, so short
+    queries never pay for a long chunk's padding.
+    """
+
+    def __init__(self, model_dir: str, intra_op_threads: int = 0, max_batch_tokens: int = 8192):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            config = json.load(f)
+        self.max_seq_length = int(config["max_seq_length"])
+        self.normalize = bool(config.get("normalize", False))
+        self.max_batch_tokens = max_batch_tokens
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets ONNX Runtime use one thread per physical core
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.dim = int(config["dim"])
+
+    def _batches(self, lengths: np.ndarray, batch_size: int) -> Iterator[np.ndarray]:
+        """Row numbers grouped into batches of similar length, shortest first"""
+        order = np.argsort(lengths, kind="stable")
+        start = 0
+        while start < len(order):
+            end = start + 1
+            # Rows are sorted, so the last one sets the padded width
+            while (
+                end < len(order)
+                and end - start < batch_size
+                and (end - start + 1) * lengths[order[end]] <= self.max_batch_tokens
+            ):
+                end += 1
+            yield order[start:end]
+            start = end
+
+    def _run(self, input_ids: List[List[int]]) -> np.ndarray:
+        """Mean-pooled embeddings of one batch of token id lists"""
+        width = max(len(ids) for ids in input_ids)
+        ids = np.full((len(input_ids), width), self.tokenizer.pad_token_id or 0, dtype=np.int64)
+        mask = np.zeros((len(input_ids), width), dtype=np.int64)
+        for row, row_ids in enumerate(input_ids):
+            ids[row, :len(row_ids)] = row_ids
+            mask[row, :len(row_ids)] = 1
+
+        feeds: Dict[str, np.ndarray] = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if texts:
+            input_ids = self.tokenizer(
+                texts, truncation=True, max_length=self.max_seq_length
+            )["input_ids"]
+            lengths = np.asarray([len(ids) for ids in input_ids])
+            for rows in self._batches(lengths, max(batch_size, 1)):
+                embeddings[rows] = self._run([input_ids[row] for row in rows])
+            if self.normalize or normalize_embeddings:
+                embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+def export_model(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> None:
+    """Export a sentence-transformers model (transformer + mean pooling) to output_dir"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    started = time.perf_counter()
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = model[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name} does not use mean pooling, which OnnxEmbedder implements")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    float_path = f"{model_path}.float32" if quantize else model_path
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            float_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(float_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(float_path)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "dim": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            # all-MiniLM-L6-v2 ends in a Normalize module: its output is always unit length
+            "normalize": any(type(module).__name__ == "Normalize" for module in model),
+            "quantized": quantize
+        }, f, indent=2)
+    logging.info(f"Exported {model_name} to {output_dir} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model for the ONNX backend")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--no-quantize", action="store_true", help="Keep float32 weights")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    export_model(args.model, args.output, quantize=not args.no_quantize, opset=args.opset)
+
+
+if __name__ == "__main__":
+    main()
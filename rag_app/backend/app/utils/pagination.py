@@ -0,0 +1,42 @@
+# app/utils/pagination.py
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+from bson import ObjectId
+
+# List endpoints return newest first; _id breaks ties between equal timestamps
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+# Offset pages were replaced by cursors; a non-zero skip from an old client gets this back
+SKIP_UNSUPPORTED = "skip is no longer supported; pass the X-Next-Cursor header of the previous page as cursor"
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just after doc in newest-first order"""
+    payload = json.dumps({"created_at": doc["created_at"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def keyset_filter(cursor: Optional[str]) -> dict:
+    """MongoDB filter for the documents after cursor in newest-first order.
+    Raises ValueError for a malformed cursor."""
+    if not cursor:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at = datetime.fromisoformat(payload["created_at"])
+        last_id = ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}}
+    ]}
+
+
+def next_cursor(docs: list, limit: int) -> Optional[str]:
+    """Cursor for the following page, or None when this page was the last"""
+    if len(docs) < limit or not docs:
+        return None
+    return encode_cursor(docs[-1])
@@ -0,0 +1,165 @@
+# app/utils/pdf_cache.py
+from collections import OrderedDict
+from typing import Dict, Optional
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from ..config import settings
+from .executors import Executors, run_in_thread
+from .metrics import BYTES_DOWNLOADED, CACHE_LOOKUPS, track_stage
+
+
+class PDFCache:
+    """Disk-backed LRU cache of PDF files keyed by cloudinary_public_id.
+
+    Entries are written to a temporary file and renamed into place, so readers
+    never see partial downloads. Total size is bounded by max_bytes; the least
+    recently used files are evicted first. Recency survives restarts through
+    file mtimes.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._download_locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        files = []
+        for name in os.listdir(self.root_dir):
+            path = os.path.join(self.root_dir, name)
+            if name.endswith(".pdf") and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+            elif name.endswith(".part"):
+                os.remove(path)
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        # Public ids may contain folders and other characters unsafe for file names
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pdf"
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_dir, name)
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Path of a cached PDF, marking it most recently used; None on a miss"""
+        name = self._file_name(key)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self._path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return path
+
+    def _forget(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _commit(self, name: str, tmp_path: str):
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self._path(name))
+        with self._lock:
+            self._forget(name)
+            self._entries[name] = size
+            self._total_bytes += size
+            self._evict(keep=name)
+
+    def _evict(self, keep: str):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name = next(iter(self._entries))
+            if name == keep:
+                self._entries.move_to_end(name)
+                continue
+            self._forget(name)
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            logging.info(f"Evicted {name} from PDF cache")
+
+    def part_path(self) -> str:
+        """A fresh temporary path inside the cache directory, for spooling a file
+        that put_file will then move into place; leftovers are removed on startup"""
+        return self._path(f"spool.{time.monotonic_ns()}.{threading.get_ident()}.part")
+
+    def put_file(self, key: str, path: str) -> str:
+        """Move a file already on disk (e.g. a spooled upload) into the cache"""
+        name = self._file_name(key)
+        self._commit(name, path)
+        return self._path(name)
+
+    def invalidate(self, key: str) -> bool:
+        name = self._file_name(key)
+        with self._lock:
+            present = name in self._entries
+            self._forget(name)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+        return present
+
+    async def fetch(self, key: str, url: str) -> str:
+        """Return the cached path for key, streaming it from url to disk on a miss"""
+        path = self.get_path(key)
+        if path is not None:
+            CACHE_LOOKUPS.inc(cache="pdf", result="hit")
+            return path
+        CACHE_LOOKUPS.inc(cache="pdf", result="miss")
+
+        lock = self._download_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request may have finished the download while we waited
+            path = self.get_path(key)
+            if path is not None:
+                return path
+
+            name = self._file_name(key)
+            tmp_path = f"{self._path(name)}.{time.monotonic_ns()}.part"
+            try:
+                if url.startswith("file://"):
+                    # Stored by the local storage backend: copy instead of downloading
+                    with track_stage("download"):
+                        await run_in_thread(shutil.copyfile, url2pathname(urlparse(url).path), tmp_path)
+                    await run_in_thread(self._commit, name, tmp_path)
+                    return self._path(name)
+
+                client = Executors.get_http_client()
+                with track_stage("download"):
+                    async with client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        with open(tmp_path, "wb") as f:
+                            async for block in response.aiter_bytes(settings.DOWNLOAD_CHUNK_SIZE):
+                                await run_in_thread(f.write, block)
+                                BYTES_DOWNLOADED.inc(len(block))
+                await run_in_thread(self._commit, name, tmp_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                self._download_locks.pop(key, None)
+
+        return self._path(name)
+
+
+pdf_cache = PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
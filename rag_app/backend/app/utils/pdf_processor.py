@@ -1,90 +1,427 @@
 # app/utils/pdf_processor.py
-from typing import List
-import PyPDF2
-import io
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+import asyncio
+import base64
+import logging
+import threading
+import time
+import httpx
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 from ..config import settings
+from .executors import run_in_thread, run_in_process
+from .pdf_text import count_pages, extract_page_range
+from .chunking import Chunker
+from .context_builder import ContextBuilder
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .llm_client import LLMClient, create_llm_client
+from .metrics import STAGE_SECONDS, timed, track_stage
+from .quantization import QuantizedVectors, top_k_rows
+from .reranker import CrossEncoderReranker
+
+# Stored chunk embeddings: a float32 matrix, or compact codes with exact rescoring
+Embeddings = Union[np.ndarray, QuantizedVectors]
 
 class PDFProcessor:
     def __init__(self):
-        # Initialize sentence-transformers model for embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        # Initialize Gemini
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-pro')
-        self.chunk_size = 1000
-        self.chunk_overlap = 200
+        # Models are loaded on first use (or by warm_up) so importing this
+        # module stays cheap for workers and endpoints that never need them
+        self._embedding_model = None
+        self._llm: Optional[LLMClient] = None
+        self._embedding_client: Optional[httpx.Client] = None
+        self._tokenizer = None
+        self._chunker: Optional[Chunker] = None
+        self._context_builder: Optional[ContextBuilder] = None
+        self._reranker: Optional[CrossEncoderReranker] = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        """Local embedding model of the configured backend (sentence-transformers
+        or ONNX Runtime), loaded on first access"""
+        if self._embedding_model is None:
+            with self._load_lock:
+                if self._embedding_model is None:
+                    started = time.perf_counter()
+                    if settings.EMBEDDING_BACKEND == "onnx":
+                        from .onnx_embedder import OnnxEmbedder
+                        self._embedding_model = OnnxEmbedder(
+                            settings.ONNX_MODEL_DIR,
+                            intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+                            max_batch_tokens=settings.EMBEDDING_MAX_BATCH_TOKENS
+                        )
+                    elif settings.EMBEDDING_BACKEND == "torch":
+                        from sentence_transformers import SentenceTransformer
+                        self._embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+                    else:
+                        raise ValueError(
+                            f"Unknown embedding backend '{settings.EMBEDDING_BACKEND}', expected 'torch' or 'onnx'"
+                        )
+                    logging.info(
+                        f"Loaded {settings.EMBEDDING_BACKEND} embedding model in {time.perf_counter() - started:.2f}s"
+                    )
+        return self._embedding_model
+
+    @property
+    def llm(self) -> LLMClient:
+        """Client of the configured LLM provider (settings.LLM_PROVIDER)"""
+        if self._llm is None:
+            self._llm = create_llm_client()
+        return self._llm
+
+    def _encode(self, texts, batch_size: int = 32, normalize: bool = True) -> np.ndarray:
+        """Embed text(s) as float32 on the calling thread, locally or via the shared
+        embedding service when EMBEDDING_SERVICE_URL is set"""
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, 0), dtype=np.float32)
+
+        if settings.EMBEDDING_SERVICE_URL:
+            if self._embedding_client is None:
+                self._embedding_client = httpx.Client(
+                    base_url=settings.EMBEDDING_SERVICE_URL,
+                    timeout=settings.HTTP_TIMEOUT_SECONDS
+                )
+            response = self._embedding_client.post("/embed", json={
+                "texts": batch,
+                "batch_size": batch_size,
+                "normalize": normalize
+            })
+            response.raise_for_status()
+            payload = response.json()
+            embeddings = np.frombuffer(
+                base64.b64decode(payload["embeddings"]), dtype=np.float32
+            ).reshape(payload["shape"])
+        else:
+            embeddings = np.asarray(
+                self.embedding_model.encode(
+                    batch,
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=normalize
+                ),
+                dtype=np.float32
+            )
+        return embeddings[0] if single else embeddings
+
+    async def warm_up(self):
+        """Load models ahead of the first request"""
+        await run_in_thread(self._encode, "warm up")
+        if self.reranker is not None:
+            await run_in_thread(self.reranker.warm_up)
+        await self.llm.warm_up()
         
-    async def extract_text_from_pdf(self, pdf_content: bytes) -> str:
-        """Extract text content from PDF bytes"""
+
+    async def count_pages(self, pdf_source: Union[bytes, str]) -> int:
+        """Number of pages in a PDF"""
         try:
-            pdf_file = io.BytesIO(pdf_content)
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return await run_in_process(count_pages, pdf_source)
+        except Exception as e:
+            raise Exception(f"Error reading PDF: {str(e)}")
+
+    async def iter_page_batches(
+        self,
+        pdf_source: Union[bytes, str],
+        page_count: Optional[int] = None,
+        start_page: int = 0
+    ) -> AsyncIterator[List[Tuple[int, str]]]:
+        """Extract pages in parallel across the process pool, yielding
+        (page_number, text) batches in page order as they complete.
+        start_page skips the first pages, e.g. to resume an interrupted extraction."""
+        try:
+            # PyPDF2 parsing holds the GIL, so every page range runs in the process pool
+            if page_count is None:
+                page_count = await self.count_pages(pdf_source)
+            batch_size = settings.PAGES_PER_EXTRACTION_TASK
+            tasks = [
+                asyncio.ensure_future(
+                    run_in_process(extract_page_range, pdf_source, start, start + batch_size)
+                )
+                for start in range(start_page, page_count, batch_size)
+            ]
+            try:
+                for task in tasks:
+                    with track_stage("extract"):
+                        batch = await task
+                    yield batch
+            finally:
+                for task in tasks:
+                    task.cancel()
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
 
-    def create_chunks(self, text: str) -> List[str]:
-        """Split text into chunks with overlap"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), self.chunk_size - self.chunk_overlap):
-            chunk = " ".join(words[i:i + self.chunk_size])
-            chunks.append(chunk)
-            
-        return chunks
+    async def extract_pages(self, pdf_source: Union[bytes, str]) -> List[Tuple[int, str]]:
+        """Extract (page_number, text) for every page of a PDF"""
+        pages = []
+        async for batch in self.iter_page_batches(pdf_source):
+            pages.extend(batch)
+        return pages
+
+    async def extract_text_from_pdf(self, pdf_source: Union[bytes, str]) -> str:
+        """Extract text content from PDF bytes or a cached PDF file path"""
+        pages = await self.extract_pages(pdf_source)
+        return "\n".join(text for _, text in pages) + "\n"
+
+    @property
+    def tokenizer(self):
+        """Tokenizer of the embedding model, used to size chunks; None if unavailable"""
+        if self._tokenizer is None:
+            with self._load_lock:
+                if self._tokenizer is None:
+                    try:
+                        if settings.EMBEDDING_SERVICE_URL:
+                            # Don't load the whole model just for its tokenizer
+                            from transformers import AutoTokenizer
+                            self._tokenizer = AutoTokenizer.from_pretrained(
+                                f"sentence-transformers/{settings.EMBEDDING_MODEL_NAME}"
+                            )
+                        else:
+                            self._tokenizer = self.embedding_model.tokenizer
+                    except Exception as e:
+                        logging.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+                        self._tokenizer = False
+        return self._tokenizer or None
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Model token counts for a batch of texts, excluding special tokens"""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            # Rough WordPiece ratio for English text
+            return [int(len(text.split()) * 1.3) + 1 for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    @property
+    def chunker(self) -> Chunker:
+        if self._chunker is None:
+            self._chunker = Chunker(
+                count_tokens=self.count_tokens,
+                strategy=settings.CHUNK_STRATEGY,
+                max_tokens=settings.CHUNK_MAX_TOKENS,
+                overlap_tokens=settings.CHUNK_OVERLAP_TOKENS,
+                semantic_threshold=settings.SEMANTIC_CHUNK_THRESHOLD,
+                embed=lambda texts: self._encode(texts, batch_size=settings.EMBEDDING_BATCH_SIZE)
+            )
+        return self._chunker
+
+    @property
+    def context_builder(self) -> ContextBuilder:
+        if self._context_builder is None:
+            self._context_builder = ContextBuilder(self.count_tokens, settings.CONTEXT_MAX_TOKENS)
+        return self._context_builder
+
+    @property
+    def reranker(self) -> Optional[CrossEncoderReranker]:
+        """Cross-encoder of the second retrieval stage, or None if reranking is off"""
+        if not settings.RERANK_ENABLED:
+            return None
+        if self._reranker is None:
+            self._reranker = CrossEncoderReranker(settings.RERANKER_MODEL_NAME, settings.RERANK_MAX_LENGTH)
+        return self._reranker
+
+    def candidate_count(self, top_k: int) -> int:
+        """Chunks the first stage fetches for a final top_k"""
+        return max(settings.RERANK_CANDIDATES, top_k) if self.reranker is not None else top_k
+
+    async def rerank_sources(
+        self,
+        queries: List[str],
+        candidates: List[List[Dict]],
+        top_k: int
+    ) -> List[List[Dict]]:
+        """Top_k sources per query: reranked by the cross-encoder within the time
+        budget when reranking is on, else the first top_k candidates"""
+        if self.reranker is None:
+            return [sources[:top_k] for sources in candidates]
+        return await self.reranker.rerank(queries, candidates, top_k, settings.RERANK_BUDGET_SECONDS)
+
+    @timed("chunk")
+    def create_page_chunks(self, pages: List[Tuple[int, str]]) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """Split per-page text into chunks sized for the embedding model, returning
+        the chunks and the (first_page, last_page) each chunk spans"""
+        chunks = self.chunker.chunk(pages)
+        return [chunk.text for chunk in chunks], [(chunk.page_start, chunk.page_end) for chunk in chunks]
 
     async def get_embeddings(self, text: str) -> List[float]:
         """Get embeddings using sentence-transformers"""
         try:
-            embedding = self.embedding_model.encode(text)
+            embedding = await run_in_thread(self._encode, text, normalize=False)
             return embedding.tolist()
         except Exception as e:
             raise Exception(f"Error getting embeddings: {str(e)}")
 
-    async def find_relevant_chunks(self, query: str, chunks: List[str], top_k: int = 3) -> List[str]:
-        """Find most relevant chunks for the query using cosine similarity"""
+    @timed("embed_chunks")
+    async def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Embed all chunks in one batched call, returned as a normalized float32 matrix"""
         try:
-            # Get query embedding
-            query_embedding = await self.get_embeddings(query)
-            
-            # Get embeddings for all chunks
-            chunk_embeddings = []
-            for chunk in chunks:
-                embedding = await self.get_embeddings(chunk)
-                chunk_embeddings.append(embedding)
-            
-            # Calculate cosine similarity
-            similarities = [
-                cosine_similarity(
-                    [query_embedding],
-                    [chunk_embedding]
-                )[0][0]
-                for chunk_embedding in chunk_embeddings
-            ]
-            
-            # Get top k chunks
-            top_indices = np.argsort(similarities)[-top_k:]
-            return [chunks[i] for i in top_indices]
-            
+            embeddings = await run_in_thread(
+                self._encode,
+                chunks,
+                batch_size=settings.EMBEDDING_BATCH_SIZE
+            )
+            return embeddings.reshape(len(chunks), -1) if chunks else embeddings
         except Exception as e:
-            raise Exception(f"Error finding relevant chunks: {str(e)}")
+            raise Exception(f"Error embedding chunks: {str(e)}")
 
-    async def generate_response(self, query: str, relevant_chunks: List[str]) -> str:
-        """Generate response using Gemini Pro"""
+    @timed("embed_query")
+    async def get_query_embedding(self, query: str) -> np.ndarray:
+        """Embed a query as a normalized float32 vector"""
         try:
-            # Combine relevant chunks
-            context = "\n".join(relevant_chunks)
-            
-            # Create prompt
-            prompt = f"""You are a helpful assistant that answers questions based on provided PDF content.
+            return await run_in_thread(self._encode, query)
+        except Exception as e:
+            raise Exception(f"Error getting query embedding: {str(e)}")
+
+    @timed("embed_queries")
+    async def get_query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """Embed many queries in one batched call as a normalized float32 matrix"""
+        try:
+            embeddings = await run_in_thread(
+                self._encode,
+                queries,
+                batch_size=settings.EMBEDDING_BATCH_SIZE
+            )
+            return embeddings.reshape(len(queries), -1) if queries else embeddings
+        except Exception as e:
+            raise Exception(f"Error getting query embeddings: {str(e)}")
+
+    @staticmethod
+    def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k scores in descending order, without a full sort"""
+        return top_k_rows(scores, top_k)
+
+    @classmethod
+    def dense_top_k(
+        cls,
+        chunk_embeddings: Embeddings,
+        query_embedding: np.ndarray,
+        top_k: int,
+        dense_scores: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(chunk indexes, cosine scores) of the top_k chunks, best first.
+        dense_scores are precomputed scores of every chunk: exact for a float32
+        matrix, coarse ones for QuantizedVectors, whose candidates are rescored."""
+        if isinstance(chunk_embeddings, QuantizedVectors):
+            return chunk_embeddings.search(query_embedding, top_k, dense_scores)
+        # Embeddings are normalized, so one matrix-vector product gives cosine scores
+        if dense_scores is None:
+            dense_scores = chunk_embeddings @ query_embedding
+        ids = cls.top_k_indices(dense_scores, top_k)
+        return ids, dense_scores[ids]
+
+    @timed("rank")
+    async def rank_chunks(
+        self,
+        query: str,
+        chunk_embeddings: Embeddings,
+        top_k: int = 3,
+        query_embedding: Optional[np.ndarray] = None,
+        lexical_index: Optional[BM25Index] = None
+    ) -> List[Tuple[int, float]]:
+        """Top_k (chunk_index, cosine score) for the query against stored embeddings,
+        best first; fused with BM25 when a lexical index is given in hybrid mode"""
+        if len(chunk_embeddings) == 0:
+            return []
+        if query_embedding is None:
+            query_embedding = await self.get_query_embedding(query)
+        if lexical_index is not None and settings.RETRIEVAL_MODE == "hybrid":
+            return self.rank_hybrid(query, query_embedding, chunk_embeddings, lexical_index, top_k)
+        ids, scores = self.dense_top_k(chunk_embeddings, query_embedding, top_k)
+        return [(int(i), float(score)) for i, score in zip(ids, scores)]
+
+    @classmethod
+    def rank_hybrid(
+        cls,
+        query: str,
+        query_embedding: np.ndarray,
+        chunk_embeddings: Embeddings,
+        lexical_index: BM25Index,
+        top_k: int = 3,
+        dense_scores: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Reciprocal rank fusion of the dense and BM25 rankings; returns the
+        top_k (chunk_index, cosine score). BM25 catches exact identifiers
+        (part numbers, error codes) that the embedding model blurs."""
+        depth = max(settings.HYBRID_CANDIDATES, top_k)
+        prefilter = dense_scores is None and len(chunk_embeddings) >= settings.HYBRID_PREFILTER_MIN_CHUNKS
+        lexical_ids, _ = lexical_index.search(
+            query, top_k=max(settings.HYBRID_PREFILTER_CANDIDATES, depth) if prefilter else depth
+        )
+
+        if prefilter and len(lexical_ids) >= top_k:
+            # Large PDF: only the lexical candidates are scored densely
+            candidates = np.sort(lexical_ids)  # ascending rows read the embeddings in order
+            candidate_scores = chunk_embeddings[candidates] @ query_embedding
+            dense_ids = candidates[cls.top_k_indices(candidate_scores, depth)]
+        else:
+            dense_ids, _ = cls.dense_top_k(chunk_embeddings, query_embedding, depth, dense_scores)
+
+        fused = [i for i, _ in reciprocal_rank_fusion([dense_ids, lexical_ids[:depth]], settings.RRF_K)[:top_k]]
+        if not fused:
+            return []
+        # Exact cosine of the few fused chunks, whichever ranking found them
+        cosine = chunk_embeddings[np.asarray(fused)] @ query_embedding
+        return [(i, float(score)) for i, score in zip(fused, cosine)]
+
+    @classmethod
+    @timed("rank")
+    def rank_chunks_batch(
+        cls,
+        chunk_embeddings: Embeddings,
+        query_embeddings: np.ndarray,
+        top_k: int = 3,
+        queries: Optional[List[str]] = None,
+        lexical_index: Optional[BM25Index] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """Top_k (chunk_index, cosine score) per query row, best first, from a single
+        query-by-chunk score matrix; fused with BM25 per query in hybrid mode"""
+        if len(chunk_embeddings) == 0 or len(query_embeddings) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+        quantized = isinstance(chunk_embeddings, QuantizedVectors)
+        if quantized:
+            scores = chunk_embeddings.coarse_scores(query_embeddings)
+        else:
+            scores = query_embeddings @ chunk_embeddings.T
+        if queries is not None and lexical_index is not None and settings.RETRIEVAL_MODE == "hybrid":
+            return [
+                cls.rank_hybrid(query, query_embedding, chunk_embeddings, lexical_index, top_k, row)
+                for query, query_embedding, row in zip(queries, query_embeddings, scores)
+            ]
+        if quantized:
+            # Candidates are rescored per query against the float32 rows
+            results = []
+            for query_embedding, row in zip(query_embeddings, scores):
+                ids, exact = chunk_embeddings.search(query_embedding, top_k, row)
+                results.append([(int(i), float(score)) for i, score in zip(ids, exact)])
+            return results
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        top = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        return [
+            [(int(i), float(score)) for i, score in zip(row, row_scores)]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+    @staticmethod
+    def label_chunk(text: str, page_start: Optional[int] = None, page_end: Optional[int] = None) -> str:
+        """Prefix a chunk with the pages it came from so the answer can cite them"""
+        if page_start is None:
+            return text
+        if page_end is None or page_end == page_start:
+            return f"[Page {page_start}]\n{text}"
+        return f"[Pages {page_start}-{page_end}]\n{text}"
+
+    def build_prompt(self, query: str, relevant_chunks: List[str]) -> str:
+        """Prompt for answering a query from the given context chunks"""
+        # Combine relevant chunks
+        context = "\n".join(relevant_chunks)
+
+        return f"""You are a helpful assistant that answers questions based on provided PDF content.
             
 Context from PDF:
 {context}
@@ -95,16 +432,34 @@ Instructions:
 1. Answer based ONLY on the provided context
 2. If the answer isn't in the context, say "I cannot answer this based on the provided content"
 3. Be concise but thorough
-4. If relevant, cite specific parts of the context
+4. If relevant, cite specific parts of the context, including the page numbers shown in brackets
 
 Answer:"""
-            
-            # Generate response using Gemini
-            response = self.model.generate_content(prompt)
-            
+
+    @timed("generate")
+    async def generate_response(self, query: str, relevant_chunks: List[str]) -> str:
+        """Generate a response with the configured LLM"""
+        try:
+            prompt = self.build_prompt(query, relevant_chunks)
+            response = await self.llm.generate(prompt)
             return response.text
             
         except Exception as e:
             raise Exception(f"Error generating response: {str(e)}")
 
+    async def generate_response_stream(self, query: str, relevant_chunks: List[str]) -> AsyncIterator[str]:
+        """Generate a response with the configured LLM, yielding text as the model produces it"""
+        try:
+            prompt = self.build_prompt(query, relevant_chunks)
+            started = time.perf_counter()
+            first_token = True
+            async for text in self.llm.stream(prompt):
+                if first_token:
+                    first_token = False
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage="generate_first_token")
+                yield text
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="generate_stream")
+        except Exception as e:
+            raise Exception(f"Error generating response: {str(e)}")
+
 pdf_processor = PDFProcessor()
\ No newline at end of file
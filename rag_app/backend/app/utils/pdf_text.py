@@ -0,0 +1,26 @@
+# app/utils/pdf_text.py
+# Kept free of app settings and model imports so process-pool workers start fast.
+from typing import List, Tuple, Union
+import io
+import PyPDF2
+
+
+def _reader(pdf_source: Union[bytes, str]) -> PyPDF2.PdfReader:
+    if isinstance(pdf_source, bytes):
+        pdf_source = io.BytesIO(pdf_source)
+    return PyPDF2.PdfReader(pdf_source)
+
+
+def count_pages(pdf_source: Union[bytes, str]) -> int:
+    """Number of pages in a PDF"""
+    return len(_reader(pdf_source).pages)
+
+
+def extract_page_range(pdf_source: Union[bytes, str], start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract (page_number, text) for pages [start, end), numbered from 1"""
+    reader = _reader(pdf_source)
+    return [
+        (page_no + 1, reader.pages[page_no].extract_text() or "")
+        for page_no in range(start, min(end, len(reader.pages)))
+    ]
+
@@ -0,0 +1,178 @@
+# app/utils/quantization.py
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+# Rows scored per block, so converting codes to float32 never needs more than
+# a block's worth of temporary memory
+_BLOCK_ROWS = 65536
+# Set bits of every byte value, for Hamming distances over packed codes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+class Codec:
+    """Compact encoding of normalized embeddings for a coarse first pass.
+
+    encode() returns the codes and the (small) parameters needed to score
+    them; scores() returns approximate inner products of every row with each
+    query, in the same order as exact cosine scores."""
+
+    name = ""
+
+    def encode(self, embeddings: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        raise NotImplementedError
+
+    def scores(self, codes: np.ndarray, params: Dict[str, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """(n_queries, n_rows) approximate scores for a (n_queries, dim) matrix"""
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            out[:, start:start + len(block)] = self._score_block(block, params, queries)
+        return out
+
+    def _score_block(self, block: np.ndarray, params: Dict[str, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class Float16Codec(Codec):
+    """Half precision: 2 bytes per dimension, scores within ~1e-3 of exact"""
+
+    name = "float16"
+
+    def encode(self, embeddings):
+        return np.asarray(embeddings, dtype=np.float16), {}
+
+    def _score_block(self, block, params, queries):
+        return queries @ block.astype(np.float32).T
+
+
+class Int8Codec(Codec):
+    """Scalar quantization: each dimension is mapped linearly from its
+    [min, max] over the PDF's chunks onto 256 levels, 1 byte per dimension.
+
+    With x ~= offset + scale * (code + 128), the inner product with q is
+    code @ (scale * q) plus a per-query constant, so scoring is one float32
+    matrix product over the converted codes."""
+
+    name = "int8"
+
+    def encode(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        low, high = embeddings.min(axis=0), embeddings.max(axis=0)
+        scale = np.maximum(high - low, 1e-12) / 255.0
+        codes = np.rint((embeddings - low) / scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8), {
+            "scale": scale.astype(np.float32),
+            "offset": low.astype(np.float32)
+        }
+
+    def _score_block(self, block, params, queries):
+        scaled = queries * params["scale"]
+        bias = queries @ params["offset"] + 128.0 * scaled.sum(axis=1)
+        return scaled @ block.astype(np.float32).T + bias[:, None]
+
+
+class BinaryCodec(Codec):
+    """Sign bits packed 8 per byte (48 bytes for 384 dimensions). Scores are
+    dim - 2 * Hamming distance to the query's sign bits, which tracks the
+    angle between the vectors; recall relies on rescoring a wide candidate set."""
+
+    name = "binary"
+
+    def encode(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return np.packbits(embeddings > 0, axis=1), {
+            "dim": np.asarray(embeddings.shape[1], dtype=np.int64)
+        }
+
+    def _score_block(self, block, params, queries):
+        query_bits = np.packbits(queries > 0, axis=1)
+        dim = float(params["dim"])
+        out = np.empty((len(queries), len(block)), dtype=np.float32)
+        for i, bits in enumerate(query_bits):
+            distance = _POPCOUNT[np.bitwise_xor(block, bits)].sum(axis=1)
+            out[i] = dim - 2.0 * distance
+        return out
+
+
+CODECS = {codec.name: codec for codec in (Float16Codec(), Int8Codec(), BinaryCodec())}
+
+
+def get_codec(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(
+            f"Unknown embedding quantization '{name}', expected 'none' or one of {sorted(CODECS)}"
+        )
+    return CODECS[name]
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores in descending order, without a full sort"""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class QuantizedVectors:
+    """Chunk embeddings of one PDF searched in two passes: a coarse pass over
+    compact codes, then exact cosine rescoring of the best candidates against
+    the float32 vectors.
+
+    Both arrays are normally memory-mapped, so only the codes are scanned in
+    full; the float32 file is read for the rescored rows alone. Indexing with
+    rows returns exact float32 vectors, like a plain embedding matrix.
+    """
+
+    def __init__(
+        self,
+        codec: Codec,
+        codes: np.ndarray,
+        params: Dict[str, np.ndarray],
+        vectors: np.ndarray,
+        rescore_candidates: int = 200
+    ):
+        if len(codes) != len(vectors):
+            raise ValueError(f"Code count ({len(codes)}) does not match vector count ({len(vectors)})")
+        self.codec = codec
+        self.codes = codes
+        self.params = params
+        self.vectors = vectors
+        self.rescore_candidates = rescore_candidates
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.vectors.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes scanned by the coarse pass"""
+        return int(self.codes.nbytes + sum(value.nbytes for value in self.params.values()))
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def coarse_scores(self, queries: np.ndarray) -> np.ndarray:
+        """(n_queries, n_rows) approximate scores for a query matrix"""
+        return self.codec.scores(self.codes, self.params, np.asarray(queries, dtype=np.float32))
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        coarse: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, exact cosine scores) of the top_k rows, best first. Pass a
+        row of coarse_scores() to skip the coarse pass for this query."""
+        if coarse is None:
+            coarse = self.coarse_scores(query[None, :])[0]
+        candidates = np.sort(top_k_rows(coarse, max(self.rescore_candidates, top_k)))
+        exact = self[candidates] @ query
+        best = top_k_rows(exact, top_k)
+        return candidates[best], exact[best]
@@ -0,0 +1,99 @@
+# app/utils/reranker.py
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+from .executors import run_in_thread
+from .metrics import RERANKS, timed
+
+
+class CrossEncoderReranker:
+    """Second retrieval stage: a cross-encoder reads each (query, chunk) pair
+    together and rescores the candidates the first stage over-fetched.
+
+    All pairs of a request are scored in one batched predict call. The call
+    has a time budget that also covers waiting for the model, which runs one
+    batch at a time; when the budget runs out the candidates keep their
+    first-stage order, so reranking can delay an answer by at most the budget.
+    """
+
+    def __init__(self, model_name: str, max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._load_lock = threading.Lock()
+        # torch already parallelizes inside a batch; concurrent batches only contend
+        self._predict_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """sentence-transformers CrossEncoder, loaded on first access"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                    logging.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - started:.2f}s")
+        return self._model
+
+    def _predict(self, pairs: List[Tuple[str, str]], deadline: float) -> Optional[np.ndarray]:
+        # Wait for the model no longer than the budget, so pool threads shared with
+        # embedding and disk I/O never pile up behind a slow batch
+        if not self._predict_lock.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            return None
+        try:
+            if time.monotonic() >= deadline:
+                return None  # the budget ran out while queued behind other requests
+            scores = self.model.predict(
+                pairs, batch_size=len(pairs), show_progress_bar=False, convert_to_numpy=True
+            )
+            return np.asarray(scores, dtype=np.float32).reshape(len(pairs))
+        finally:
+            self._predict_lock.release()
+
+    @timed("rerank")
+    async def rerank(
+        self,
+        queries: Sequence[str],
+        candidates: Sequence[List[Dict]],
+        top_k: int,
+        budget_seconds: float
+    ) -> List[List[Dict]]:
+        """The top_k of each query's candidate sources (dicts with "text"), best
+        first. Reranked sources get a "rerank_score"; on timeout or error each
+        list is cut to top_k in the order given."""
+        pairs = [(query, source["text"]) for query, sources in zip(queries, candidates) for source in sources]
+        if not pairs:
+            return [list(sources[:top_k]) for sources in candidates]
+
+        deadline = time.monotonic() + budget_seconds
+        try:
+            scores = await asyncio.wait_for(
+                run_in_thread(self._predict, pairs, deadline), timeout=budget_seconds
+            )
+        except asyncio.TimeoutError:
+            scores = None
+        except Exception as e:
+            logging.warning(f"Reranking failed, keeping first-stage order: {e!r}")
+            RERANKS.inc(outcome="error")
+            return [list(sources[:top_k]) for sources in candidates]
+        if scores is None:
+            RERANKS.inc(outcome="timeout")
+            return [list(sources[:top_k]) for sources in candidates]
+
+        RERANKS.inc(outcome="reranked")
+        reranked, start = [], 0
+        for sources in candidates:
+            source_scores = scores[start:start + len(sources)]
+            start += len(sources)
+            order = np.argsort(-source_scores, kind="stable")[:top_k]
+            reranked.append([
+                {**sources[i], "rerank_score": float(source_scores[i])} for i in order
+            ])
+        return reranked
+
+    def warm_up(self) -> None:
+        self.model.predict([("warm up", "warm up")], show_progress_bar=False)
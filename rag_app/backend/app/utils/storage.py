@@ -0,0 +1,87 @@
+# app/utils/storage.py
+from datetime import datetime
+from pathlib import Path
+import os
+import shutil
+import uuid
+from ..config import settings
+
+
+class CloudinaryStorage:
+    """Uploaded PDFs stored as Cloudinary raw resources. Files are sent with
+    the chunked upload API straight from disk, so memory use does not grow
+    with the file size."""
+
+    name = "cloudinary"
+
+    def upload(self, path: str) -> dict:
+        """Store the file at path; returns its url, public_id, bytes and created_at"""
+        import cloudinary.uploader
+        result = cloudinary.uploader.upload_large(
+            path,
+            resource_type="raw",
+            chunk_size=settings.STORAGE_CHUNK_SIZE
+        )
+        return {
+            "url": result["secure_url"],
+            "public_id": result["public_id"],
+            "bytes": result["bytes"],
+            "created_at": datetime.strptime(result["created_at"], "%Y-%m-%dT%H:%M:%SZ"),
+            "format": result.get("format", "pdf")
+        }
+
+    def destroy(self, public_id: str) -> bool:
+        """Delete a stored file; False if it was already gone"""
+        import cloudinary.uploader
+        result = cloudinary.uploader.destroy(public_id, resource_type="raw")
+        if result.get("result") == "not found":
+            return False
+        if result.get("result") != "ok":
+            raise Exception(f"Failed to delete from Cloudinary: {result}")
+        return True
+
+
+class LocalStorage:
+    """Uploaded PDFs stored in a local directory, for offline use. URLs are
+    file:// URLs, which the PDF cache copies instead of downloading."""
+
+    name = "local"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, public_id: str) -> str:
+        return os.path.join(self.root_dir, os.path.basename(public_id))
+
+    def upload(self, path: str) -> dict:
+        public_id = f"{uuid.uuid4().hex}.pdf"
+        destination = self._path(public_id)
+        tmp_path = f"{destination}.part"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, destination)
+        return {
+            "url": Path(destination).resolve().as_uri(),
+            "public_id": public_id,
+            "bytes": os.path.getsize(destination),
+            "created_at": datetime.utcnow().replace(microsecond=0),
+            "format": "pdf"
+        }
+
+    def destroy(self, public_id: str) -> bool:
+        try:
+            os.remove(self._path(public_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def create_storage(backend: str):
+    if backend == "cloudinary":
+        return CloudinaryStorage()
+    if backend == "local":
+        return LocalStorage(settings.LOCAL_STORAGE_DIR)
+    raise ValueError(f"Unknown storage backend '{backend}', expected 'cloudinary' or 'local'")
+
+
+storage = create_storage(settings.STORAGE_BACKEND)
@@ -0,0 +1,408 @@
+# app/utils/vector_index.py
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import shutil
+import uuid
+import numpy as np
+
+
+class VectorIndex:
+    """Cross-document index over normalized chunk embeddings.
+
+    Rows are (pdf_id, chunk_index, vector). Vectors live in a list of segments so
+    that a memory-mapped base segment loaded from disk is never copied when new
+    PDFs are added; deletes are tombstones that are compacted away on save.
+    """
+
+    kind = "flat"
+    INDEX_FILE = "index.json"
+    VECTORS_FILE = "vectors.npy"
+    META_FILE = "meta.npz"
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._segments: List[np.ndarray] = []
+        self._offsets: List[int] = []
+        self._row_pdf = np.empty(0, dtype=np.int32)
+        self._row_chunk = np.empty(0, dtype=np.int32)
+        self._alive = np.empty(0, dtype=bool)
+        self._pdf_ids: List[str] = []
+        self._pdf_codes: Dict[str, int] = {}
+        # Saved with the index for its owner, e.g. what the index was built from
+        self.metadata: dict = {}
+
+    # ------------------------------------------------------------------ rows
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    @property
+    def total_rows(self) -> int:
+        return len(self._alive)
+
+    def pdf_ids(self) -> List[str]:
+        """PDF ids that currently have live rows in the index"""
+        live_codes = np.unique(self._row_pdf[self._alive])
+        return [self._pdf_ids[code] for code in live_codes]
+
+    def __contains__(self, pdf_id: str) -> bool:
+        code = self._pdf_codes.get(pdf_id)
+        if code is None:
+            return False
+        return bool(np.any(self._alive & (self._row_pdf == code)))
+
+    def _code_for(self, pdf_id: str) -> int:
+        code = self._pdf_codes.get(pdf_id)
+        if code is None:
+            code = len(self._pdf_ids)
+            self._pdf_ids.append(pdf_id)
+            self._pdf_codes[pdf_id] = code
+        return code
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        """Fetch vectors for global row numbers across segments"""
+        if len(self._segments) == 1:
+            return np.asarray(self._segments[0][rows])
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        segment_of_row = np.searchsorted(self._offsets, rows, side="right") - 1
+        for seg_no in np.unique(segment_of_row):
+            mask = segment_of_row == seg_no
+            out[mask] = self._segments[seg_no][rows[mask] - self._offsets[seg_no]]
+        return out
+
+    def _score_all(self, query: np.ndarray) -> np.ndarray:
+        if not self._segments:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate([segment @ query for segment in self._segments])
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.float32)
+        return self._gather(rows) @ query
+
+    # -------------------------------------------------------------- mutation
+
+    def add(self, pdf_id: str, embeddings: np.ndarray) -> None:
+        """Add (or replace) all chunk vectors of one PDF"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) == 0:
+            return
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {embeddings.shape[1]} does not match index dim {self.dim}")
+
+        self.delete(pdf_id)
+        code = self._code_for(pdf_id)
+        n = len(embeddings)
+
+        self._offsets.append(self.total_rows)
+        self._segments.append(embeddings)
+        self._row_pdf = np.concatenate([self._row_pdf, np.full(n, code, dtype=np.int32)])
+        self._row_chunk = np.concatenate([self._row_chunk, np.arange(n, dtype=np.int32)])
+        self._alive = np.concatenate([self._alive, np.ones(n, dtype=bool)])
+        self._on_rows_added(self.total_rows - n, embeddings)
+
+    def delete(self, pdf_id: str) -> int:
+        """Tombstone every row of a PDF; returns the number of rows removed"""
+        code = self._pdf_codes.get(pdf_id)
+        if code is None:
+            return 0
+        rows = self._alive & (self._row_pdf == code)
+        removed = int(rows.sum())
+        self._alive[rows] = False
+        return removed
+
+    def _on_rows_added(self, start: int, embeddings: np.ndarray) -> None:
+        """Hook for subclasses that maintain extra structures"""
+
+    # ---------------------------------------------------------------- search
+
+    def _candidate_rows(self, query: np.ndarray, pdf_codes: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Rows to score exactly, or None to score every row"""
+        if pdf_codes is None:
+            return None
+        return np.flatnonzero(self._alive & np.isin(self._row_pdf, pdf_codes))
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        pdf_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, int, float]]:
+        """Top-k (pdf_id, chunk_index, score) over all PDFs or a subset, best first"""
+        if self.total_rows == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+
+        pdf_codes = None
+        if pdf_ids is not None:
+            pdf_codes = np.array(
+                [self._pdf_codes[p] for p in pdf_ids if p in self._pdf_codes],
+                dtype=np.int32
+            )
+            if len(pdf_codes) == 0:
+                return []
+
+        rows = self._candidate_rows(query, pdf_codes)
+        if rows is None:
+            scores = self._score_all(query)
+            scores[~self._alive] = -np.inf
+            rows = np.arange(self.total_rows)
+        else:
+            scores = self._score_rows(rows, query)
+
+        k = min(top_k, len(rows))
+        if k == 0:
+            return []
+        if k < len(scores):
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        return [
+            (self._pdf_ids[self._row_pdf[rows[i]]], int(self._row_chunk[rows[i]]), float(scores[i]))
+            for i in best
+            if np.isfinite(scores[i])
+        ]
+
+    # ----------------------------------------------------------- persistence
+
+    def _extra_state(self, keep: np.ndarray) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _load_extra_state(self, meta, params: dict) -> None:
+        pass
+
+    def _params(self) -> dict:
+        return {}
+
+    def save(self, path: str, metadata: Optional[dict] = None) -> None:
+        """Write a compacted copy of the index to a new directory and point the
+        symlink at path to it.
+
+        Each save writes its own directory, so worker processes saving at the
+        same time never write into each other's files, and the symlink is swapped
+        atomically, so a load sees either the previous index or the new one."""
+        keep = np.flatnonzero(self._alive)
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}"
+        os.makedirs(tmp_path)
+
+        dim = self.dim or 0
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, self.VECTORS_FILE),
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(keep), dim)
+        )
+        for start in range(0, len(keep), 65536):
+            rows = keep[start:start + 65536]
+            vectors[start:start + len(rows)] = self._gather(rows)
+        vectors.flush()
+        del vectors
+
+        np.savez(
+            os.path.join(tmp_path, self.META_FILE),
+            row_pdf=self._row_pdf[keep],
+            row_chunk=self._row_chunk[keep],
+            **self._extra_state(keep)
+        )
+        with open(os.path.join(tmp_path, self.INDEX_FILE), "w") as f:
+            json.dump({
+                "kind": self.kind,
+                "dim": self.dim,
+                "pdf_ids": self._pdf_ids,
+                "params": self._params(),
+                "metadata": metadata or {}
+            }, f)
+
+        link_path = f"{tmp_path}.link"
+        os.symlink(os.path.basename(tmp_path), link_path)
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)  # saved as a plain directory by an older version
+        os.replace(link_path, path)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorIndex":
+        """Load an index directory; vectors are memory-mapped unless mmap=False"""
+        with open(os.path.join(path, cls.INDEX_FILE)) as f:
+            info = json.load(f)
+
+        index_cls = INDEX_TYPES[info["kind"]]
+        index = index_cls(dim=info["dim"], **info.get("params", {}))
+        vectors = np.load(
+            os.path.join(path, cls.VECTORS_FILE),
+            mmap_mode="r" if mmap else None
+        )
+        with np.load(os.path.join(path, cls.META_FILE)) as meta:
+            index._row_pdf = meta["row_pdf"].astype(np.int32)
+            index._row_chunk = meta["row_chunk"].astype(np.int32)
+            index._alive = np.ones(len(index._row_pdf), dtype=bool)
+            index._load_extra_state(meta, info.get("params", {}))
+
+        if len(vectors):
+            index._segments = [vectors]
+            index._offsets = [0]
+        index._pdf_ids = list(info["pdf_ids"])
+        index._pdf_codes = {pdf_id: code for code, pdf_id in enumerate(index._pdf_ids)}
+        index.metadata = info.get("metadata", {})
+        return index
+
+
+class IVFIndex(VectorIndex):
+    """Inverted-file ANN index: rows are bucketed by their nearest k-means centroid
+    and a query only scores the rows in its n_probe closest buckets.
+
+    Until min_train_size rows exist the index behaves like the flat index. Buckets
+    are retrained when the index has grown retrain_factor times since training.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        min_train_size: int = 2048,
+        retrain_factor: float = 4.0
+    ):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists: Optional[List[np.ndarray]] = None
+        self._trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(embeddings), dtype=np.int32)
+        for start in range(0, len(embeddings), 8192):
+            block = np.asarray(embeddings[start:start + 8192])
+            assignments[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        return assignments
+
+    def train(self, iterations: int = 10, sample_size: int = 65536, seed: int = 0) -> None:
+        """Spherical k-means over a sample of live rows"""
+        live = np.flatnonzero(self._alive)
+        if len(live) == 0:
+            return
+        rng = np.random.default_rng(seed)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(live))))
+        n_lists = min(n_lists, len(live))
+
+        sample_rows = np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False))
+        sample = self._gather(sample_rows)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        self._centroids = centroids.astype(np.float32)
+        self._assignments = np.full(self.total_rows, -1, dtype=np.int32)
+        for seg_no, segment in enumerate(self._segments):
+            start = self._offsets[seg_no]
+            self._assignments[start:start + len(segment)] = self._assign(segment)
+        self._trained_size = len(live)
+        self._lists = None
+        logging.info(f"Trained IVF index with {n_lists} lists on {len(sample)} rows")
+
+    def _on_rows_added(self, start: int, embeddings: np.ndarray) -> None:
+        if not self.is_trained:
+            self._assignments = np.concatenate(
+                [self._assignments, np.full(len(embeddings), -1, dtype=np.int32)]
+            )
+            if len(self) >= self.min_train_size:
+                self.train()
+            return
+
+        self._assignments = np.concatenate([self._assignments, self._assign(embeddings)])
+        self._lists = None
+        if len(self) >= self.retrain_factor * self._trained_size:
+            self.train()
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(
+                self._assignments[order], np.arange(len(self._centroids) + 1)
+            )
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def _candidate_rows(self, query: np.ndarray, pdf_codes: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if not self.is_trained:
+            return super()._candidate_rows(query, pdf_codes)
+
+        # A narrow filter is cheaper to scan exactly than to probe
+        if pdf_codes is not None:
+            filtered = super()._candidate_rows(query, pdf_codes)
+            if len(filtered) <= self.min_train_size:
+                return filtered
+
+        n_probe = min(self.n_probe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+        lists = self._inverted_lists()
+        rows = np.sort(np.concatenate([lists[p] for p in probes]))
+        mask = self._alive[rows]
+        if pdf_codes is not None:
+            mask &= np.isin(self._row_pdf[rows], pdf_codes)
+        return rows[mask]
+
+    def _params(self) -> dict:
+        return {
+            "n_lists": self.n_lists,
+            "n_probe": self.n_probe,
+            "min_train_size": self.min_train_size,
+            "retrain_factor": self.retrain_factor
+        }
+
+    def _extra_state(self, keep: np.ndarray) -> Dict[str, np.ndarray]:
+        if not self.is_trained:
+            return {}
+        return {
+            "centroids": self._centroids,
+            "assignments": self._assignments[keep],
+            "trained_size": np.array(self._trained_size)
+        }
+
+    def _load_extra_state(self, meta, params: dict) -> None:
+        if "centroids" in meta.files:
+            self._centroids = meta["centroids"].astype(np.float32)
+            self._assignments = meta["assignments"].astype(np.int32)
+            self._trained_size = int(meta["trained_size"])
+        else:
+            self._assignments = np.full(len(self._row_pdf), -1, dtype=np.int32)
+
+
+INDEX_TYPES = {
+    VectorIndex.kind: VectorIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def create_index(kind: str, **params) -> VectorIndex:
+    """Build an empty index of the configured type"""
+    try:
+        return INDEX_TYPES[kind](**params)
+    except KeyError:
+        raise ValueError(f"Unknown vector index type '{kind}', expected one of {list(INDEX_TYPES)}")
@@ -0,0 +1,113 @@
+"""Concurrency benchmark for /api/v1/query.
+
+Fires N concurrent /query requests at a running server and reports latency
+percentiles as JSON. To compare event-loop behaviour before and after a change,
+start the server from each revision and run the same command against it:
+
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.concurrency --pdf-id <id> --concurrency 16 --requests 128
+
+A cheap probe request (GET /) is sent alongside the queries; its latency shows
+whether slow queries stall unrelated requests on the same worker.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p90_ms": round(percentile(samples, 90) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    timeout = httpx.Timeout(args.timeout)
+    query_latencies: List[float] = []
+    probe_latencies: List[float] = []
+    errors = 0
+    remaining = args.requests
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+
+        async def query_worker(worker_no: int):
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                payload = {"pdf_id": args.pdf_id, "query": f"{args.query} ({worker_no})"}
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/query", json=payload)
+                    response.raise_for_status()
+                    query_latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        async def probe_worker(done: asyncio.Event):
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    await client.get("/")
+                    probe_latencies.append(time.perf_counter() - started)
+                except Exception:
+                    pass
+                await asyncio.sleep(args.probe_interval)
+
+        done = asyncio.Event()
+        probe = asyncio.create_task(probe_worker(done))
+        started = time.perf_counter()
+        await asyncio.gather(*(query_worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe
+
+    return {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(query_latencies) / elapsed, 2) if elapsed else 0.0,
+        "query": summarize(query_latencies),
+        "probe": summarize(probe_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pdf-id", required=True)
+    parser.add_argument("--query", default="What is this document about?")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
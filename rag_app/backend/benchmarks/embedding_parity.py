@@ -0,0 +1,144 @@
+"""Parity and speed check of the ONNX embedding backend against sentence-transformers.
+
+Embeds the same texts with both backends and compares them:
+  - per-text cosine between the two embeddings (min, mean)
+  - largest absolute difference of any component
+  - top-k agreement: overlap of the chunks each backend retrieves per query
+  - texts/s and resident memory added by each backend
+
+Exits with status 1 if the minimum cosine falls below --tolerance, so it can
+gate a freshly exported model. Run from rag_app/backend after exporting:
+
+    python -m app.utils.onnx_embedder --output data/onnx/all-MiniLM-L6-v2
+    python -m benchmarks.embedding_parity --onnx-model-dir data/onnx/all-MiniLM-L6-v2
+
+Texts are synthetic chunks (benchmarks.synthetic) unless --texts-file gives
+one text per line, e.g. chunks exported from a real corpus.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from .synthetic import make_queries, page_words
+
+# Lowest acceptable cosine between the two backends' embeddings of one text
+DEFAULT_TOLERANCE = 0.99
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_chunks(count: int, seed: int) -> List[str]:
+    """Chunks of varied length, from a short line to roughly a full model window"""
+    rng = random.Random(seed)
+    return [" ".join(page_words(n, rng.randint(8, 220), rng)) for n in range(count)]
+
+
+def run_backend(name: str, load, texts: List[str], batch_size: int, repeat: int) -> dict:
+    before = rss_mb()
+    started = time.perf_counter()
+    model = load()
+    load_s = time.perf_counter() - started
+    model.encode(texts[:batch_size], batch_size=batch_size, normalize_embeddings=True)  # warm up
+
+    samples, embeddings = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        embeddings = np.asarray(
+            model.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32
+        )
+        samples.append(time.perf_counter() - started)
+    return {
+        "backend": name,
+        "load_s": round(load_s, 3),
+        "texts_per_s": round(len(texts) / min(samples), 2),
+        "rss_added_mb": round(rss_mb() - before, 1),
+        "embeddings": embeddings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--onnx-model-dir", required=True)
+    parser.add_argument("--texts-file", help="One text per line instead of synthetic chunks")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--max-batch-tokens", type=int, default=8192)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Lowest acceptable cosine between the two backends' embeddings")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.texts]
+    else:
+        texts = synthetic_chunks(args.texts, args.seed)
+    queries = make_queries(args.queries, seed=args.seed)
+
+    def load_torch():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(args.model, device="cpu")
+
+    def load_onnx():
+        from app.utils.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(args.onnx_model_dir, args.intra_op_threads, args.max_batch_tokens)
+
+    # ONNX first, so its memory is measured before torch is imported
+    results = [
+        run_backend("onnx", load_onnx, texts + queries, args.batch_size, args.repeat),
+        run_backend("torch", load_torch, texts + queries, args.batch_size, args.repeat),
+    ]
+    onnx, torch = (result.pop("embeddings") for result in results)
+
+    cosine = np.sum(onnx * torch, axis=1)
+    overlaps = []
+    for query_onnx, query_torch in zip(onnx[len(texts):], torch[len(texts):]):
+        top_onnx = np.argsort(-(onnx[:len(texts)] @ query_onnx))[:args.top_k]
+        top_torch = np.argsort(-(torch[:len(texts)] @ query_torch))[:args.top_k]
+        overlaps.append(len(set(top_onnx.tolist()) & set(top_torch.tolist())) / args.top_k)
+
+    report = {
+        "model": args.model,
+        "onnx_model_dir": args.onnx_model_dir,
+        "texts": len(texts),
+        "queries": len(queries),
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "max_abs_diff": round(float(np.abs(onnx - torch).max()), 5),
+        f"top{args.top_k}_agreement": round(float(np.mean(overlaps)), 4),
+        "tolerance": args.tolerance,
+        "passed": bool(cosine.min() >= args.tolerance),
+        "backends": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
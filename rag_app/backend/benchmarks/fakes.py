@@ -0,0 +1,506 @@
+"""Local stand-ins for the external services, used by the offline benchmark.
+
+- FakeMongoClient: an in-memory, Motor-shaped async client covering the
+  collection operations the application uses (no $lookup/aggregate)
+- StubCloudinaryServer: accepts SDK uploads, including upload_large's
+  chunked parts (point the SDK at it with
+  cloudinary.config(upload_prefix=server.url)) and serves the stored files
+- StubLLMServer + StubGeminiModel: a completion endpoint with a fixed
+  latency, and a drop-in for the Gemini model object that calls it
+- HashEmbedder: a deterministic hashing-trick encoder with the
+  SentenceTransformer.encode signature, for machines without the model
+"""
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+import copy
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+
+# --------------------------------------------------------------------------
+# MongoDB
+# --------------------------------------------------------------------------
+
+_MISSING = object()
+
+
+def _get_path(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_path(doc: dict, path: str, value: Any):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def _compare(value: Any, op: str, arg: Any) -> bool:
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$ne":
+        return value is _MISSING or value != arg
+    if op == "$in":
+        return value is not _MISSING and (value in arg or (isinstance(value, list) and any(v in arg for v in value)))
+    if op == "$nin":
+        return not _compare(value, "$in", arg)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Query operator {op} is not supported by FakeMongoClient")
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported by FakeMongoClient")
+        else:
+            value = _get_path(doc, key)
+            if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+                if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                    return False
+            elif isinstance(value, list) and not isinstance(condition, list):
+                if condition not in value:
+                    return False
+            elif value is _MISSING:
+                if condition is not None:
+                    return False
+            elif value != condition:
+                return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        projected = {key: doc[key] for key in fields if key in doc}
+    else:
+        projected = {key: value for key, value in doc.items() if fields.get(key, 1)}
+    if include_id and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    else:
+        projected.pop("_id", None)
+    return projected
+
+
+def _sorted(docs: List[dict], spec) -> List[dict]:
+    # Stable multi-key sort: apply keys from last to first
+    for field, direction in reversed(spec):
+        def field_key(doc, field=field):
+            value = _get_path(doc, field)
+            present = value is not _MISSING and value is not None
+            return (present, value if present else 0)
+        docs = sorted(docs, key=field_key, reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict]):
+        self._docs = docs
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        docs = _sorted(self._docs, self._sort) if self._sort else list(self._docs)
+        docs = docs[self._skip:]
+        limit = min(x for x in (self._limit, length or 0) if x) if (self._limit or length) else None
+        if limit:
+            docs = docs[:limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+
+    def _find(self, query: Optional[dict]) -> List[dict]:
+        query = query or {}
+        if isinstance(query.get("_id"), ObjectId):
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc is not None and matches(doc, query) else []
+        return [doc for doc in self._docs.values() if matches(doc, query)]
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor(self._find(query), projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        docs = self._find(query)
+        return _project(docs[0], projection) if docs else None
+
+    async def count_documents(self, query: dict, limit: int = 0) -> int:
+        count = len(self._find(query))
+        return min(count, limit) if limit else count
+
+    async def insert_one(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        self._docs[doc["_id"]] = copy.deepcopy(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        ids = []
+        for doc in docs:
+            ids.append((await self.insert_one(doc)).inserted_id)
+        return SimpleNamespace(inserted_ids=ids)
+
+    @staticmethod
+    def _apply(doc: dict, update: dict):
+        for op, fields in update.items():
+            for path, value in fields.items():
+                if op == "$set":
+                    _set_path(doc, path, copy.deepcopy(value))
+                elif op == "$inc":
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, (0 if current is _MISSING else current) + value)
+                elif op == "$addToSet":
+                    current = _get_path(doc, path)
+                    items = [] if current is _MISSING else current
+                    _set_path(doc, path, items if value in items else items + [copy.deepcopy(value)])
+                elif op == "$pull":
+                    current = _get_path(doc, path)
+                    if current is not _MISSING:
+                        _set_path(doc, path, [item for item in current if item != value])
+                elif op == "$unset":
+                    *parents, leaf = path.split(".")
+                    target = doc
+                    for part in parents:
+                        target = target.get(part, {})
+                    target.pop(leaf, None)
+                else:
+                    raise NotImplementedError(f"Update operator {op} is not supported by FakeMongoClient")
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        docs = self._find(query)
+        if docs:
+            self._apply(docs[0], update)
+        elif upsert:
+            doc = {key: value for key, value in query.items() if not key.startswith("$")}
+            self._apply(doc, update)
+            await self.insert_one(doc)
+        return SimpleNamespace(matched_count=len(docs[:1]), modified_count=len(docs[:1]))
+
+    async def update_many(self, query: dict, update: dict):
+        docs = self._find(query)
+        for doc in docs:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(docs), modified_count=len(docs))
+
+    async def find_one_and_update(self, query: dict, update: dict, return_document=ReturnDocument.BEFORE, **kwargs):
+        docs = self._find(query)
+        if not docs:
+            return None
+        before = copy.deepcopy(docs[0])
+        self._apply(docs[0], update)
+        return copy.deepcopy(docs[0]) if return_document == ReturnDocument.AFTER else before
+
+    async def find_one_and_delete(self, query: dict, **kwargs):
+        docs = self._find(query)
+        if not docs:
+            return None
+        return copy.deepcopy(self._docs.pop(docs[0]["_id"]))
+
+    async def delete_one(self, query: dict):
+        docs = self._find(query)
+        if docs:
+            del self._docs[docs[0]["_id"]]
+        return SimpleNamespace(deleted_count=len(docs[:1]))
+
+    async def delete_many(self, query: dict):
+        docs = self._find(query)
+        for doc in docs:
+            del self._docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(docs))
+
+    async def create_index(self, keys, **kwargs):
+        return "fake_index"
+
+    async def create_indexes(self, indexes):
+        return ["fake_index" for _ in indexes]
+
+    def aggregate(self, pipeline):
+        raise NotImplementedError("FakeMongoClient does not implement aggregation pipelines")
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name: str, *args, **kwargs):
+        return {"ok": 1.0}
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self._databases: Dict[str, FakeDatabase] = {}
+        self.admin = FakeDatabase()
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        return self._databases.setdefault(name, FakeDatabase())
+
+    def close(self):
+        pass
+
+
+# --------------------------------------------------------------------------
+# HTTP stubs
+# --------------------------------------------------------------------------
+
+class _StubServer:
+    """A ThreadingHTTPServer on 127.0.0.1 with a random port, run in a daemon thread"""
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self):
+        handler = type("Handler", (self.handler_class,), {"stub": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+
+class _CloudinaryHandler(_QuietHandler):
+    def do_POST(self):
+        # /v1_1/<cloud>/<resource_type>/upload, multipart form from the SDK
+        body = self._body()
+        message = BytesParser(policy=email_policy).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("latin-1") + body
+        )
+        data = None
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                data = part.get_payload(decode=True)
+        if data is None:
+            return self._send(400, b'{"error": {"message": "missing file"}}')
+
+        # upload_large sends parts with Content-Range; answer in full after the last one
+        content_range = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", self.headers.get("Content-Range", ""))
+        if content_range:
+            data = self.stub.add_part(self.headers.get("X-Unique-Upload-Id", ""), data)
+            if int(content_range.group(2)) + 1 < int(content_range.group(3)):
+                return self._send(200, b'{"done": false}')
+            self.stub.finish_parts(self.headers.get("X-Unique-Upload-Id", ""))
+        public_id = self.stub.store(data)
+        self._send(200, json.dumps({
+            "public_id": public_id,
+            "secure_url": f"{self.stub.url}/files/{public_id}",
+            "bytes": len(data),
+            "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "resource_type": "raw",
+            "format": "pdf",
+        }).encode("utf-8"))
+
+    def do_GET(self):
+        match = re.fullmatch(r"/files/(.+)", self.path)
+        data = self.stub.files.get(match.group(1)) if match else None
+        if data is None:
+            return self._send(404, b'{"error": "not found"}')
+        self._send(200, data, "application/pdf")
+
+
+class StubCloudinaryServer(_StubServer):
+    handler_class = _CloudinaryHandler
+
+    def __init__(self):
+        super().__init__()
+        self.files: Dict[str, bytes] = {}
+        self._parts: Dict[str, bytes] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_part(self, upload_id: str, data: bytes) -> bytes:
+        """Append a part of a chunked upload, returning the bytes so far"""
+        with self._lock:
+            received = self._parts.get(upload_id, b"") + data
+            self._parts[upload_id] = received
+        return received
+
+    def finish_parts(self, upload_id: str):
+        with self._lock:
+            self._parts.pop(upload_id, None)
+
+    def store(self, data: bytes) -> str:
+        with self._lock:
+            public_id = f"benchmark_{next(self._ids)}"
+            self.files[public_id] = data
+        return public_id
+
+
+class _LLMHandler(_QuietHandler):
+    def do_POST(self):
+        payload = json.loads(self._body() or b"{}")
+        time.sleep(self.stub.latency_s)
+        prompt_tokens = len(payload.get("prompt", "").split())
+        text = "Stub answer. " * self.stub.answer_sentences
+        self._send(200, json.dumps({
+            "text": text.strip(),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text.split()),
+        }).encode("utf-8"))
+
+
+class StubLLMServer(_StubServer):
+    """Completion endpoint that answers every prompt after a fixed latency"""
+
+    handler_class = _LLMHandler
+
+    def __init__(self, latency_s: float = 0.2, answer_sentences: int = 20):
+        super().__init__()
+        self.latency_s = latency_s
+        self.answer_sentences = answer_sentences
+
+
+class StubGeminiModel:
+    """Stands in for google.generativeai.GenerativeModel: generate_content_async
+    posts the prompt to a StubLLMServer and returns a response-shaped object"""
+
+    def __init__(self, url: str, client):
+        self.url = url
+        self.client = client
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        response = await self.client.post(f"{self.url}/generate", json={"prompt": prompt})
+        response.raise_for_status()
+        payload = response.json()
+        result = SimpleNamespace(
+            text=payload["text"],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=payload["prompt_tokens"],
+                candidates_token_count=payload["completion_tokens"]
+            )
+        )
+        if not stream:
+            return result
+        return _SingleChunkStream(result)
+
+
+class _SingleChunkStream:
+    def __init__(self, result):
+        self.usage_metadata = result.usage_metadata
+        self._result = result
+
+    def __aiter__(self):
+        async def chunks():
+            yield self._result
+        return chunks()
+
+
+# --------------------------------------------------------------------------
+# Embeddings
+# --------------------------------------------------------------------------
+
+class HashEmbedder:
+    """Bag-of-words hashing encoder with SentenceTransformer.encode's signature.
+    Deterministic and model-free; texts sharing words get similar vectors.
+    Measures the pipeline around the model, not the model itself."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        batch = [sentences] if single else list(sentences)
+        embeddings = np.stack([self._vector(text) for text in batch]) if batch \
+            else np.empty((0, self.dim), dtype=np.float32)
+        if normalize_embeddings and len(embeddings):
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+        return embeddings[0] if single else embeddings
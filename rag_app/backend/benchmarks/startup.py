@@ -0,0 +1,108 @@
+"""Startup benchmark for API workers.
+
+Each sample runs in a fresh interpreter and measures:
+  - time to import app.main and resident memory (RSS) right after import,
+    i.e. what every uvicorn worker pays before it can serve /pdfs
+  - time and RSS after warming up the models (first embedding)
+
+Run from rag_app/backend:
+
+    python -m benchmarks.startup --repeat 3
+    python -m benchmarks.startup --embedding-service-url http://127.0.0.1:8001
+
+The second form measures a worker that delegates embeddings to the shared
+embedding server (app.embedding_server), so it never loads the model itself.
+Required settings that are not in the environment get dummy values; nothing
+connects to MongoDB, Cloudinary or Gemini.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import asyncio, json, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+result = {"rss_baseline_mb": rss_mb()}
+started = time.perf_counter()
+import app.main
+from app.utils.pdf_processor import pdf_processor
+result["import_s"] = time.perf_counter() - started
+result["rss_after_import_mb"] = rss_mb()
+
+if WARM_UP:
+    started = time.perf_counter()
+    asyncio.run(pdf_processor.warm_up())
+    result["warm_up_s"] = time.perf_counter() - started
+    result["rss_after_warm_up_mb"] = rss_mb()
+
+print(json.dumps(result))
+"""
+
+DUMMY_SETTINGS = {
+    "MONGODB_URL": "mongodb://localhost:27017",
+    "CLOUDINARY_CLOUD_NAME": "benchmark",
+    "CLOUDINARY_API_KEY": "benchmark",
+    "CLOUDINARY_API_SECRET": "benchmark",
+    "GEMINI_API_KEY": "benchmark",
+    "OPENAI_API_KEY": "benchmark",
+}
+
+
+def run_sample(warm_up: bool, env: dict) -> dict:
+    code = PROBE.replace("WARM_UP", "True" if warm_up else "False")
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-warm-up", action="store_true", help="Only measure import")
+    parser.add_argument("--embedding-service-url", default="")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    env = {**DUMMY_SETTINGS, **os.environ}
+    env["EMBEDDING_SERVICE_URL"] = args.embedding_service_url
+
+    samples = [run_sample(not args.no_warm_up, env) for _ in range(args.repeat)]
+    report = {
+        "python": sys.version.split()[0],
+        "embedding_service_url": args.embedding_service_url or None,
+        "repeat": args.repeat,
+        "median": {
+            key: round(statistics.median(sample[key] for sample in samples), 3)
+            for key in samples[0]
+        },
+        "samples": samples,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
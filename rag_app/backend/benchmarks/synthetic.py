@@ -0,0 +1,101 @@
+"""Deterministic synthetic PDFs for benchmarks.
+
+Pages are plain Helvetica text written directly as PDF objects, so no PDF
+library is needed to create them and PyPDF2 extracts the text back exactly.
+The same (pages, words_per_page, seed) always produces the same bytes.
+"""
+import random
+from typing import List
+
+# Small topical vocabulary so retrieval has something to discriminate on
+TOPICS = {
+    "finance": "revenue margin forecast quarter budget invoice ledger audit capital dividend",
+    "biology": "cell protein enzyme genome membrane mitosis receptor tissue organism pathway",
+    "networks": "packet router latency bandwidth protocol socket gateway throughput handshake switch",
+    "climate": "carbon emission glacier rainfall drought aerosol ocean warming forecast monsoon",
+    "law": "contract clause liability statute plaintiff verdict appeal tribunal covenant tort",
+}
+FILLER = (
+    "the of and to in is that for on with as by this are from at be it an was "
+    "which can has have more most such these their between during after under"
+).split()
+
+LINE_WIDTH = 12  # words per rendered line
+
+
+def page_topic(page_no: int) -> str:
+    """Topic of a (0-based) page; pages cycle through TOPICS"""
+    topics = sorted(TOPICS)
+    return topics[page_no % len(topics)]
+
+
+def page_words(page_no: int, words_per_page: int, rng: random.Random) -> List[str]:
+    vocabulary = TOPICS[page_topic(page_no)].split()
+    return [
+        rng.choice(vocabulary) if rng.random() < 0.35 else rng.choice(FILLER)
+        for _ in range(words_per_page)
+    ]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _content_stream(words: List[str]) -> bytes:
+    lines = [" ".join(words[i:i + LINE_WIDTH]) for i in range(0, len(words), LINE_WIDTH)]
+    ops = ["BT", "/F1 10 Tf", "14 TL", "50 780 Td"]
+    for line in lines:
+        ops.append(f"({_escape(line)}) Tj T*")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def make_pdf(pages: int, words_per_page: int = 400, seed: int = 0) -> bytes:
+    """A PDF with the given number of text pages"""
+    rng = random.Random(seed)
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page_no in range(pages):
+        stream = _content_stream(page_words(page_no, words_per_page, rng))
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref_offset
+    )
+    return bytes(out)
+
+
+def make_queries(count: int, seed: int = 0) -> List[str]:
+    """Questions spread over the synthetic topics"""
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    queries = []
+    for i in range(count):
+        vocabulary = TOPICS[topics[i % len(topics)]].split()
+        terms = rng.sample(vocabulary, 3)
+        queries.append(f"What does the document say about {terms[0]}, {terms[1]} and {terms[2]}? (#{i})")
+    return queries
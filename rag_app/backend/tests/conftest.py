@@ -0,0 +1,12 @@
+import os
+
+# Settings requires credentials; nothing in the tests connects anywhere
+for name, value in {
+    "MONGODB_URL": "mongodb://localhost:27017",
+    "CLOUDINARY_CLOUD_NAME": "test",
+    "CLOUDINARY_API_KEY": "test",
+    "CLOUDINARY_API_SECRET": "test",
+    "GEMINI_API_KEY": "test",
+    "OPENAI_API_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from app.utils.answer_cache import AnswerCache
+
+
+def test_semantic_hit_requires_same_identifiers():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.9)
+    embedding = np.array([1.0, 0.0], dtype=np.float32)
+    cache.put("pdf", "What was revenue in 2019?", "2019 answer", [], embedding)
+
+    assert cache.get_similar("pdf", "What was revenue in 2020?", embedding) is None
+    assert cache.get_similar("pdf", "Revenue in 2019, please", embedding).response == "2019 answer"
+
+
+def test_expired_best_match_falls_through_to_next_candidate():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.9)
+    cache.put("pdf", "revenue in 2019", "stale", [], np.array([1.0, 0.0], dtype=np.float32))
+    cache.put("pdf", "the revenue for 2019", "fresh", [], np.array([0.99, 0.141], dtype=np.float32))
+    cache._entries[("pdf", "revenue in 2019")].created_at -= 120
+
+    cached = cache.get_similar("pdf", "2019 revenue", np.array([1.0, 0.0], dtype=np.float32))
+
+    assert cached.response == "fresh"
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.utils.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from app.utils.embedding_store import EmbeddingStore
+from app.utils.pdf_processor import PDFProcessor
+
+# Lengths 2, 3 and 4 tokens, average 3; "apple" and "cherry" occur in two chunks, "date" in one
+CORPUS = ["apple banana", "apple apple cherry", "banana cherry cherry date"]
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Is the XJ-2000 part in v2.3?") == ["xj-2000", "part", "v2.3", "xj", "2000", "v2", "3"]
+
+
+def test_scores_match_hand_computed_bm25():
+    index = BM25Index.build(CORPUS, k1=1.2, b=0.75)
+
+    # idf(apple) = ln(1 + (3 - 2 + 0.5) / (2 + 0.5)) = 0.470004
+    # chunk 1: tf 2, length 3: 0.470004 * 2 * 2.2 / (2 + 1.2 * (0.25 + 0.75 * 3 / 3)) = 0.646255
+    # chunk 0: tf 1, length 2: 0.470004 * 1 * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 2 / 3)) = 0.544215
+    ids, scores = index.search("apple")
+    assert ids.tolist() == [1, 0]
+    np.testing.assert_allclose(scores, [0.646255, 0.544215], rtol=1e-5)
+
+    # idf(date) = ln(1 + 2.5 / 1.5) = 0.980829; chunk 2 (length 4) adds cherry tf 2 and date tf 1:
+    # 0.470004 * 2 * 2.2 / (2 + 1.5) + 0.980829 * 2.2 / (1 + 1.5) = 1.453991
+    ids, scores = index.search("cherry date")
+    assert ids.tolist() == [2, 1]
+    np.testing.assert_allclose(scores, [1.453991, 0.470004], rtol=1e-5)
+
+
+def test_search_ignores_unknown_terms_and_limits_top_k():
+    index = BM25Index.build(CORPUS)
+    assert index.search("zebra")[0].tolist() == []
+    assert index.search("apple banana cherry", top_k=1)[0].tolist() == [1]
+
+
+def test_round_trip_through_embedding_store(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.save("pdf", CORPUS, np.eye(3, dtype=np.float32))
+    index = BM25Index.build(CORPUS, k1=1.5, b=0.5)
+    store.save_lexical("pdf", index)
+
+    loaded = store.load_lexical("pdf")
+
+    assert (loaded.k1, loaded.b) == (1.5, 0.5)
+    np.testing.assert_array_equal(loaded.vocabulary, index.vocabulary)
+    for query in ("apple", "cherry date", "banana"):
+        for expected, actual in zip(index.search(query), loaded.search(query)):
+            np.testing.assert_array_equal(actual, expected)
+
+
+def test_reciprocal_rank_fusion_sums_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([np.array([0, 1, 2]), np.array([1, 2])], k=60)
+    # 1: 1/62 + 1/61, 2: 1/63 + 1/62, 0: 1/61
+    assert [doc_id for doc_id, _ in fused] == [1, 2, 0]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[2][1] == pytest.approx(1 / 61)
+
+
+def test_rank_hybrid_fuses_disagreeing_rankings(monkeypatch):
+    monkeypatch.setattr(settings, "RRF_K", 60)
+    monkeypatch.setattr(settings, "HYBRID_CANDIDATES", 50)
+    texts = ["solar panels", "zebra crossing rules", "wind turbines", "zebra zebra"]
+    # Dense ranking 0, 1, 2, 3; lexical ranking 3, 1
+    cosines = np.array([0.9, 0.8, 0.1, 0.0], dtype=np.float32)
+    chunk_embeddings = np.stack([cosines, np.sqrt(1 - cosines ** 2)], axis=1)
+    query_embedding = np.array([1.0, 0.0], dtype=np.float32)
+
+    ranked = PDFProcessor.rank_hybrid(
+        "zebra", query_embedding, chunk_embeddings, BM25Index.build(texts), top_k=3
+    )
+
+    # 1: 1/62 + 1/62, 3: 1/64 + 1/61, 0: 1/61
+    assert [chunk for chunk, _ in ranked] == [1, 3, 0]
+    # Scores stay the exact cosine, whichever ranking found the chunk
+    np.testing.assert_allclose([score for _, score in ranked], cosines[[1, 3, 0]], atol=1e-6)
@@ -0,0 +1,149 @@
+import re
+
+import numpy as np
+import pytest
+
+from app.utils.chunking import Chunker
+
+# Every word is tagged "<topic letter><page>x<position>", so a chunk tells which
+# words, pages and topics it came from
+_WORD = re.compile(r"([A-Z])(\d+)x(\d+)")
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def _pages(sentence_lengths, topics="A", pages=3, seed=0):
+    """(page_number, text) pairs of sentences with the given word counts,
+    split into paragraphs of three sentences"""
+    rng = np.random.default_rng(seed)
+    sentences = []
+    position = 0
+    for n, length in enumerate(sentence_lengths):
+        page = 1 + n * pages // len(sentence_lengths)
+        topic = topics[n * len(topics) // len(sentence_lengths)]
+        words = [f"{topic}{page}x{position + i}" for i in range(length)]
+        position += length
+        sentences.append((page, " ".join(words) + rng.choice([".", "!", "?"])))
+    result = []
+    for page in range(1, pages + 1):
+        on_page = [text for sentence_page, text in sentences if sentence_page == page]
+        paragraphs = [" ".join(on_page[i:i + 3]) for i in range(0, len(on_page), 3)]
+        result.append((page, "\n\n".join(paragraphs)))
+    return result
+
+
+def _words(chunk):
+    return [(int(page), int(position)) for _, page, position in _WORD.findall(chunk.text)]
+
+
+def _check_limits_and_pages(chunks, max_tokens):
+    for chunk in chunks:
+        words = _words(chunk)
+        assert chunk.token_count == len(chunk.text.split()) == len(words)
+        assert chunk.token_count <= max_tokens
+        assert (chunk.page_start, chunk.page_end) == (words[0][0], words[-1][0])
+    assert any(chunk.page_start != chunk.page_end for chunk in chunks)
+
+
+def _overlaps(chunks):
+    """Words each chunk repeats from the end of the previous one"""
+    overlaps = []
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_words, words = _words(previous), _words(chunk)
+        shared = next(
+            (n for n in range(min(len(previous_words), len(words)), 0, -1) if previous_words[-n:] == words[:n]),
+            0
+        )
+        overlaps.append(shared)
+    return overlaps
+
+
+def _covered_in_order(chunks, overlaps):
+    covered = _words(chunks[0])
+    for chunk, shared in zip(chunks[1:], overlaps):
+        covered += _words(chunk)[shared:]
+    return [position for _, position in covered]
+
+
+SENTENCE_LENGTHS = list(np.random.default_rng(1).integers(2, 10, size=40))
+
+
+def test_fixed_windows_fit_the_limit_and_overlap():
+    chunker = Chunker(count_words, strategy="fixed", max_tokens=12, overlap_tokens=4)
+    pages = _pages(SENTENCE_LENGTHS)
+
+    chunks = chunker.chunk(pages)
+
+    _check_limits_and_pages(chunks, 12)
+    assert all(chunk.token_count == 12 for chunk in chunks[:-1])
+    overlaps = _overlaps(chunks)
+    assert overlaps == [4] * len(overlaps)
+    assert _covered_in_order(chunks, overlaps) == list(range(sum(SENTENCE_LENGTHS)))
+
+
+def test_recursive_chunks_fit_the_limit_and_carry_whole_sentences_over():
+    chunker = Chunker(count_words, strategy="recursive", max_tokens=20, overlap_tokens=6)
+    pages = _pages(SENTENCE_LENGTHS)
+    sentences = [
+        [(page, int(position)) for _, _, position in _WORD.findall(sentence)]
+        for page, text in pages
+        for sentence in re.split(r"(?<=[.!?])\s+", text)
+    ]
+    sentence_ends = {words[-1] for words in sentences}
+
+    chunks = chunker.chunk(pages)
+
+    _check_limits_and_pages(chunks, 20)
+    overlaps = _overlaps(chunks)
+    assert all(shared <= 6 for shared in overlaps)
+    assert any(shared > 0 for shared in overlaps)
+    assert _covered_in_order(chunks, overlaps) == list(range(sum(SENTENCE_LENGTHS)))
+    # Chunks only break between sentences
+    assert all(_words(chunk)[-1] in sentence_ends for chunk in chunks)
+    # Paragraph breaks survive inside chunks
+    assert any("\n\n" in chunk.text for chunk in chunks)
+
+
+def test_recursive_splits_a_sentence_longer_than_the_limit():
+    chunker = Chunker(count_words, strategy="recursive", max_tokens=10, overlap_tokens=3)
+
+    chunks = chunker.chunk(_pages([4, 25, 4], pages=1))
+
+    for chunk in chunks:
+        assert chunk.token_count == len(_words(chunk)) <= 10
+        assert (chunk.page_start, chunk.page_end) == (1, 1)
+    assert _covered_in_order(chunks, _overlaps(chunks)) == list(range(33))
+
+
+def _topic_embed(texts):
+    """One axis per topic letter, so neighbours on the same topic have similarity 1"""
+    embeddings = np.zeros((len(texts), 26), dtype=np.float32)
+    for row, text in enumerate(texts):
+        embeddings[row, ord(_WORD.search(text).group(1)) - ord("A")] = 1.0
+    return embeddings
+
+
+def test_semantic_chunks_break_at_topic_shifts_and_the_limit():
+    chunker = Chunker(
+        count_words, strategy="semantic", max_tokens=20, overlap_tokens=6,
+        semantic_threshold=0.5, embed=_topic_embed
+    )
+    pages = _pages(SENTENCE_LENGTHS, topics="ABCD")
+
+    chunks = chunker.chunk(pages)
+
+    _check_limits_and_pages(chunks, 20)
+    topics = [{topic for topic, _, _ in _WORD.findall(chunk.text)} for chunk in chunks]
+    assert all(len(chunk_topics) == 1 for chunk_topics in topics)
+    assert {topic for chunk_topics in topics for topic in chunk_topics} == set("ABCD")
+    # Semantic groups are disjoint: no overlap is carried over
+    assert _overlaps(chunks) == [0] * (len(chunks) - 1)
+    assert _covered_in_order(chunks, _overlaps(chunks)) == list(range(sum(SENTENCE_LENGTHS)))
+
+
+@pytest.mark.parametrize("strategy", Chunker.STRATEGIES)
+def test_empty_pages_make_no_chunks(strategy):
+    chunker = Chunker(count_words, strategy=strategy, max_tokens=10, overlap_tokens=2, embed=_topic_embed)
+    assert chunker.chunk([(1, ""), (2, "  \n\n ")]) == []
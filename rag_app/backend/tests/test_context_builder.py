@@ -0,0 +1,94 @@
+import pytest
+
+from app.utils.context_builder import ContextBuilder
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def _source(text, pdf_id="a", chunk_index=None, page=None):
+    return {"text": text, "pdf_id": pdf_id, "chunk_index": chunk_index, "page_start": page, "page_end": page}
+
+
+def _packed_words(context) -> int:
+    return sum(len(passage.text.replace("...", " ").split()) for passage in context.passages)
+
+
+def test_passages_keep_retrieval_order_and_merge_adjacent_chunks():
+    builder = ContextBuilder(count_words, max_tokens=0)
+    sources = [
+        _source("Five alpha. Five beta.", chunk_index=5, page=3),
+        _source("Bee text here.", pdf_id="b", chunk_index=0, page=1),
+        _source("Four alpha. Four beta.", chunk_index=4, page=2),
+    ]
+
+    context = builder.build("alpha", sources)
+
+    assert [passage.text for passage in context.passages] == [
+        "Four alpha. Four beta. Five alpha. Five beta.",
+        "Bee text here.",
+    ]
+    first = context.passages[0]
+    assert (first.page_start, first.page_end, first.rank) == (2, 3, 0)
+
+
+def test_overlap_repeated_by_the_chunker_is_dropped():
+    builder = ContextBuilder(count_words, max_tokens=0)
+    sources = [
+        _source("One two three. Four five six.", chunk_index=0),
+        _source("Four five six. Seven eight.", chunk_index=1),
+    ]
+
+    context = builder.build("query", sources)
+
+    assert [passage.text for passage in context.passages] == ["One two three. Four five six. Seven eight."]
+    assert context.tokens_before == 11
+    assert context.tokens_after == 8
+
+
+def test_sentences_repeated_across_passages_are_kept_once():
+    builder = ContextBuilder(count_words, max_tokens=0)
+    sources = [
+        _source("Shared fact here. First only.", chunk_index=0),
+        _source("Other start. Shared fact here.", pdf_id="b", chunk_index=7),
+    ]
+
+    context = builder.build("fact", sources)
+
+    # The copy in the better ranked passage wins, and no gap is marked for it
+    assert [passage.text for passage in context.passages] == ["Shared fact here. First only.", "Other start."]
+
+
+@pytest.mark.parametrize("max_tokens", [3, 5, 8, 13, 21, 34])
+def test_budget_is_never_exceeded(max_tokens):
+    builder = ContextBuilder(count_words, max_tokens=max_tokens)
+    sources = [
+        _source("Zebras have stripes. Lions hunt at night. Zebras graze in herds.", chunk_index=0),
+        _source("Elephants remember. Giraffes are tall animals indeed.", pdf_id="b", chunk_index=3),
+        _source("The zebra population grows. Rain falls in spring.", pdf_id="c", chunk_index=1),
+    ]
+
+    context = builder.build("zebra stripes", sources)
+
+    assert context.tokens_after <= max_tokens
+    assert context.tokens_after == _packed_words(context)
+    assert context.tokens_before == 26
+
+
+def test_budget_keeps_the_most_relevant_sentences_and_marks_gaps():
+    builder = ContextBuilder(count_words, max_tokens=7)
+    sources = [_source("Zebras have stripes. Lions hunt at night. Zebras graze in herds.", chunk_index=0)]
+
+    context = builder.build("zebras", sources)
+
+    assert [passage.text for passage in context.passages] == ["Zebras have stripes. ... Zebras graze in herds."]
+    assert context.tokens_after == 7
+
+
+def test_a_single_oversized_sentence_is_still_sent():
+    builder = ContextBuilder(count_words, max_tokens=2)
+
+    context = builder.build("anything", [_source("This one sentence is longer than the budget.")])
+
+    assert [passage.text for passage in context.passages] == ["This one sentence is longer than the budget."]
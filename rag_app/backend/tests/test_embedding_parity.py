@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from benchmarks.embedding_parity import DEFAULT_TOLERANCE, synthetic_chunks
+from benchmarks.synthetic import make_queries
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+pytest.importorskip("sentence_transformers")
+
+
+@pytest.fixture(scope="module")
+def backends():
+    from app.utils.onnx_embedder import CONFIG_FILE, MODEL_FILE, OnnxEmbedder
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = settings.ONNX_MODEL_DIR
+    if not all(os.path.exists(os.path.join(model_dir, name)) for name in (CONFIG_FILE, MODEL_FILE)):
+        pytest.skip(f"No exported ONNX model in {model_dir}")
+    try:
+        torch_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device="cpu")
+    except OSError as e:  # not cached and no network
+        pytest.skip(f"{settings.EMBEDDING_MODEL_NAME} is unavailable: {e}")
+    return OnnxEmbedder(model_dir, max_batch_tokens=settings.EMBEDDING_MAX_BATCH_TOKENS), torch_model
+
+
+def test_onnx_embeddings_match_sentence_transformers(backends):
+    texts = synthetic_chunks(64, seed=0) + make_queries(16, seed=0)
+
+    onnx, torch = (
+        np.asarray(model.encode(texts, batch_size=16, normalize_embeddings=True), dtype=np.float32)
+        for model in backends
+    )
+
+    assert onnx.shape == torch.shape
+    cosine = np.sum(onnx * torch, axis=1)
+    assert cosine.min() >= DEFAULT_TOLERANCE, f"lowest cosine {cosine.min():.5f} for {texts[cosine.argmin()]!r}"
@@ -0,0 +1,23 @@
+import asyncio
+
+from app.utils.executors import Executors, run_in_thread
+from app.utils.metrics import collect_timings, timed
+
+
+@timed("test_stage")
+def _timed_work(value: int) -> int:
+    return value * 2
+
+
+def test_run_in_thread_records_timed_stages():
+    async def run():
+        try:
+            with collect_timings() as timings:
+                result = await run_in_thread(_timed_work, 21)
+            return result, timings
+        finally:
+            await Executors.shutdown()
+
+    result, timings = asyncio.run(run())
+    assert result == 42
+    assert [name for name, _ in timings] == ["test_stage"]
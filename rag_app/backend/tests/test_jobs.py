@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.services.jobs import (
+    CANCELLED, FAILED, QUEUED, RUNNING, InMemoryJobStore, IngestionQueue, new_job
+)
+
+
+async def _store_with_job():
+    store = InMemoryJobStore()
+    return store, await store.create(new_job("pdf"))
+
+
+async def _expire_lease(store: InMemoryJobStore, job_id: str):
+    await store.update(job_id, {"lease_until": datetime.utcnow() - timedelta(seconds=1)})
+
+
+def test_claim_runs_a_queued_job_once():
+    async def run():
+        store, job_id = await _store_with_job()
+        job = await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        assert job["status"] == RUNNING
+        assert job["attempts"] == 1
+        assert job["lease_owner"]
+        assert job["lease_until"] > datetime.utcnow()
+        # Leased to the first worker
+        assert await store.claim(job_id, lease_seconds=60, max_attempts=3) is None
+        assert await store.list_resumable() == []
+
+    asyncio.run(run())
+
+
+def test_claim_fails_a_job_out_of_attempts():
+    async def run():
+        store, job_id = await _store_with_job()
+        for _ in range(2):
+            assert await store.claim(job_id, lease_seconds=60, max_attempts=2) is not None
+            await _expire_lease(store, job_id)  # the worker died
+
+        assert await store.claim(job_id, lease_seconds=60, max_attempts=2) is None
+        job = await store.get(job_id)
+        assert job["status"] == FAILED
+        assert job["attempts"] == 2
+        assert await store.list_resumable() == []
+
+    asyncio.run(run())
+
+
+def test_retry_waits_for_retry_at():
+    async def run():
+        store, job_id = await _store_with_job()
+        await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        await store.update(job_id, {"status": QUEUED, "retry_at": datetime.utcnow() + timedelta(seconds=60)})
+
+        assert await store.list_resumable() == []
+        assert await store.claim(job_id, lease_seconds=60, max_attempts=3) is None
+
+        await store.update(job_id, {"retry_at": datetime.utcnow() - timedelta(seconds=1)})
+        assert [job["id"] for job in await store.list_resumable()] == [job_id]
+        assert (await store.claim(job_id, lease_seconds=60, max_attempts=3))["attempts"] == 2
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_taken_over_and_the_old_owner_locked_out():
+    async def run():
+        store, job_id = await _store_with_job()
+        first = await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        await _expire_lease(store, job_id)
+        assert [job["id"] for job in await store.list_resumable()] == [job_id]
+
+        second = await store.claim(job_id, lease_seconds=60, max_attempts=3)
+
+        assert second["lease_owner"] != first["lease_owner"]
+        assert not await store.update_owned(job_id, first["lease_owner"], {"status": "completed"})
+        assert await store.update_owned(job_id, second["lease_owner"], {"stage": "embed"})
+        job = await store.get(job_id)
+        assert (job["status"], job["stage"]) == (RUNNING, "embed")
+
+    asyncio.run(run())
+
+
+def test_update_owned_refuses_a_cancelled_job():
+    async def run():
+        store, job_id = await _store_with_job()
+        job = await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        await store.update(job_id, {"status": CANCELLED})
+        assert not await store.update_owned(job_id, job["lease_owner"], {"status": "completed"})
+        assert (await store.get(job_id))["status"] == CANCELLED
+
+    asyncio.run(run())
+
+
+def test_heartbeat_stops_a_job_taken_over_by_another_worker(monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_LEASE_SECONDS", 0.03)
+
+    async def run():
+        store, job_id = await _store_with_job()
+        queue = IngestionQueue()
+        queue.store = store
+        first = await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        flag = queue._cancel_flags[job_id] = threading.Event()
+        running = queue._running[job_id] = asyncio.create_task(asyncio.sleep(60))
+        heartbeat = asyncio.create_task(queue._heartbeat(job_id, first["lease_owner"]))
+
+        await asyncio.sleep(0.05)
+        assert not running.done()  # renewed while owned
+        await _expire_lease(store, job_id)
+        await store.claim(job_id, lease_seconds=60, max_attempts=3)
+        await asyncio.wait_for(heartbeat, timeout=1)
+
+        assert flag.is_set()
+        await asyncio.gather(running, return_exceptions=True)
+        assert running.cancelled()
+
+    asyncio.run(run())
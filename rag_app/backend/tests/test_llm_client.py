@@ -0,0 +1,191 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import llm_client
+from app.utils.llm_client import LLMClient, LLMError, LLMProvider, LLMResponse, TokenBucket
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class FakeProvider(LLMProvider):
+    """Plays back a script: each call takes the next outcome, an error to raise
+    or, for streams, the pieces to yield, optionally paired with an error to
+    raise after them"""
+
+    name = "fake"
+
+    def __init__(self, *outcomes, release: asyncio.Event = None):
+        self.outcomes = list(outcomes)
+        self.release = release
+        self.prompts = []
+
+    def _next(self):
+        return self.outcomes.pop(0) if self.outcomes else "done"
+
+    async def generate(self, prompt):
+        self.prompts.append(prompt)
+        outcome = self._next()
+        if self.release is not None:
+            await self.release.wait()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return LLMResponse(f"{outcome}: {prompt}", 1, 1)
+
+    async def stream(self, prompt):
+        self.prompts.append(prompt)
+        outcome = self._next()
+        if isinstance(outcome, tuple):
+            pieces, error = outcome
+        else:
+            pieces, error = (outcome, None) if isinstance(outcome, list) else ([], outcome)
+        for piece in pieces:
+            yield LLMResponse(piece)
+        if isinstance(error, Exception):
+            raise error
+
+
+def _client(provider, **kwargs) -> LLMClient:
+    return LLMClient(provider, **{"timeout": 1.0, "max_retries": 2, "backoff_base": 0.0, **kwargs})
+
+
+def test_identical_concurrent_calls_share_one_backend_call():
+    async def run():
+        release = asyncio.Event()
+        provider = FakeProvider(release=release)
+        client = _client(provider)
+        calls = [asyncio.create_task(client.generate(prompt)) for prompt in ("same", "same", "other")]
+        await asyncio.sleep(0)
+        release.set()
+        responses = await asyncio.gather(*calls)
+
+        assert sorted(provider.prompts) == ["other", "same"]
+        assert [response.text for response in responses] == ["done: same", "done: same", "done: other"]
+        # Finished calls are not shared with later ones
+        await client.generate("same")
+        assert provider.prompts.count("same") == 2
+
+    asyncio.run(run())
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    async def run():
+        release = asyncio.Event()
+        provider = FakeProvider(release=release)
+        client = _client(provider)
+        first = asyncio.create_task(client.generate("prompt"))
+        second = asyncio.create_task(client.generate("prompt"))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert (await second).text == "done: prompt"
+        assert len(provider.prompts) == 1
+
+    asyncio.run(run())
+
+
+def test_retryable_errors_are_retried_up_to_the_cap():
+    async def run():
+        provider = FakeProvider(ProviderError(503), ProviderError(502))
+        assert (await _client(provider).generate("p")).text == "done: p"
+        assert len(provider.prompts) == 3
+
+        provider = FakeProvider(*[ProviderError(503)] * 5)
+        with pytest.raises(LLMError, match="after 3 attempt"):
+            await _client(provider).generate("p")
+        assert len(provider.prompts) == 3
+
+    asyncio.run(run())
+
+
+def test_other_errors_are_not_retried():
+    async def run():
+        provider = FakeProvider(ProviderError(400))
+        with pytest.raises(LLMError):
+            await _client(provider).generate("p")
+        assert len(provider.prompts) == 1
+
+    asyncio.run(run())
+
+
+def test_rate_limit_pauses_the_bucket_for_retry_after():
+    async def run():
+        provider = FakeProvider(ProviderError(429, retry_after=0.2))
+        client = _client(provider, requests_per_minute=600)
+        pauses = []
+        pause = client.bucket.pause
+        client.bucket.pause = lambda seconds: pauses.append(seconds) or pause(seconds)
+
+        started = time.monotonic()
+        await client.generate("p")
+
+        assert pauses == [0.2]
+        assert time.monotonic() - started >= 0.2
+        assert len(provider.prompts) == 2
+
+    asyncio.run(run())
+
+
+def test_backoff_is_full_jitter_capped_exponential(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    client = LLMClient(FakeProvider(), backoff_base=0.5, backoff_max=2.0)
+
+    assert [client._backoff(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 2.0, 2.0]
+    assert all(low == 0 for low, _ in bounds)
+
+
+def test_token_bucket_spaces_requests_after_a_burst():
+    async def run():
+        bucket = TokenBucket(rate=20.0, capacity=2)
+        started = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(2):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.02
+    assert total >= 0.09  # two more tokens at 20 per second
+
+
+async def _collect(client, prompt):
+    pieces = []
+    try:
+        async for piece in client.stream(prompt):
+            pieces.append(piece)
+    except LLMError as e:
+        return pieces, e
+    return pieces, None
+
+
+def test_stream_failing_before_the_first_piece_is_retried():
+    async def run():
+        provider = FakeProvider(ProviderError(503), ["Hello", " world"])
+        pieces, error = await _collect(_client(provider), "p")
+        assert (pieces, error) == (["Hello", " world"], None)
+        assert len(provider.prompts) == 2
+
+    asyncio.run(run())
+
+
+def test_stream_failing_after_pieces_is_not_replayed():
+    async def run():
+        provider = FakeProvider((["Hello", " wor"], ProviderError(503)), ["Hello", " world"])
+        pieces, error = await _collect(_client(provider), "p")
+
+        assert pieces == ["Hello", " wor"]  # no repeated "Hello" from a second attempt
+        assert isinstance(error, LLMError)
+        assert len(provider.prompts) == 1
+
+    asyncio.run(run())
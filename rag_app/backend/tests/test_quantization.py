@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from app.utils.embedding_store import EmbeddingStore
+from app.utils.quantization import QuantizedVectors, get_codec, top_k_rows
+
+DIM = 64
+TOP_K = 10
+
+
+def _normalized(rows: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(rows, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def embeddings() -> np.ndarray:
+    return _normalized(2000, seed=0)
+
+
+@pytest.fixture(scope="module")
+def queries() -> np.ndarray:
+    return _normalized(20, seed=1)
+
+
+def _quantized(codec_name: str, embeddings: np.ndarray, rescore_candidates: int) -> QuantizedVectors:
+    codec = get_codec(codec_name)
+    codes, params = codec.encode(embeddings)
+    return QuantizedVectors(codec, codes, params, embeddings, rescore_candidates)
+
+
+@pytest.mark.parametrize("codec_name", ["float16", "int8"])
+def test_rescored_top_k_matches_float32(codec_name, embeddings, queries):
+    vectors = _quantized(codec_name, embeddings, rescore_candidates=100)
+    for query in queries:
+        rows, scores = vectors.search(query, TOP_K)
+        exact = embeddings @ query
+        assert rows.tolist() == top_k_rows(exact, TOP_K).tolist()
+        np.testing.assert_allclose(scores, exact[rows], rtol=1e-6)
+
+
+def test_binary_with_rescoring_recovers_exact_top_1():
+    # Sign bits need realistic conditions: model-sized vectors and a query close
+    # to one chunk, as when the answer is in the document
+    rng = np.random.default_rng(2)
+    embeddings = rng.normal(size=(2000, 384)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    targets = rng.choice(len(embeddings), size=20, replace=False)
+    queries = embeddings[targets] + 0.05 * rng.normal(size=(20, 384)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    vectors = _quantized("binary", embeddings, rescore_candidates=200)
+    for query in queries:
+        rows, _ = vectors.search(query, 1)
+        assert rows[0] == int(np.argmax(embeddings @ query))
+
+
+def test_search_batched_coarse_scores_match_single(embeddings, queries):
+    vectors = _quantized("int8", embeddings, rescore_candidates=100)
+    coarse = vectors.coarse_scores(queries)
+    for query, row in zip(queries, coarse):
+        assert vectors.search(query, TOP_K, coarse=row)[0].tolist() == vectors.search(query, TOP_K)[0].tolist()
+
+
+@pytest.mark.parametrize("codec_name", ["float16", "int8", "binary"])
+def test_codes_round_trip_through_embedding_store(codec_name, embeddings, tmp_path):
+    store = EmbeddingStore(str(tmp_path), quantization=codec_name, rescore_candidates=50)
+    store.save("pdf", [f"chunk {i}" for i in range(len(embeddings))], embeddings)
+
+    loaded = store.load_vectors("pdf")
+
+    assert isinstance(loaded, QuantizedVectors)
+    assert loaded.codec.name == codec_name
+    expected_codes, expected_params = get_codec(codec_name).encode(embeddings)
+    np.testing.assert_array_equal(np.asarray(loaded.codes), expected_codes)
+    for name, value in expected_params.items():
+        np.testing.assert_array_equal(loaded.params[name], value)
+    np.testing.assert_array_equal(loaded[np.arange(5)], embeddings[:5])
+
+
+def test_codes_are_rewritten_after_a_codec_change(embeddings, tmp_path):
+    EmbeddingStore(str(tmp_path), quantization="int8").save("pdf", [""] * len(embeddings), embeddings)
+
+    loaded = EmbeddingStore(str(tmp_path), quantization="binary").load_vectors("pdf")
+
+    assert loaded.codec.name == "binary"
+    np.testing.assert_array_equal(np.asarray(loaded.codes), get_codec("binary").encode(embeddings)[0])
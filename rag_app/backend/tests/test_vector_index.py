@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.vector_index import IVFIndex, VectorIndex, create_index
+
+DIM = 32
+
+
+def _clustered(rows: int, seed: int, centers: int = 16) -> np.ndarray:
+    """Normalized vectors around a few centers, like embeddings of related chunks"""
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(centers, DIM))
+    vectors = means[rng.integers(centers, size=rows)] + 0.3 * rng.normal(size=(rows, DIM))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _filled(index: VectorIndex, pdfs: int = 6, rows_per_pdf: int = 400) -> VectorIndex:
+    vectors = _clustered(pdfs * rows_per_pdf, seed=0)
+    for n in range(pdfs):
+        index.add(f"pdf-{n}", vectors[n * rows_per_pdf:(n + 1) * rows_per_pdf])
+    return index
+
+
+def _new_index(kind: str) -> VectorIndex:
+    # Small enough for the IVF index to train on _filled()
+    return create_index(kind, **({"n_probe": 4, "min_train_size": 1000} if kind == "ivf" else {}))
+
+
+@pytest.fixture
+def queries() -> np.ndarray:
+    return _clustered(25, seed=1)
+
+
+def _keys(hits):
+    return [(pdf_id, chunk) for pdf_id, chunk, _ in hits]
+
+
+def test_ivf_search_matches_flat_search(queries):
+    flat = _filled(VectorIndex())
+    ivf = _filled(IVFIndex(n_probe=4, min_train_size=1000))
+    assert ivf.is_trained
+
+    recall = np.mean([
+        len(set(_keys(ivf.search(query, top_k=10))) & set(_keys(flat.search(query, top_k=10)))) / 10
+        for query in queries
+    ])
+    assert recall >= 0.9
+
+    # Probing every list is an exact search
+    ivf.n_probe = len(ivf._centroids)
+    for query in queries:
+        assert _keys(ivf.search(query, top_k=10)) == _keys(flat.search(query, top_k=10))
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_deleted_and_replaced_rows_are_never_returned(kind):
+    index = _filled(_new_index(kind))
+    deleted = index._gather(np.arange(400, 800))  # rows of pdf-1
+
+    assert index.delete("pdf-1") == 400
+    assert "pdf-1" not in index
+    replacement = _clustered(10, seed=2)
+    index.add("pdf-2", replacement)
+
+    for query in deleted[:20]:
+        hits = index.search(query, top_k=50)
+        assert all(pdf_id != "pdf-1" for pdf_id, _, _ in hits)
+        assert all(chunk < 10 for pdf_id, chunk, _ in hits if pdf_id == "pdf-2")
+    assert index.search(deleted[0], top_k=5, pdf_ids=["pdf-1"]) == []
+    assert _keys(index.search(replacement[3], top_k=1, pdf_ids=["pdf-2"])) == [("pdf-2", 3)]
+    assert len(index) == 4 * 400 + 10
+
+
+def test_ivf_retrains_after_growing():
+    index = IVFIndex(n_probe=4, min_train_size=500, retrain_factor=2.0)
+    vectors = _clustered(2000, seed=3)
+    index.add("a", vectors[:600])
+    assert index._trained_size == 600
+
+    index.add("b", vectors[600:1000])
+    assert index._trained_size == 600  # below retrain_factor times the trained size
+    index.add("c", vectors[1000:])
+    assert index._trained_size == 2000
+    assert (index._assignments >= 0).all()
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_save_and_load_keep_search_results(kind, queries, tmp_path):
+    index = _filled(_new_index(kind))
+    index.delete("pdf-3")  # tombstones are compacted away on save
+    path = str(tmp_path / "index")
+    index.save(path)
+
+    loaded = VectorIndex.load(path, mmap=True)
+
+    assert type(loaded) is type(index)
+    assert isinstance(loaded._segments[0], np.memmap)
+    assert sorted(loaded.pdf_ids()) == sorted(index.pdf_ids())
+    for query in queries:
+        expected, actual = index.search(query, top_k=10), loaded.search(query, top_k=10)
+        assert _keys(actual) == _keys(expected)
+        np.testing.assert_allclose([s for _, _, s in actual], [s for _, _, s in expected], rtol=1e-6)
+
+    # New rows are added next to the memory-mapped ones
+    loaded.add("pdf-new", queries[:2])
+    assert _keys(loaded.search(queries[1], top_k=1)) == [("pdf-new", 1)]
+
+
+def test_save_swaps_a_symlink_and_removes_the_previous_copy(queries, tmp_path):
+    path = str(tmp_path / "index")
+    index = _filled(VectorIndex(), pdfs=2, rows_per_pdf=50)
+    index.save(path)
+    first_target = os.path.realpath(path)
+    reader = VectorIndex.load(path, mmap=True)
+
+    index.delete("pdf-0")
+    index.save(path)
+
+    assert os.path.islink(path)
+    assert os.path.realpath(path) != first_target
+    assert not os.path.exists(first_target)
+    assert sorted(os.listdir(tmp_path)) == ["index", os.path.basename(os.path.realpath(path))]
+    assert VectorIndex.load(path).pdf_ids() == ["pdf-1"]
+    # A reader that mapped the previous copy keeps working
+    assert len(reader.search(queries[0], top_k=5)) == 5
+
+
+def test_save_replaces_an_index_saved_as_a_plain_directory(tmp_path):
+    path = tmp_path / "index"
+    path.mkdir()
+    (path / "index.json").write_text("{}")
+
+    _filled(VectorIndex(), pdfs=1, rows_per_pdf=10).save(str(path))
+
+    assert os.path.islink(path)
+    assert VectorIndex.load(str(path)).pdf_ids() == ["pdf-0"]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import vector_search
+from app.services.vector_search import VectorSearch
+from app.utils.embedding_store import EmbeddingStore
+
+
+def _normalized(rows: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(rows, 16)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path / "embeddings"))
+    monkeypatch.setattr(vector_search, "embedding_store", store)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TYPE", "flat")
+    VectorSearch.index = None
+    VectorSearch.load()
+    yield store
+    VectorSearch.index = None
+    VectorSearch._texts.clear()
+
+
+def _save(store: EmbeddingStore, pdf_id: str, vectors: np.ndarray, label: str):
+    store.save(pdf_id, [f"{label} {i}" for i in range(len(vectors))], vectors, [(i + 1, i + 1) for i in range(len(vectors))])
+
+
+def test_search_picks_up_entries_written_by_other_workers(store):
+    a = _normalized(3, seed=0)
+    _save(store, "a", a, "a")
+    VectorSearch.add("a", a)
+    b = _normalized(2, seed=1)
+    _save(store, "b", b, "b")  # written by another worker: no VectorSearch.add here
+
+    assert VectorSearch.search(b[1], top_k=1)[0]["text"] == "b 1"
+
+    replacement = _normalized(4, seed=2)
+    _save(store, "a", replacement, "new a")
+    store.delete("b")
+
+    hits = VectorSearch.search(replacement[3], top_k=10)
+    assert {hit["pdf_id"] for hit in hits} == {"a"}
+    assert hits[0]["text"] == "new a 3"
+    assert hits[0]["page_start"] == 4
+
+
+def test_search_reads_chunk_texts_once_per_entry_version(store, monkeypatch):
+    vectors = _normalized(5, seed=3)
+    _save(store, "a", vectors, "a")
+    VectorSearch.add("a", vectors)
+    reads = []
+    load_chunks = store.load_chunks
+    monkeypatch.setattr(store, "load_chunks", lambda pdf_id: reads.append(pdf_id) or load_chunks(pdf_id))
+
+    for query in vectors:
+        VectorSearch.search(query, top_k=2)
+    assert reads == ["a"]
+
+    _save(store, "a", vectors, "replaced")
+    assert VectorSearch.search(vectors[0], top_k=1)[0]["text"] == "replaced 0"
+    assert reads == ["a", "a"]
+
+
+def test_restart_reloads_only_entries_changed_since_the_save(store, monkeypatch):
+    for n, pdf_id in enumerate(["a", "b"]):
+        vectors = _normalized(3, seed=n)
+        _save(store, pdf_id, vectors, pdf_id)
+        VectorSearch.add(pdf_id, vectors)
+    VectorSearch.save()
+    replacement = _normalized(3, seed=5)
+    _save(store, "b", replacement, "new b")  # while this worker was down
+
+    loads = []
+    load = store.load
+    monkeypatch.setattr(store, "load", lambda pdf_id: loads.append(pdf_id) or load(pdf_id))
+    VectorSearch.index = None
+    VectorSearch.load()
+
+    assert loads == ["b"]
+    assert VectorSearch.search(replacement[0], top_k=1)[0]["text"] == "new b 0"